@@ -0,0 +1,318 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from schedule_file import ScheduleFile, read_schedule, write_schedule
+from scheduler_api import (DAYS, COHORT_CONFLICT_MODES, ROOM_ASSIGNMENT_MODES, Classroom, Course, Instructor, Schedule,
+                           SlotObjective)
+
+# Fixed-seed scenarios, from a single department up to a large university
+SCENARIOS = {
+    "tiny": {"sections": 100, "seed": 1},
+    "small": {"sections": 500, "seed": 2},
+    "medium": {"sections": 2000, "seed": 3},
+    "large": {"sections": 5000, "seed": 4},
+    "university": {"sections": 20000, "seed": 5},
+}
+DEFAULT_SCENARIOS = ("tiny", "small", "medium")
+OBJECTIVES = {"default": SlotObjective.DEFAULT_WEIGHTS, "balanced": SlotObjective.BALANCED_WEIGHTS}
+ENGINES = ("greedy", "partitioned", "backtracking")
+
+MAJORS = ["CS", "IT", "BA", "IR", "ECON", "MATH", "ARCH", "DS"]
+COURSE_NAMES = [
+    "Introduction to {}", "Principles of {}", "Advanced {}", "{} Seminar", "{} Workshop",
+    "Computer Applications in {}", "Research Methods in {}", "Topics in {}"
+]
+
+# Timing metrics compared relatively; quality metrics must not get worse at all
+TIME_METRICS = ("generate_seconds", "validity_seconds", "validator_rebuild_seconds", "export_seconds",
+                "export_compact_seconds", "file_write_seconds", "file_open_seconds", "file_load_seconds",
+                "analysis_seconds")
+MEMORY_METRICS = ("peak_memory_bytes",)
+QUALITY_METRICS = ("unscheduled_hours", "total_penalty", "error_count", "cohort_clash_hours")
+
+
+def generate_problem(sections, rooms=None, instructors=None, part_time_ratio=0.67, preference_density=0.5,
+                     unavailability_density=0.3, online_share=0.2, lab_share=0.15, room_assignment="fixed",
+                     cohort_conflicts="weighted", objective="default", seed=0):
+    """Build an unscheduled Schedule for a synthetic university.
+
+    sections         - number of course sections
+    rooms            - classrooms (default: one per 10 sections)
+    instructors      - instructors (default: one per 3 sections)
+    part_time_ratio  - share of part-time instructors
+    preference_density     - expected preferred slots per part-time instructor, per weekday
+    unavailability_density - expected unavailable slots per instructor, per weekday
+    online_share     - share of online sections
+    lab_share        - share of sections that need a computer lab
+    room_assignment  - Schedule room assignment mode ("fixed" or "flexible")
+    cohort_conflicts - Schedule cohort conflict mode ("off", "weighted" or "hard")
+    objective        - slot objective weights (a name from OBJECTIVES)
+    The same arguments always give the same problem.
+    """
+    rng = random.Random(seed)
+    rooms = rooms or max(3, sections // 10)
+    instructors = instructors or max(3, sections // 3)
+    schedule = Schedule(room_assignment=room_assignment, cohort_conflicts=cohort_conflicts,
+                        objective=SlotObjective(OBJECTIVES[objective]))
+
+    labs = max(1, round(rooms * lab_share))
+    for room_id in range(1, rooms + 1):
+        room_type = "computer_lab" if room_id <= labs else "lecture"
+        capacity = rng.choice([30, 40, 40, 60, 80]) if room_type == "lecture" else rng.choice([25, 30, 40])
+        schedule.add_classroom(Classroom(room_id, f"Room {room_id}", capacity, room_type))
+    lecture_rooms = [room for room in schedule.classrooms if room.room_type == "lecture"] or schedule.classrooms
+    lab_rooms = [room for room in schedule.classrooms if room.room_type == "computer_lab"]
+
+    for instructor_id in range(1, instructors + 1):
+        instructor = Instructor(instructor_id, f"Instructor {instructor_id}", rng.random() < part_time_ratio)
+        instructor.unavailable_slots = _random_slots(rng, unavailability_density * 5, 1, 3)
+        if instructor.is_part_time:
+            instructor.preferred_slots = _random_slots(rng, preference_density * 5, 2, 5)
+        schedule.add_instructor(instructor)
+
+    for course_id in range(1, sections + 1):
+        major = rng.choice(MAJORS)
+        needs_lab = rng.random() < lab_share
+        if needs_lab:
+            name = f"Computer Lab {course_id}"
+            classroom = rng.choice(lab_rooms)
+        else:
+            name = rng.choice(COURSE_NAMES).format(major).replace("Computer", "Applied") + f" {course_id}"
+            classroom = rng.choice(lecture_rooms)
+        schedule.add_course(Course(
+            course_id, name, rng.choice("ABCD"), major,
+            rng.randint(1, instructors), classroom.id,
+            rng.choice([2, 3, 3, 3, 4, 6]),
+            rng.randint(10, classroom.capacity),
+            rng.random() < online_share
+        ))
+    return schedule
+
+
+def _random_slots(rng, expected, min_hours, max_hours):
+    """About `expected` random (day, start_hour, end_hour) slots"""
+    slots = []
+    count = int(expected) + (rng.random() < expected - int(expected))
+    for _ in range(count):
+        start_hour = rng.randint(8, 20)
+        slots.append((rng.choice(DAYS), start_hour, min(22, start_hour + rng.randint(min_hours, max_hours))))
+    return slots
+
+
+def _timed(function, repeat):
+    """Run function repeat times and return (best seconds, last result)"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_scenario(params, repeat=1, measure_memory=True):
+    """Generate, validate and export one scenario and return its metrics"""
+    seed = params.get("seed", 0)
+    engine = params.get("engine", "greedy")
+    workers = params.get("workers")
+    generator_args = {key: value for key, value in params.items() if key not in ("seed", "engine", "workers")}
+    partitioned = None
+
+    def solve():
+        nonlocal partitioned
+        schedule = generate_problem(seed=seed, **generator_args)
+        started = time.perf_counter()
+        if engine == "partitioned":
+            partitioned = schedule.solve_partitioned(n_workers=workers, verbose=False)
+        else:
+            schedule.generate_schedule(verbose=False, engine=engine)
+        return time.perf_counter() - started, schedule
+
+    generate_seconds = None
+    for _ in range(repeat):
+        gc.collect()
+        elapsed, schedule = solve()
+        generate_seconds = elapsed if generate_seconds is None else min(generate_seconds, elapsed)
+
+    metrics = {"generate_seconds": generate_seconds}
+    metrics["validity_seconds"], is_valid = _timed(schedule.check_schedule_validity, repeat)
+    metrics["validator_rebuild_seconds"], _ = _timed(schedule.validator.rebuild, repeat)
+    metrics["export_seconds"], exported = _timed(schedule.export_schedule_json, repeat)
+    metrics["export_compact_seconds"], compact = _timed(
+        lambda: b"".join(schedule.iter_schedule_json("compact")), repeat
+    )
+    metrics["analysis_seconds"], analysis = _timed(schedule.analyze_feasibility, repeat)
+    metrics["export_bytes"] = len(exported)
+    metrics["export_compact_bytes"] = len(compact)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "schedule.bin")
+        metrics["file_write_seconds"], _ = _timed(lambda: write_schedule(schedule, path), repeat)
+        metrics["file_bytes"] = os.path.getsize(path)
+        metrics["file_open_seconds"], _ = _timed(lambda: ScheduleFile(path).close(), repeat)
+        metrics["file_load_seconds"], _ = _timed(lambda: read_schedule(path), repeat)
+
+    metrics["sessions"] = sum(len(course.assigned_slots) for course in schedule.courses)
+    metrics["unscheduled_hours"] = sum(schedule.get_unscheduled_hours(course) for course in schedule.courses)
+    metrics["lower_bound_unscheduled_hours"] = analysis["lower_bound_unscheduled_hours"]
+    metrics["total_penalty"] = schedule.total_penalty()
+    metrics["error_count"] = schedule.validator.error_count
+    metrics["cohort_clash_hours"] = schedule.cohort_clash_hours()
+    metrics["is_valid"] = is_valid
+
+    if partitioned is not None:
+        # What splitting costs against one greedy pass over the whole problem
+        whole = generate_problem(seed=seed, **generator_args)
+        whole.generate_schedule(verbose=False)
+        metrics["parts"] = len(partitioned["parts"])
+        metrics["reserved_hours"] = partitioned["reserved_hours"]
+        metrics["removed_sessions"] = partitioned["removed_sessions"]
+        metrics["partition_loss_hours"] = (metrics["unscheduled_hours"]
+                                           - sum(whole.get_unscheduled_hours(course) for course in whole.courses))
+        metrics["partition_penalty_ratio"] = metrics["total_penalty"] / max(1, whole.total_penalty())
+
+    if measure_memory:
+        # A separate traced run, so tracing does not slow down the timed ones
+        del schedule, exported, compact
+        gc.collect()
+        tracemalloc.start()
+        solve()
+        metrics["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return metrics
+
+
+def run_benchmarks(names=DEFAULT_SCENARIOS, repeat=1, measure_memory=True, verbose=True, room_assignment="fixed",
+                   cohort_conflicts="weighted", objective="default", engine="greedy", workers=None):
+    """Run the named scenarios and return the JSON-ready results document"""
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "scenarios": {}
+    }
+    for name in names:
+        params = SCENARIOS[name]
+        # Non-default modes are part of the params, so results are only compared against the same modes
+        if room_assignment != "fixed":
+            params = dict(params, room_assignment=room_assignment)
+        if cohort_conflicts != "weighted":
+            params = dict(params, cohort_conflicts=cohort_conflicts)
+        if objective != "default":
+            params = dict(params, objective=objective)
+        if engine != "greedy":
+            params = dict(params, engine=engine)
+        if engine == "partitioned" and workers is not None:
+            params = dict(params, workers=workers)
+        if verbose:
+            print(f"Running {name} ({params['sections']} sections)...", flush=True)
+        metrics = run_scenario(params, repeat=repeat, measure_memory=measure_memory)
+        results["scenarios"][name] = {"params": params, "metrics": metrics}
+        if verbose:
+            print(f"  generate {metrics['generate_seconds']:.3f}s, "
+                  f"export {metrics['export_seconds']:.3f}s, "
+                  f"unscheduled hours {metrics['unscheduled_hours']} "
+                  f"(at least {metrics['lower_bound_unscheduled_hours']}), "
+                  f"total penalty {metrics['total_penalty']}")
+            if "partition_loss_hours" in metrics:
+                print(f"  {metrics['parts']} parts, {metrics['partition_loss_hours']:+d} unscheduled hours and "
+                      f"{metrics['partition_penalty_ratio']:.2f}x the penalty of one greedy pass")
+    return results
+
+
+def compare_results(current, baseline, time_tolerance=0.2, min_seconds=0.005, memory_tolerance=0.1):
+    """List regressions of current against baseline results.
+
+    A time metric regresses if it is more than time_tolerance slower and
+    more than min_seconds slower. Peak memory is allowed to grow by
+    memory_tolerance. Quality metrics come from fixed seeds, so any increase
+    is a regression. Scenarios missing from either side are skipped.
+    """
+    regressions = []
+    for name, scenario in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None or base["params"] != scenario["params"]:
+            continue
+        new_metrics = scenario["metrics"]
+        old_metrics = base["metrics"]
+
+        def check(metric, limit):
+            if metric in new_metrics and metric in old_metrics and new_metrics[metric] > limit:
+                regressions.append({
+                    "scenario": name, "metric": metric,
+                    "baseline": old_metrics[metric], "current": new_metrics[metric]
+                })
+
+        for metric in TIME_METRICS:
+            if metric in old_metrics:
+                check(metric, max(old_metrics[metric] * (1 + time_tolerance), old_metrics[metric] + min_seconds))
+        for metric in MEMORY_METRICS:
+            if metric in old_metrics:
+                check(metric, old_metrics[metric] * (1 + memory_tolerance))
+        for metric in QUALITY_METRICS:
+            if metric in old_metrics:
+                check(metric, old_metrics[metric])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the course scheduler on synthetic problems")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"comma separated scenario names or 'all' (available: {', '.join(SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per scenario; the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak memory run")
+    parser.add_argument("--output", help="write the results JSON to this file")
+    parser.add_argument("--baseline", help="compare against a results JSON written earlier")
+    parser.add_argument("--time-tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--room-assignment", choices=ROOM_ASSIGNMENT_MODES, default="fixed",
+                        help="run every scenario with this room assignment mode")
+    parser.add_argument("--cohort-conflicts", choices=COHORT_CONFLICT_MODES, default="weighted",
+                        help="run every scenario with this cohort conflict mode")
+    parser.add_argument("--objective", choices=OBJECTIVES, default="default",
+                        help="run every scenario with these slot objective weights")
+    parser.add_argument("--engine", choices=ENGINES, default="greedy",
+                        help="scheduling engine passed to generate_schedule")
+    parser.add_argument("--workers", type=int,
+                        help="processes for the partitioned engine (default: one per CPU, one part on one CPU)")
+    args = parser.parse_args(argv)
+
+    names = list(SCENARIOS) if args.scenarios == "all" else args.scenarios.split(",")
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    results = run_benchmarks(names, repeat=args.repeat, measure_memory=not args.no_memory,
+                             room_assignment=args.room_assignment, cohort_conflicts=args.cohort_conflicts,
+                             objective=args.objective, engine=args.engine, workers=args.workers)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, time_tolerance=args.time_tolerance)
+        for regression in regressions:
+            print(f"Regression in {regression['scenario']}: {regression['metric']} "
+                  f"{regression['baseline']} -> {regression['current']}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
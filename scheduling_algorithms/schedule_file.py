@@ -0,0 +1,341 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from scheduler_api import DAYS, HOURS, Classroom, Course, Instructor, InstructorMasks, Schedule, SlotObjective
+
+# Layout (little-endian):
+#   header     magic, format version, column count
+#   directory  one entry per column: name, array typecode, byte offset, item count
+#   columns    raw array data, each starting on an 8-byte boundary
+# Strings (names, majors, sections, departments, room types, modes, objective
+# terms) are interned into one table and stored as indexes into it; NO_STRING
+# stands for None. Columns added later (course.department, objective.*) may be
+# missing from older files and are then read as None / the default weights.
+FORMAT_MAGIC = b"OPTSCHED"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sII")
+DIRECTORY_ENTRY = struct.Struct("<32s8sQQ")
+NO_STRING = 0xFFFFFFFF
+# Session lengths whose compiled start masks are stored per instructor
+STORED_SESSION_LENGTHS = (1, 2, 3, 4)
+
+
+class _StringTable:
+    def __init__(self):
+        self.index = {}
+        self.offsets = array("I", [0])
+        self.data = bytearray()
+
+    def add(self, value):
+        if value is None:
+            return NO_STRING
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.offsets) - 1
+            self.data += str(value).encode("utf-8")
+            self.offsets.append(len(self.data))
+        return i
+
+
+def _integer(value, what):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{what} must be an integer to be saved in a schedule file, got {value!r}")
+    return value
+
+
+def _columns(schedule):
+    """All columns of the schedule as {name: array}"""
+    strings = _StringTable()
+    columns = {}
+
+    columns["meta"] = array("q", [len(schedule.classrooms), len(schedule.instructors), len(schedule.courses),
+                                  HOURS[0], len(HOURS), len(DAYS)])
+    columns["settings"] = array("I", [strings.add(schedule.room_assignment), strings.add(schedule.cohort_conflicts)])
+    columns["days"] = array("I", [strings.add(day) for day in DAYS])
+    # Terms added with add_term are not saved, as in Schedule.to_problem
+    weights = schedule.objective.weights
+    columns["objective.terms"] = array("I", [strings.add(name) for name in weights])
+    integral = all(isinstance(weight, int) for weight in weights.values())
+    columns["objective.weights"] = array("q" if integral else "d", list(weights.values()))
+
+    rooms = schedule.classrooms
+    columns["room.id"] = array("q", [_integer(room.id, "Classroom id") for room in rooms])
+    columns["room.name"] = array("I", [strings.add(room.name) for room in rooms])
+    columns["room.capacity"] = array("q", [_integer(room.capacity, "Classroom capacity") for room in rooms])
+    columns["room.type"] = array("I", [strings.add(room.room_type) for room in rooms])
+
+    instructors = schedule.instructors
+    columns["instructor.id"] = array("q", [_integer(i.id, "Instructor id") for i in instructors])
+    columns["instructor.name"] = array("I", [strings.add(i.name) for i in instructors])
+    columns["instructor.part_time"] = array("B", [bool(i.is_part_time) for i in instructors])
+    slot_offsets = array("I", [0])
+    slot_kind = array("B")  # 0 unavailable, 1 preferred
+    slot_day = array("I")
+    slot_start = array("q")
+    slot_end = array("q")
+    has_preferences = array("B")
+    unavailable = array("H")
+    preferred_hours = array("H")
+    allowed_starts = array("H")
+    preferred_starts = array("H")
+    for instructor in instructors:
+        for kind, slots in ((0, instructor.unavailable_slots), (1, instructor.preferred_slots)):
+            for day, start_hour, end_hour in slots:
+                slot_kind.append(kind)
+                slot_day.append(strings.add(day))
+                slot_start.append(_integer(start_hour, "Slot start hour"))
+                slot_end.append(_integer(end_hour, "Slot end hour"))
+        slot_offsets.append(len(slot_kind))
+        masks = instructor.masks
+        has_preferences.append(masks.has_preferences)
+        unavailable.extend(masks.unavailable)
+        preferred_hours.extend(masks.preferred_hours)
+        for hours_duration in STORED_SESSION_LENGTHS:
+            allowed_starts.extend(masks.allowed_starts(hours_duration))
+            preferred_starts.extend(masks.preferred_starts(hours_duration))
+    columns.update({
+        "instructor.slot_offsets": slot_offsets, "slot.kind": slot_kind, "slot.day": slot_day,
+        "slot.start": slot_start, "slot.end": slot_end,
+        "instructor.has_preferences": has_preferences, "instructor.unavailable": unavailable,
+        "instructor.preferred_hours": preferred_hours, "instructor.allowed_starts": allowed_starts,
+        "instructor.preferred_starts": preferred_starts
+    })
+
+    courses = schedule.courses
+    columns["course.id"] = array("q", [_integer(c.id, "Course id") for c in courses])
+    columns["course.name"] = array("I", [strings.add(c.name) for c in courses])
+    columns["course.section"] = array("I", [strings.add(c.section) for c in courses])
+    columns["course.major"] = array("I", [strings.add(c.major) for c in courses])
+    columns["course.instructor_id"] = array("q", [_integer(c.instructor_id, "Course instructor_id") for c in courses])
+    columns["course.classroom_id"] = array("q", [_integer(c.classroom_id, "Course classroom_id") for c in courses])
+    columns["course.hours_per_week"] = array("q", [_integer(c.hours_per_week, "Course hours_per_week") for c in courses])
+    columns["course.student_count"] = array("q", [_integer(c.student_count, "Course student_count") for c in courses])
+    columns["course.online"] = array("B", [bool(c.is_online) for c in courses])
+    columns["course.department"] = array("I", [strings.add(c.department) for c in courses])
+
+    assignments = schedule.get_assignments()
+    columns["session.course"] = array("I", [a[0] for a in assignments])
+    columns["session.day"] = array("B", [a[1] for a in assignments])
+    columns["session.start"] = array("B", [a[2] for a in assignments])
+    columns["session.hours"] = array("B", [a[3] for a in assignments])
+    columns["session.room"] = array("I", [a[4] for a in assignments])
+
+    # Occupancy per instructor and room, so readers can answer "is it free" without building a Schedule
+    occupancy = schedule.occupancy
+    columns["occupancy.instructor"] = array("H", [
+        occupancy.instructor_mask(instructor.id, day) for instructor in instructors for day in DAYS
+    ])
+    columns["occupancy.room"] = array("H", [occupancy.room_mask(room.id, day) for room in rooms for day in DAYS])
+
+    columns["strings.offsets"] = strings.offsets
+    columns["strings.data"] = array("B", bytes(strings.data))
+    return columns
+
+
+def write_schedule(schedule, path):
+    """Save the problem and current assignments of a schedule to a binary schedule file.
+
+    The file is written next to path and moved into place, so readers never
+    see a half-written file. Ids, capacities and hours must be integers.
+    """
+    columns = _columns(schedule)
+    offset = HEADER.size + DIRECTORY_ENTRY.size * len(columns)
+    directory = []
+    for name, values in columns.items():
+        if len(name) > 32:
+            raise ValueError(f"Column name {name!r} is too long for the directory")
+        offset += -offset % 8
+        directory.append(DIRECTORY_ENTRY.pack(name.encode("ascii"), values.typecode.encode("ascii"),
+                                              offset, len(values)))
+        offset += len(values) * values.itemsize
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, len(columns)))
+        f.write(b"".join(directory))
+        for values in columns.values():
+            f.write(b"\0" * (-f.tell() % 8))
+            if sys.byteorder != "little":
+                values = array(values.typecode, values)
+                values.byteswap()
+            f.write(values.tobytes())
+    os.replace(temporary_path, path)
+
+
+class ScheduleFile:
+    """A binary schedule file mapped read-only into memory.
+
+    Columns are typed memoryviews straight onto the mapping, so opening a file
+    costs the same for ten sections as for twenty thousand, and processes that
+    open the same file share one copy of it in the page cache. Use
+    to_schedule() to build a full Schedule, or read the columns directly.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        self.columns = {}
+        try:
+            self._read_directory()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_directory(self):
+        if len(self._buffer) < HEADER.size:
+            raise ValueError(f"{self.path} is not a schedule file")
+        magic, version, column_count = HEADER.unpack_from(self._buffer)
+        if magic != FORMAT_MAGIC:
+            raise ValueError(f"{self.path} is not a schedule file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{self.path} uses schedule file format {version}, expected {FORMAT_VERSION}")
+
+        self.columns = {}
+        for i in range(column_count):
+            name, typecode, offset, count = DIRECTORY_ENTRY.unpack_from(self._buffer, HEADER.size + i * DIRECTORY_ENTRY.size)
+            typecode = typecode.rstrip(b"\0").decode("ascii")
+            size = array(typecode).itemsize
+            if offset + count * size > len(self._buffer):
+                raise ValueError(f"{self.path} is truncated")
+            column = self._buffer[offset:offset + count * size]
+            if sys.byteorder == "little":
+                column = column.cast(typecode)
+            else:
+                # Only big-endian hosts pay for a copy
+                column = array(typecode, column.tobytes())
+                column.byteswap()
+            self.columns[name.rstrip(b"\0").decode("ascii")] = column
+
+        self.room_count, self.instructor_count, self.course_count, first_hour, hour_count, day_count = self.columns["meta"]
+        if (first_hour, hour_count) != (HOURS[0], len(HOURS)) or [self.string(i) for i in self.columns["days"]] != DAYS:
+            raise ValueError(f"{self.path} was written for a different week layout")
+        self.session_count = len(self.columns["session.course"])
+
+    def close(self):
+        """Release the mapping; columns taken from the file must not be used afterwards"""
+        if self._mmap is None:
+            return
+        for column in self.columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self.columns = {}
+        self._buffer.release()
+        self._mmap.close()
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def string(self, index):
+        if index == NO_STRING:
+            return None
+        offsets = self.columns["strings.offsets"]
+        return bytes(self.columns["strings.data"][offsets[index]:offsets[index + 1]]).decode("utf-8")
+
+    def instructor_mask(self, instructor_index, day_idx):
+        """Saved occupancy mask of an instructor on a day (bit i is hour HOURS[0] + i)"""
+        return self.columns["occupancy.instructor"][instructor_index * len(DAYS) + day_idx]
+
+    def room_mask(self, room_index, day_idx):
+        """Saved occupancy mask of a room on a day (bit i is hour HOURS[0] + i)"""
+        return self.columns["occupancy.room"][room_index * len(DAYS) + day_idx]
+
+    def course(self, index):
+        """One course as a dict, without building the rest of the schedule"""
+        columns = self.columns
+        return {
+            "id": columns["course.id"][index],
+            "name": self.string(columns["course.name"][index]),
+            "section": self.string(columns["course.section"][index]),
+            "major": self.string(columns["course.major"][index]),
+            "instructor_id": columns["course.instructor_id"][index],
+            "classroom_id": columns["course.classroom_id"][index],
+            "hours_per_week": columns["course.hours_per_week"][index],
+            "student_count": columns["course.student_count"][index],
+            "is_online": bool(columns["course.online"][index]),
+            "department": (self.string(columns["course.department"][index])
+                           if "course.department" in columns else None)
+        }
+
+    def to_schedule(self, with_assignments=True):
+        """Build a Schedule with the saved inputs and, unless told otherwise, the saved sessions"""
+        columns = self.columns
+        # Columns are read into lists once; indexing a list is faster than a memoryview
+        strings = [self.string(i) for i in range(len(columns["strings.offsets"]) - 1)]
+
+        def text(column):
+            return [strings[i] if i != NO_STRING else None for i in columns[column].tolist()]
+
+        settings = text("settings")
+        objective = None
+        if "objective.terms" in columns:
+            objective = SlotObjective(dict(zip(text("objective.terms"), columns["objective.weights"].tolist())))
+        schedule = Schedule(room_assignment=settings[0], cohort_conflicts=settings[1], objective=objective)
+
+        for room in zip(columns["room.id"].tolist(), text("room.name"), columns["room.capacity"].tolist(),
+                        text("room.type")):
+            schedule.add_classroom(Classroom(*room))
+
+        days = len(DAYS)
+        slot_offsets = columns["instructor.slot_offsets"].tolist()
+        slots = list(zip(columns["slot.kind"].tolist(), text("slot.day"), columns["slot.start"].tolist(),
+                         columns["slot.end"].tolist()))
+        has_preferences = columns["instructor.has_preferences"].tolist()
+        unavailable = columns["instructor.unavailable"].tolist()
+        preferred_hours = columns["instructor.preferred_hours"].tolist()
+        allowed_starts = columns["instructor.allowed_starts"].tolist()
+        preferred_starts = columns["instructor.preferred_starts"].tolist()
+        per_instructor = days * len(STORED_SESSION_LENGTHS)
+        for i, (instructor_id, name, is_part_time) in enumerate(zip(
+                columns["instructor.id"].tolist(), text("instructor.name"), columns["instructor.part_time"].tolist())):
+            instructor = Instructor(instructor_id, name, bool(is_part_time))
+            own_slots = slots[slot_offsets[i]:slot_offsets[i + 1]]
+            instructor.unavailable_slots = [slot[1:] for slot in own_slots if slot[0] == 0]
+            instructor.preferred_slots = [slot[1:] for slot in own_slots if slot[0] == 1]
+
+            windows = [[] for _ in DAYS]
+            if has_preferences[i]:
+                for day, start_hour, end_hour in instructor.preferred_slots:
+                    if day in DAYS:
+                        windows[DAYS.index(day)].append((start_hour, end_hour))
+            base = i * per_instructor
+            instructor.use_masks(InstructorMasks.from_compiled(
+                bool(has_preferences[i]), unavailable[i * days:(i + 1) * days],
+                preferred_hours[i * days:(i + 1) * days], windows,
+                allowed_starts={
+                    length: tuple(allowed_starts[base + n * days:base + (n + 1) * days])
+                    for n, length in enumerate(STORED_SESSION_LENGTHS)
+                },
+                preferred_starts={
+                    length: tuple(preferred_starts[base + n * days:base + (n + 1) * days])
+                    for n, length in enumerate(STORED_SESSION_LENGTHS)
+                }
+            ))
+            schedule.add_instructor(instructor)
+
+        departments = text("course.department") if "course.department" in columns else [None] * self.course_count
+        for course in zip(columns["course.id"].tolist(), text("course.name"), text("course.section"),
+                          text("course.major"), columns["course.instructor_id"].tolist(),
+                          columns["course.classroom_id"].tolist(), columns["course.hours_per_week"].tolist(),
+                          columns["course.student_count"].tolist(), map(bool, columns["course.online"].tolist()),
+                          departments):
+            schedule.add_course(Course(*course))
+
+        if with_assignments and self.session_count:
+            schedule.load_assignments(zip(columns["session.course"].tolist(), columns["session.day"].tolist(),
+                                          columns["session.start"].tolist(), columns["session.hours"].tolist(),
+                                          columns["session.room"].tolist()))
+        return schedule
+
+
+def read_schedule(path, with_assignments=True):
+    """Load a Schedule from a binary schedule file"""
+    with ScheduleFile(path) as schedule_file:
+        return schedule_file.to_schedule(with_assignments=with_assignments)
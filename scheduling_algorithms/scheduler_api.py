@@ -1,10 +1,254 @@
-import copy
+import hashlib
 import json
+import math
+import os
+import random
+import time
 import requests
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from collections import defaultdict
 
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+WEEKEND_DAYS = ("Saturday", "Sunday")
+DAY_INDEX = {day: i for i, day in enumerate(DAYS)}
+HOURS = list(range(8, 22))  # 8 AM to 10 PM
+ROOM_ASSIGNMENT_MODES = ("fixed", "flexible")  # Courses keep their classroom_id, or may use any room that fits
+UNSCHEDULED_HOUR_PENALTY = 1000  # Local search penalty for each weekly hour left unscheduled
+# Students of one major and section take all of that section's courses, so its courses should not overlap:
+# "off" ignores clashes, "weighted" penalises them in the slot score, "hard" never places one
+COHORT_CONFLICT_MODES = ("off", "weighted", "hard")
+COHORT_CONFLICT_PENALTY = 200  # Slot score penalty for each hour that clashes with another course of the cohort
+# Hour blocks of each day that the shared instructors and rooms of partitions are divided into (see Schedule.part_reservations)
+RESERVATION_BLOCKS = ((8, 12), (12, 17))
+
+def hour_mask(start_hour, end_hour):
+    """Bitmask of the hours in [start_hour, end_hour), clipped to HOURS (bit i is hour HOURS[0] + i)"""
+    start_hour = max(start_hour, HOURS[0])
+    end_hour = min(end_hour, HOURS[-1] + 1)
+    if end_hour <= start_hour:
+        return 0
+    return ((1 << (end_hour - start_hour)) - 1) << (start_hour - HOURS[0])
+
+def start_hour_mask(first_start, last_start):
+    """Bitmask of the start hours in [first_start, last_start]"""
+    return hour_mask(first_start, last_start + 1)
+
+def overlapping_starts(busy, hours_duration):
+    """Mask of start hours whose session of hours_duration would touch a busy hour"""
+    blocked = 0
+    for offset in range(hours_duration):
+        blocked |= busy >> offset
+    return blocked
+
+def count_bits(mask):
+    return bin(mask).count("1")
+
+def course_cohort(course):
+    """The student cohort taking a course: (major, section)"""
+    return course.major, course.section
+
+class DayIntervals:
+    """One course's sessions on one day as sorted intervals and merged runs.
+
+    A run is a maximal stretch of hours covered by sessions that touch or
+    overlap; sessions with a free hour between them are separate runs.
+    Lookups and updates bisect the sorted lists, so the hours on the day and
+    the run a new session would join are found without scanning every session.
+    """
+    __slots__ = ("sessions", "run_starts", "run_ends", "hours")
+
+    def __init__(self):
+        self.sessions = []  # Sorted (start_hour, end_hour)
+        self.run_starts = []
+        self.run_ends = []
+        self.hours = 0
+
+    def _touching_runs(self, start_hour, end_hour):
+        """Index range of the runs that touch or overlap [start_hour, end_hour)"""
+        return bisect_left(self.run_ends, start_hour), bisect_right(self.run_starts, end_hour)
+
+    def add(self, start_hour, end_hour):
+        insort(self.sessions, (start_hour, end_hour))
+        self.hours += end_hour - start_hour
+        first, last = self._touching_runs(start_hour, end_hour)
+        if first < last:
+            start_hour = min(start_hour, self.run_starts[first])
+            end_hour = max(end_hour, self.run_ends[last - 1])
+        self.run_starts[first:last] = [start_hour]
+        self.run_ends[first:last] = [end_hour]
+
+    def remove(self, start_hour, end_hour):
+        self.sessions.pop(bisect_left(self.sessions, (start_hour, end_hour)))
+        self.hours -= end_hour - start_hour
+        # Re-merge the sessions left in the run that held the removed one
+        run = bisect_right(self.run_starts, start_hour) - 1
+        run_start, run_end = self.run_starts[run], self.run_ends[run]
+        lo = bisect_left(self.sessions, (run_start,))
+        hi = bisect_left(self.sessions, (run_end,))
+        starts = []
+        ends = []
+        for session_start, session_end in self.sessions[lo:hi]:
+            if ends and session_start <= ends[-1]:
+                ends[-1] = max(ends[-1], session_end)
+            else:
+                starts.append(session_start)
+                ends.append(session_end)
+        self.run_starts[run:run + 1] = starts
+        self.run_ends[run:run + 1] = ends
+
+    def run_length_with(self, start_hour, end_hour):
+        """Length of the run the session [start_hour, end_hour) would be part of if added"""
+        first, last = self._touching_runs(start_hour, end_hour)
+        if first < last:
+            start_hour = min(start_hour, self.run_starts[first])
+            end_hour = max(end_hour, self.run_ends[last - 1])
+        return end_hour - start_hour
+
+    def runs(self):
+        """Merged (start_hour, end_hour) runs in order"""
+        return list(zip(self.run_starts, self.run_ends))
+
+class SessionSlots:
+    """A course's assigned (day, start_hour, end_hour) sessions packed into a byte array.
+
+    Each session takes three bytes (day index, start hour, end hour) instead
+    of a tuple per session. It behaves like the list of tuples it replaces:
+    iteration, indexing, ``in``, len, append, insert, index and remove all
+    use day names.
+    Per-day DayIntervals are built the first time a day is queried and kept
+    up to date by append and remove from then on.
+    """
+    __slots__ = ("_data", "_days")
+
+    def __init__(self, slots=()):
+        self._data = array("B")
+        self._days = None  # day index -> DayIntervals, once built
+        for slot in slots:
+            self.append(slot)
+
+    def __len__(self):
+        return len(self._data) // 3
+
+    def __iter__(self):
+        data = self._data
+        for i in range(0, len(data), 3):
+            yield DAYS[data[i]], data[i + 1], data[i + 2]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("session index out of range")
+        data = self._data
+        return DAYS[data[3 * index]], data[3 * index + 1], data[3 * index + 2]
+
+    def _find(self, slot):
+        day, start_hour, end_hour = slot
+        day_idx = DAY_INDEX.get(day)
+        data = self._data
+        for i in range(0, len(data), 3):
+            if data[i] == day_idx and data[i + 1] == start_hour and data[i + 2] == end_hour:
+                return i
+        return -1
+
+    def __contains__(self, slot):
+        return self._find(slot) >= 0
+
+    def __eq__(self, other):
+        if isinstance(other, SessionSlots):
+            return self._data == other._data
+        try:
+            return list(self) == [tuple(slot) for slot in other]
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def append(self, slot):
+        day, start_hour, end_hour = slot
+        day_idx = DAY_INDEX[day]
+        self._data.extend((day_idx, start_hour, end_hour))
+        if self._days is not None:
+            intervals = self._days.get(day_idx)
+            if intervals is None:
+                intervals = self._days[day_idx] = DayIntervals()
+            intervals.add(start_hour, end_hour)
+
+    def insert(self, index, slot):
+        day, start_hour, end_hour = slot
+        day_idx = DAY_INDEX[day]
+        self._data[3 * index:3 * index] = array("B", (day_idx, start_hour, end_hour))
+        if self._days is not None:
+            intervals = self._days.get(day_idx)
+            if intervals is None:
+                intervals = self._days[day_idx] = DayIntervals()
+            intervals.add(start_hour, end_hour)
+
+    def index(self, slot):
+        i = self._find(slot)
+        if i < 0:
+            raise ValueError(f"{slot!r} is not an assigned session")
+        return i // 3
+
+    def remove(self, slot):
+        i = self._find(slot)
+        if i < 0:
+            raise ValueError(f"{slot!r} is not an assigned session")
+        del self._data[i:i + 3]
+        if self._days is not None:
+            day, start_hour, end_hour = slot
+            self._days[DAY_INDEX[day]].remove(start_hour, end_hour)
+
+    def clear(self):
+        del self._data[:]
+        self._days = None
+
+    def _day(self, day_idx):
+        """DayIntervals for the day index, or None if the course has no session that day"""
+        days = self._days
+        if days is None:
+            days = self._days = {}
+            data = self._data
+            for i in range(0, len(data), 3):
+                intervals = days.get(data[i])
+                if intervals is None:
+                    intervals = days[data[i]] = DayIntervals()
+                intervals.add(data[i + 1], data[i + 2])
+        return days.get(day_idx)
+
+    def on_day(self, day_idx):
+        """(start_hour, end_hour) of the sessions on the given day index, in start order"""
+        intervals = self._day(day_idx)
+        return list(intervals.sessions) if intervals else []
+
+    def hours_on_day(self, day_idx):
+        """Total session hours on the given day index"""
+        intervals = self._day(day_idx)
+        return intervals.hours if intervals else 0
+
+    def runs_on_day(self, day_idx):
+        """Merged (start_hour, end_hour) runs of consecutive session hours on the given day index"""
+        intervals = self._day(day_idx)
+        return intervals.runs() if intervals else []
+
+    def run_length_with(self, day_idx, start_hour, end_hour):
+        """Length of the run of consecutive hours a new session would be part of"""
+        intervals = self._day(day_idx)
+        return intervals.run_length_with(start_hour, end_hour) if intervals else end_hour - start_hour
+
 class Course:
-    def __init__(self, id, name, section, major, instructor_id, classroom_id, hours_per_week, student_count, is_online=False):
+    __slots__ = ("id", "name", "section", "major", "instructor_id", "classroom_id", "hours_per_week",
+                 "student_count", "is_online", "department", "_assigned_slots")
+
+    def __init__(self, id, name, section, major, instructor_id, classroom_id, hours_per_week, student_count, is_online=False,
+                 department=None):
         self.id = id
         self.name = name
         self.section = section
@@ -14,10 +258,157 @@ class Course:
         self.hours_per_week = hours_per_week
         self.student_count = student_count
         self.is_online = is_online
+        self.department = department  # Used to partition the problem (see Schedule.course_department)
         self.assigned_slots = []  # Will store (day, start_hour, end_hour) tuples
 
+    @property
+    def assigned_slots(self):
+        return self._assigned_slots
+
+    @assigned_slots.setter
+    def assigned_slots(self, slots):
+        self._assigned_slots = SessionSlots(slots)
+
+class SlotList(list):
+    """List of (day, start_hour, end_hour) tuples that drops its owner's compiled masks when it changes"""
+    def __init__(self, owner, slots=()):
+        self.owner = owner
+        super().__init__(slots)
+
+class CourseList(list):
+    """List of an instructor's assigned courses that rebuilds its owner's membership index when it changes"""
+    def __init__(self, owner, courses=()):
+        self.owner = owner
+        super().__init__(courses)
+
+def _notifies_owner(name, hook):
+    method = getattr(list, name)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        # The owner is not set yet while a pickled list is being rebuilt
+        owner = getattr(self, "owner", None)
+        if owner is not None:
+            getattr(owner, hook)()
+        return result
+    wrapper.__name__ = name
+    return wrapper
+
+for _name in ("append", "extend", "insert", "remove", "pop", "clear", "sort", "reverse",
+              "__setitem__", "__delitem__", "__iadd__", "__imul__"):
+    setattr(SlotList, _name, _notifies_owner(_name, "invalidate_masks"))
+    setattr(CourseList, _name, _notifies_owner(_name, "reindex_courses"))
+
+class InstructorMasks:
+    """An instructor's availability rules compiled into per-day hour bitmasks.
+
+    Built from a snapshot of the instructor's slot lists and never changed
+    afterwards; the instructor builds a new one when the lists change. Start
+    masks per session length are derived on first use and memoised.
+    """
+    def __init__(self, instructor):
+        unavailable = [0] * len(DAYS)
+        preferred_hours = [0] * len(DAYS)
+        preferred_windows = [[] for _ in DAYS]
+        
+        for day, start_hour, end_hour in instructor.unavailable_slots:
+            if day in DAY_INDEX:
+                unavailable[DAY_INDEX[day]] |= hour_mask(start_hour, end_hour)
+        
+        # Preferred slots only lift the restrictions for part-time instructors
+        self.has_preferences = bool(instructor.is_part_time and instructor.preferred_slots)
+        if self.has_preferences:
+            for day, start_hour, end_hour in instructor.preferred_slots:
+                if day in DAY_INDEX:
+                    preferred_hours[DAY_INDEX[day]] |= hour_mask(start_hour, end_hour)
+                    preferred_windows[DAY_INDEX[day]].append((start_hour, end_hour))
+        
+        self.unavailable = tuple(unavailable)
+        self.preferred_hours = tuple(preferred_hours)
+        self.preferred_windows = tuple(tuple(windows) for windows in preferred_windows)
+        self._preferred_starts = {}
+        self._allowed_starts = {}
+        self._course_hours_per_day = None
+
+    @classmethod
+    def from_compiled(cls, has_preferences, unavailable, preferred_hours, preferred_windows,
+                      allowed_starts=None, preferred_starts=None):
+        """Masks compiled earlier, e.g. read back from a schedule file.
+
+        allowed_starts and preferred_starts map a session length to its per-day
+        start masks and pre-fill the memos, so those masks are not derived again.
+        """
+        masks = cls.__new__(cls)
+        masks.has_preferences = has_preferences
+        masks.unavailable = tuple(unavailable)
+        masks.preferred_hours = tuple(preferred_hours)
+        masks.preferred_windows = tuple(tuple(windows) for windows in preferred_windows)
+        masks._allowed_starts = dict(allowed_starts or {})
+        masks._preferred_starts = dict(preferred_starts or {})
+        masks._course_hours_per_day = None
+        return masks
+
+    def preferred_starts(self, hours_duration):
+        """Per-day masks of start hours where a session fits inside a single preferred slot"""
+        starts = self._preferred_starts.get(hours_duration)
+        if starts is None:
+            starts = tuple(
+                self._window_starts(windows, hours_duration) for windows in self.preferred_windows
+            )
+            self._preferred_starts[hours_duration] = starts
+        return starts
+
+    def allowed_starts(self, hours_duration):
+        """Per-day masks of start hours in 8..17 the instructor's rules allow a session to use.
+
+        Weekdays 8am-5pm are always allowed and anything else needs a preferred
+        slot; starts whose session overlaps an unavailable hour are removed.
+        """
+        starts = self._allowed_starts.get(hours_duration)
+        if starts is None:
+            window_starts = start_hour_mask(8, 17 - hours_duration)
+            preferred = self.preferred_starts(hours_duration)
+            starts = []
+            for day_idx, day in enumerate(DAYS):
+                allowed = preferred[day_idx]
+                if day not in WEEKEND_DAYS:
+                    allowed |= window_starts
+                allowed &= ~overlapping_starts(self.unavailable[day_idx], hours_duration)
+                starts.append(allowed & window_starts)
+            starts = tuple(starts)
+            self._allowed_starts[hours_duration] = starts
+        return starts
+
+    @property
+    def course_hours_per_day(self):
+        """Per day, the most hours one course can be given: allowed hours, at most 4 (one day's sessions)"""
+        if self._course_hours_per_day is None:
+            self._course_hours_per_day = tuple(min(4, count_bits(allowed)) for allowed in self.allowed_starts(1))
+        return self._course_hours_per_day
+
+    @property
+    def weekly_course_hours(self):
+        """The most hours a week one course of the instructor can be given"""
+        return sum(self.course_hours_per_day)
+
+    def is_preferred(self, day_idx, start_hour, end_hour):
+        """Check if the slot lies inside one of the preferred slots"""
+        if start_hour < HOURS[0]:
+            return False
+        return bool(self.preferred_starts(end_hour - start_hour)[day_idx] >> (start_hour - HOURS[0]) & 1)
+
+    @staticmethod
+    def _window_starts(windows, hours_duration):
+        starts = 0
+        for start_hour, end_hour in windows:
+            starts |= start_hour_mask(start_hour, end_hour - hours_duration)
+        return starts
+
 class Instructor:
+    __slots__ = ("id", "name", "_is_part_time", "_unavailable_slots", "_preferred_slots", "_assigned_courses",
+                 "_course_index", "_masks")
+
     def __init__(self, id, name, is_part_time=False):
+        self._masks = None
         self.id = id
         self.name = name
         self.is_part_time = is_part_time
@@ -25,265 +416,3269 @@ class Instructor:
         self.preferred_slots = []  # List of (day, start_hour, end_hour) tuples for part-time instructors
         self.assigned_courses = []  # Courses assigned to this instructor
 
-class Classroom:
-    def __init__(self, id, name, capacity, room_type):
-        self.id = id
-        self.name = name
-        self.capacity = capacity
-        self.room_type = room_type  # "lecture", "computer_lab", etc.
+    @property
+    def assigned_courses(self):
+        """Courses with at least one assigned session, in assignment order"""
+        return self._assigned_courses
+
+    @assigned_courses.setter
+    def assigned_courses(self, courses):
+        self._assigned_courses = CourseList(self, courses)
+        self.reindex_courses()
+
+    def reindex_courses(self):
+        # A set of the assigned courses for O(1) membership tests; a copied
+        # instructor gets its list only after the list has been rebuilt
+        self._course_index = set(getattr(self, "_assigned_courses", ()))
+
+    def teaches(self, course):
+        """Check if the course is among the instructor's assigned courses"""
+        return course in self._course_index
+
+    def add_assigned_course(self, course):
+        if course not in self._course_index:
+            self._course_index.add(course)
+            list.append(self._assigned_courses, course)
+
+    def remove_assigned_course(self, course):
+        if course in self._course_index:
+            self._course_index.discard(course)
+            list.remove(self._assigned_courses, course)
+
+    @property
+    def is_part_time(self):
+        return self._is_part_time
+
+    @is_part_time.setter
+    def is_part_time(self, value):
+        self._is_part_time = value
+        self._masks = None
+
+    @property
+    def unavailable_slots(self):
+        return self._unavailable_slots
+
+    @unavailable_slots.setter
+    def unavailable_slots(self, slots):
+        self._unavailable_slots = SlotList(self, slots)
+        self._masks = None
+
+    @property
+    def preferred_slots(self):
+        return self._preferred_slots
+
+    @preferred_slots.setter
+    def preferred_slots(self, slots):
+        self._preferred_slots = SlotList(self, slots)
+        self._masks = None
+
+    @property
+    def masks(self):
+        """Compiled availability masks, rebuilt lazily after the slot lists change"""
+        if self._masks is None:
+            self._masks = InstructorMasks(self)
+        return self._masks
+
+    def invalidate_masks(self):
+        self._masks = None
+
+    def use_masks(self, masks):
+        """Install masks compiled earlier from the instructor's current slot lists"""
+        self._masks = masks
+
+class Classroom:
+    __slots__ = ("id", "name", "capacity", "room_type")
+
+    def __init__(self, id, name, capacity, room_type):
+        self.id = id
+        self.name = name
+        self.capacity = capacity
+        self.room_type = room_type  # "lecture", "computer_lab", etc.
+
+_computer_lab_names = {}
+
+def needs_computer_lab(course_name):
+    """Check if a course with this name must be held in a computer lab (memoised per name)"""
+    needed = _computer_lab_names.get(course_name)
+    if needed is None:
+        needed = _computer_lab_names[course_name] = course_name.lower().find("computer") >= 0
+    return needed
+
+class RoomIndex:
+    """Classrooms grouped by room_type, each group sorted by capacity.
+
+    rooms_with_capacity() is a bisect range query: it returns the rooms
+    that seat at least the given number of students, smallest first.
+    """
+    def __init__(self, classrooms):
+        groups = {None: []}  # None groups every room regardless of type
+        for order, room in enumerate(classrooms):
+            groups[None].append((room.capacity, order, room))
+            groups.setdefault(room.room_type, []).append((room.capacity, order, room))
+        self.groups = {}
+        for room_type, entries in groups.items():
+            entries.sort(key=lambda entry: entry[:2])
+            self.groups[room_type] = ([entry[0] for entry in entries], [entry[2] for entry in entries])
+
+    def rooms_with_capacity(self, min_capacity, room_type=None):
+        """Rooms of the type (any type for None) with capacity >= min_capacity, tightest fit first"""
+        group = self.groups.get(room_type)
+        if group is None:
+            return []
+        capacities, rooms = group
+        return rooms[bisect_left(capacities, min_capacity):]
+
+class OccupancyGrid:
+    """Occupancy of instructors and rooms stored as one hour bitmask per day.
+
+    Bit ``i`` of a day mask stands for the hour ``HOURS[0] + i``, so checking a
+    whole time window against an entity is a single mask AND. The nested
+    ``timetable`` dict is kept alongside as a view for printing and export.
+    """
+    def __init__(self, days=DAYS, hours=HOURS):
+        self.days = days
+        self.hours = hours
+        self.first_hour = hours[0]
+        self.day_index = DAY_INDEX
+        self.instructor_masks = {}  # instructor_id -> [mask for each day]
+        self.room_masks = {}  # room_id -> [mask for each day]
+        # Sessions per hour, so overlapping bookings can be detected and released
+        self.instructor_counts = {}  # instructor_id -> [[count for each hour] for each day]
+        self.room_counts = {}  # room_id -> [[count for each hour] for each day]
+        # Same for student cohorts, keyed by (major, section)
+        self.cohort_masks = {}
+        self.cohort_counts = {}
+        self.instructor_hours = {}  # instructor_id -> [session hours for each day]
+        # Number of occupied online / in-person cells per day and hour
+        self.online_counts = [[0] * len(hours) for _ in days]
+        self.offline_counts = [[0] * len(hours) for _ in days]
+        # View: day -> hour -> room_id -> (course, instructor)
+        self.timetable = {day: {hour: {} for hour in hours} for day in days}
+        # (day, hour, room_id) -> further (course, instructor) sessions in an already booked room
+        self.extra_bookings = {}
+
+    def instructor_mask(self, instructor_id, day):
+        masks = self.instructor_masks.get(instructor_id)
+        return masks[self.day_index[day]] if masks else 0
+
+    def room_mask(self, room_id, day):
+        masks = self.room_masks.get(room_id)
+        return masks[self.day_index[day]] if masks else 0
+
+    def cohort_mask(self, cohort, day):
+        masks = self.cohort_masks.get(cohort)
+        return masks[self.day_index[day]] if masks else 0
+
+    def opposite_mode_counts(self, day, is_online):
+        """Per-hour count of occupied cells whose online/in-person mode differs from is_online"""
+        day_idx = self.day_index[day]
+        return self.offline_counts[day_idx] if is_online else self.online_counts[day_idx]
+
+    def is_instructor_free(self, instructor_id, day, start_hour, end_hour):
+        return not self.instructor_mask(instructor_id, day) & hour_mask(start_hour, end_hour)
+
+    def is_room_free(self, room_id, day, start_hour, end_hour):
+        return not self.room_mask(room_id, day) & hour_mask(start_hour, end_hour)
+
+    def instructor_count(self, instructor_id, day, hour):
+        """Number of sessions the instructor has in the given hour"""
+        counts = self.instructor_counts.get(instructor_id)
+        return counts[self.day_index[day]][hour - self.first_hour] if counts else 0
+
+    def room_count(self, room_id, day, hour):
+        """Number of sessions booked into the room in the given hour"""
+        counts = self.room_counts.get(room_id)
+        return counts[self.day_index[day]][hour - self.first_hour] if counts else 0
+
+    def instructor_hours_on_day(self, instructor_id, day_idx):
+        """Total hours of the instructor's sessions on the day"""
+        hours = self.instructor_hours.get(instructor_id)
+        return hours[day_idx] if hours else 0
+
+    def cell_count(self, day_idx, hour):
+        """Number of sessions, online or in person, booked in the hour"""
+        hour_idx = hour - self.first_hour
+        return self.online_counts[day_idx][hour_idx] + self.offline_counts[day_idx][hour_idx]
+
+    def cohort_count(self, cohort, day, hour):
+        """Number of the cohort's sessions in the given hour"""
+        counts = self.cohort_counts.get(cohort)
+        return counts[self.day_index[day]][hour - self.first_hour] if counts else 0
+
+    def _book(self, masks, counts, entity_id, day_idx, start_hour, end_hour, delta):
+        if entity_id not in masks:
+            masks[entity_id] = [0] * len(self.days)
+            counts[entity_id] = [[0] * len(self.hours) for _ in self.days]
+        day_masks = masks[entity_id]
+        day_counts = counts[entity_id][day_idx]
+        for hour in range(start_hour, end_hour):
+            hour_idx = hour - self.first_hour
+            day_counts[hour_idx] += delta
+            if day_counts[hour_idx] > 0:
+                day_masks[day_idx] |= 1 << hour_idx
+            else:
+                day_masks[day_idx] &= ~(1 << hour_idx)
+
+    def occupy(self, course, instructor, classroom, day, start_hour, end_hour):
+        """Mark the instructor and room as busy and record the cells in the view"""
+        day_idx = self.day_index[day]
+        self._book(self.instructor_masks, self.instructor_counts, instructor.id, day_idx, start_hour, end_hour, 1)
+        self._book(self.room_masks, self.room_counts, classroom.id, day_idx, start_hour, end_hour, 1)
+        self._book(self.cohort_masks, self.cohort_counts, course_cohort(course), day_idx, start_hour, end_hour, 1)
+        self.instructor_hours.setdefault(instructor.id, [0] * len(self.days))[day_idx] += end_hour - start_hour
+        
+        mode_counts = self.online_counts[day_idx] if course.is_online else self.offline_counts[day_idx]
+        entry = (course, instructor)  # One tuple shared by every hour of the session
+        for hour in range(start_hour, end_hour):
+            mode_counts[hour - self.first_hour] += 1
+            cell = self.timetable[day][hour]
+            if classroom.id in cell:
+                # Double booking: the view keeps the first session, the rest wait here
+                self.extra_bookings.setdefault((day, hour, classroom.id), []).append(entry)
+            else:
+                cell[classroom.id] = entry
+
+    def release(self, course, instructor, classroom, day, start_hour, end_hour):
+        """Undo an earlier occupy call for the same session"""
+        day_idx = self.day_index[day]
+        self._book(self.instructor_masks, self.instructor_counts, instructor.id, day_idx, start_hour, end_hour, -1)
+        self._book(self.room_masks, self.room_counts, classroom.id, day_idx, start_hour, end_hour, -1)
+        self._book(self.cohort_masks, self.cohort_counts, course_cohort(course), day_idx, start_hour, end_hour, -1)
+        self.instructor_hours[instructor.id][day_idx] -= end_hour - start_hour
+        
+        mode_counts = self.online_counts[day_idx] if course.is_online else self.offline_counts[day_idx]
+        for hour in range(start_hour, end_hour):
+            mode_counts[hour - self.first_hour] -= 1
+            key = (day, hour, classroom.id)
+            cell = self.timetable[day][hour]
+            extra = self.extra_bookings.get(key)
+            if cell.get(classroom.id) == (course, instructor):
+                del cell[classroom.id]
+                if extra:
+                    cell[classroom.id] = extra.pop(0)
+            elif extra and (course, instructor) in extra:
+                extra.remove((course, instructor))
+            if key in self.extra_bookings and not extra:
+                del self.extra_bookings[key]
+
+    def reserve(self, kind, entity_id, day_idx, start_hour, end_hour):
+        """Mark an instructor, room or cohort (kind "instructor", "room" or "cohort") busy without booking a session.
+
+        Reserved hours are busy in every mask check, so nothing is placed there.
+        """
+        if kind == "instructor":
+            self._book(self.instructor_masks, self.instructor_counts, entity_id, day_idx, start_hour, end_hour, 1)
+        elif kind == "room":
+            self._book(self.room_masks, self.room_counts, entity_id, day_idx, start_hour, end_hour, 1)
+        elif kind == "cohort":
+            self._book(self.cohort_masks, self.cohort_counts, entity_id, day_idx, start_hour, end_hour, 1)
+        else:
+            raise ValueError(f"Unknown reservation kind: {kind}")
+
+    def cell_bookings(self, day, hour, room_id):
+        """All (course, instructor) sessions booked into the room at the given hour"""
+        entry = self.timetable[day][hour].get(room_id)
+        if entry is None:
+            return []
+        return [entry] + self.extra_bookings.get((day, hour, room_id), [])
+
+class Violation:
+    """A scheduling rule broken by the current assignments"""
+    __slots__ = ("kind", "severity", "message", "day", "hour", "course_id", "instructor_id", "room_id")
+
+    def __init__(self, kind, severity, message, day=None, hour=None, course_id=None, instructor_id=None, room_id=None):
+        self.kind = kind
+        self.severity = severity  # "error" makes the schedule invalid, "warning" does not
+        self.message = message
+        self.day = day
+        self.hour = hour
+        self.course_id = course_id
+        self.instructor_id = instructor_id
+        self.room_id = room_id
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "severity": self.severity,
+            "message": self.message,
+            "day": self.day,
+            "hour": self.hour,
+            "course_id": self.course_id,
+            "instructor_id": self.instructor_id,
+            "room_id": self.room_id
+        }
+
+    def __repr__(self):
+        return f"Violation({self.kind!r}, {self.severity!r}, {self.message!r})"
+
+class InputChange:
+    """A recorded change to a schedule's inputs, kept in the edit history next to slot edits.
+
+    kind is "set" (entity attribute name changed from old to new),
+    "add_course" / "add_instructor" / "add_classroom" (entity added) or
+    "remove_course" (entity removed from position old of Schedule.courses).
+    """
+    __slots__ = ("kind", "entity", "name", "old", "new")
+
+    def __init__(self, kind, entity, name=None, old=None, new=None):
+        self.kind = kind
+        self.entity = entity
+        self.name = name
+        self.old = old
+        self.new = new
+
+    def __repr__(self):
+        return f"InputChange({self.kind!r}, {type(self.entity).__name__} {self.entity.id!r}, {self.name!r})"
+
+class ScheduleVersion:
+    """One state in the tree of states a schedule has been in.
+
+    A version only stores the edit that leads to it from its parent, so
+    versions share their common history and cost O(1) to keep. Returned by
+    Schedule.snapshot() and accepted by Schedule.restore().
+    """
+    __slots__ = ("parent", "edit", "depth")
+
+    def __init__(self, parent=None, edit=None):
+        self.parent = parent
+        self.edit = edit
+        self.depth = parent.depth + 1 if parent is not None else 0
+
+    def root(self):
+        version = self
+        while version.parent is not None:
+            version = version.parent
+        return version
+
+class SlotObjective:
+    """Weighted terms of the score a candidate session gets (lower is better).
+
+    Terms, each multiplied by its weight:
+        earliness       - day index * 10 + hours after 8am, so earlier slots win ties
+        preference      - the slot is outside a part-time instructor's preferred slots
+        mode_switch     - online/offline sessions of the other mode in the neighbouring hours
+        cohort          - hours taken by the cohort's other classes (weighted cohort conflicts only)
+        consecutive     - the session would make a run of more than 4 hours
+        day_spread      - session hours times the course's other hours on the day
+        instructor_load - session hours times the instructor's other hours on the day
+        room_load       - share of the rooms already taken, summed over the session's hours
+    Every term reads counters the schedule keeps up to date as sessions are
+    assigned, so a score costs the same however many rooms there are. The
+    default weights give the original score; BALANCED_WEIGHTS also spread the
+    sessions over the week. Terms must never be negative, because find_best_slot
+    skips candidates whose partial score is already too high.
+    """
+    DEFAULT_WEIGHTS = {
+        "earliness": 1, "preference": 100, "mode_switch": 50, "cohort": COHORT_CONFLICT_PENALTY, "consecutive": 1000,
+        "day_spread": 0, "instructor_load": 0, "room_load": 0
+    }
+    BALANCED_WEIGHTS = dict(DEFAULT_WEIGHTS, day_spread=15, instructor_load=3, room_load=20)
+
+    def __init__(self, weights=None, **overrides):
+        self.weights = dict(self.DEFAULT_WEIGHTS)
+        for name, weight in dict(weights or {}, **overrides).items():
+            if name not in self.DEFAULT_WEIGHTS:
+                raise ValueError(f"Unknown objective term: {name}")
+            if weight < 0:
+                raise ValueError(f"Objective weight for {name} must not be negative")
+            self.weights[name] = weight
+        self.extra_terms = []  # (name, function, weight)
+
+    @classmethod
+    def balanced(cls, **overrides):
+        return cls(cls.BALANCED_WEIGHTS, **overrides)
+
+    def add_term(self, name, function, weight=1):
+        """Add a term function(schedule, course, instructor, classroom, day, start_hour, hours_duration) -> cost.
+
+        The cost is charged to the session being scored only, and must not be negative.
+        """
+        if weight < 0:
+            raise ValueError(f"Objective weight for {name} must not be negative")
+        self.extra_terms.append((name, function, weight))
+        return self
+
+    @property
+    def balances_load(self):
+        weights = self.weights
+        return bool(weights["day_spread"] or weights["instructor_load"] or weights["room_load"])
+
+    def day_cost(self, schedule, course, instructor, day_idx, hours_duration, placed=False):
+        """day_spread and instructor_load for a session of the given length on the day.
+
+        With placed=True the session is already assigned and its own hours are left out.
+        """
+        weights = self.weights
+        cost = 0
+        if weights["day_spread"]:
+            other_hours = course.assigned_slots.hours_on_day(day_idx) - (hours_duration if placed else 0)
+            cost += weights["day_spread"] * hours_duration * other_hours
+        if weights["instructor_load"]:
+            other_hours = schedule.occupancy.instructor_hours_on_day(instructor.id, day_idx) - (hours_duration if placed else 0)
+            cost += weights["instructor_load"] * hours_duration * other_hours
+        return cost
+
+    def room_load_cost(self, schedule, day_idx, start_hour, hours_duration, placed=False):
+        """room_load for a session; with placed=True the session's own cells are left out"""
+        weight = self.weights["room_load"]
+        if not weight or not schedule.classrooms:
+            return 0
+        occupancy = schedule.occupancy
+        taken = sum(occupancy.cell_count(day_idx, hour) for hour in range(start_hour, start_hour + hours_duration))
+        if placed:
+            taken -= hours_duration
+        return weight * taken / len(schedule.classrooms)
+
+    def extra_cost(self, schedule, course, instructor, classroom, day, start_hour, hours_duration):
+        cost = 0
+        for _, function, weight in self.extra_terms:
+            cost += weight * function(schedule, course, instructor, classroom, day, start_hour, hours_duration)
+        return cost
+
+class ScheduleValidator:
+    """Keeps the set of rule violations of a schedule up to date as slots change.
+
+    Schedule.assign_slot and Schedule.unassign_slot report every change, and
+    only the hours, courses and days touched by that change are re-checked.
+    Call rebuild() after changing inputs such as instructor preferences or
+    a course's hours_per_week, or change them through Schedule.resolve_delta.
+    """
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.violations = {}  # key -> Violation
+        self.error_count = 0
+
+    def _set(self, key, violation):
+        old = self.violations.pop(key, None)
+        if old is not None and old.severity == "error":
+            self.error_count -= 1
+        if violation is not None:
+            self.violations[key] = violation
+            if violation.severity == "error":
+                self.error_count += 1
+
+    def is_valid(self):
+        return self.error_count == 0
+
+    def get_violations(self, severity=None):
+        """Current violations, optionally only those of one severity"""
+        return [v for v in self.violations.values() if severity is None or v.severity == severity]
+
+    def rebuild(self):
+        """Re-check the whole schedule from scratch"""
+        self.violations = {}
+        self.error_count = 0
+        occupancy = self.schedule.occupancy
+        for course in self.schedule.courses:
+            self.check_course(course)
+        for day in self.schedule.days:
+            for hour in self.schedule.hours:
+                for room_id in list(occupancy.timetable[day][hour]):
+                    for course, instructor in occupancy.cell_bookings(day, hour, room_id):
+                        self._check_hour(course, instructor, room_id, day, hour)
+                self._check_mode_mix(day, hour)
+
+    def check_course(self, course):
+        """Re-check the rules that depend on a course's assigned slots"""
+        self.check_course_hours(course)
+        for day in {slot[0] for slot in course.assigned_slots}:
+            self.check_consecutive_hours(course, day)
+
+    def check_course_hours(self, course):
+        """Check that the course is scheduled for exactly its weekly hours"""
+        total_hours = sum(end - start for _, start, end in course.assigned_slots)
+        violation = None
+        if total_hours != course.hours_per_week:
+            violation = Violation(
+                "course_hours", "error",
+                f"Course {course.name} is scheduled for {total_hours} hours, but requires {course.hours_per_week} hours",
+                course_id=course.id
+            )
+        self._set(("course_hours", course.id), violation)
+
+    def check_consecutive_hours(self, course, day):
+        """Check for more than 4 consecutive hours of the course on the day"""
+        runs = course.assigned_slots.runs_on_day(DAY_INDEX[day])
+        
+        violation = None
+        if any(end - start > 4 for start, end in runs):
+            violation = Violation(
+                "consecutive_hours", "error",
+                f"Course {course.name} has more than 4 consecutive hours on {day}",
+                day=day, course_id=course.id
+            )
+        self._set(("consecutive_hours", course.id, day), violation)
+
+    def slot_changed(self, course, instructor, classroom, day, start_hour, end_hour, assigned):
+        """Re-check everything touched by assigning or unassigning one session"""
+        for hour in range(start_hour, end_hour):
+            if assigned:
+                self._check_hour(course, instructor, classroom.id, day, hour)
+            else:
+                self._set(("restricted_slot", course.id, classroom.id, day, hour), None)
+                self._check_conflicts(instructor, classroom.id, day, hour)
+                self._check_cohort(course, day, hour)
+                # An overlapping session of the same course may still hold the cell
+                for other_course, other_instructor in self.schedule.occupancy.cell_bookings(day, hour, classroom.id):
+                    if other_course.id == course.id:
+                        self._check_hour(other_course, other_instructor, classroom.id, day, hour)
+        
+        # Mixed online/offline sessions can appear or vanish around the edited hours
+        for hour in range(start_hour - 1, end_hour):
+            self._check_mode_mix(day, hour)
+        
+        self.check_course_hours(course)
+        self.check_consecutive_hours(course, day)
+
+    def _check_hour(self, course, instructor, room_id, day, hour):
+        self._check_conflicts(instructor, room_id, day, hour)
+        self._check_cohort(course, day, hour)
+        
+        # Check instructor time and day restrictions for non-preferred slots
+        violation = None
+        is_weekend = day in WEEKEND_DAYS
+        is_outside_hours = hour < 8 or hour >= 17  # Outside of 8am-5pm
+        if is_weekend or is_outside_hours:
+            is_preferred = bool(instructor.masks.preferred_hours[DAY_INDEX[day]] & hour_mask(hour, hour + 1))
+            if not is_preferred:
+                if is_weekend:
+                    message = f"Instructor {instructor.name} is scheduled on weekend {day} in a non-preferred slot at {hour}:00"
+                else:
+                    message = f"Instructor {instructor.name} is scheduled outside 8am-5pm in a non-preferred slot at {day} {hour}:00"
+                violation = Violation(
+                    "restricted_slot", "error", message,
+                    day=day, hour=hour, course_id=course.id, instructor_id=instructor.id, room_id=room_id
+                )
+        self._set(("restricted_slot", course.id, room_id, day, hour), violation)
+
+    def _check_conflicts(self, instructor, room_id, day, hour):
+        occupancy = self.schedule.occupancy
+        
+        violation = None
+        if occupancy.instructor_count(instructor.id, day, hour) > 1:
+            violation = Violation(
+                "instructor_conflict", "error",
+                f"Instructor {instructor.name} is scheduled in multiple rooms at {day} {hour}:00",
+                day=day, hour=hour, instructor_id=instructor.id
+            )
+        self._set(("instructor_conflict", instructor.id, day, hour), violation)
+        
+        violation = None
+        if occupancy.room_count(room_id, day, hour) > 1:
+            violation = Violation(
+                "room_conflict", "error",
+                f"Multiple courses scheduled in room {room_id} at {day} {hour}:00",
+                day=day, hour=hour, room_id=room_id
+            )
+        self._set(("room_conflict", room_id, day, hour), violation)
+
+    def _check_cohort(self, course, day, hour):
+        """Check for two courses of the course's cohort in the same hour"""
+        mode = self.schedule.cohort_conflicts
+        if mode == "off":
+            return
+        major, section = cohort = course_cohort(course)
+        
+        violation = None
+        if self.schedule.occupancy.cohort_count(cohort, day, hour) > 1:
+            violation = Violation(
+                "cohort_conflict", "error" if mode == "hard" else "warning",
+                f"Students of {major} section {section} have multiple classes at {day} {hour}:00",
+                day=day, hour=hour
+            )
+        self._set(("cohort_conflict", major, section, day, hour), violation)
+
+    def _check_mode_mix(self, day, hour):
+        """Check the hour pair (hour, hour + 1) for a mix of online and offline classes"""
+        if hour < 8 or hour >= 17:
+            return
+        occupancy = self.schedule.occupancy
+        day_idx = DAY_INDEX[day]
+        current = hour - occupancy.first_hour
+        online = occupancy.online_counts[day_idx]
+        offline = occupancy.offline_counts[day_idx]
+        
+        violation = None
+        if (online[current] and offline[current + 1]) or (offline[current] and online[current + 1]):
+            violation = Violation(
+                "mode_mix", "warning",
+                f"Mix of online and offline classes scheduled near each other at {day} {hour}:00-{hour+1}:00",
+                day=day, hour=hour
+            )
+        self._set(("mode_mix", day, hour), violation)
+
+class SolverProfiler:
+    """Call counts, timings and slot rejection statistics for a Schedule.
+
+    attach() wraps the hot-path methods of one schedule instance, and
+    detach() removes the wrappers, so a schedule that is not being profiled
+    runs the plain methods at no extra cost. Times are inclusive:
+    find_best_slot includes the feasible_start_mask / any_room_start_mask
+    calls it makes. The LOCAL_SEARCH_METHODS score placed sessions and are
+    only called by optimize_schedule and total_penalty, never by the greedy
+    pass; report() marks them "local_search_only".
+
+    For every slot search, with fixed rooms (feasible_start_mask) or a room
+    pool (any_room_start_mask), the profiler records, per course, the candidate
+    start hours examined, how many were feasible and which constraint
+    rejected the others:
+        instructor_rules  - weekday 8am-5pm / preferred slot / unavailability
+        instructor_busy   - the instructor teaches elsewhere at that time
+        room_busy         - the room is taken (with a room pool: every room that fits is taken)
+        cohort_busy       - the students have another class then (hard cohort conflicts only)
+        consecutive_hours - more than 4 consecutive hours of the course
+    Each time the greedy pass lowers hours_per_session for lack of a slot,
+    the session length it gave up on is recorded as a fallback step.
+    """
+    PROFILED_METHODS = (
+        "would_exceed_consecutive_hours", "calculate_slot_score", "find_best_slot", "feasible_start_mask",
+        "any_room_start_mask", "mode_switch_penalty", "cohort_penalty"
+    )
+    LOCAL_SEARCH_METHODS = ("would_exceed_consecutive_hours", "calculate_slot_score")
+    REJECTION_REASONS = ("instructor_rules", "instructor_busy", "room_busy", "cohort_busy", "consecutive_hours")
+
+    def __init__(self):
+        self.schedule = None
+        self.calls = {}
+        self.seconds = {}
+        self.reset()
+
+    def reset(self):
+        # Cleared in place, as the wrappers of an attached schedule hold on to these dicts
+        for name in self.PROFILED_METHODS:
+            self.calls[name] = 0
+            self.seconds[name] = 0.0
+        self.courses = {}  # course_id -> per-course statistics
+
+    def attach(self, schedule):
+        """Start profiling the schedule"""
+        if self.schedule is not None:
+            raise RuntimeError("Profiler is already attached to a schedule")
+        self.schedule = schedule
+        schedule.profiler = self
+        for name in self.PROFILED_METHODS:
+            setattr(schedule, name, self._timed(name, getattr(schedule, name)))
+        schedule.feasible_start_mask = self._counting_rejections(schedule.feasible_start_mask)
+        schedule.any_room_start_mask = self._counting_pool_rejections(schedule.any_room_start_mask)
+        return self
+
+    def detach(self):
+        """Stop profiling and restore the schedule's plain methods"""
+        if self.schedule is None:
+            return
+        for name in self.PROFILED_METHODS:
+            del self.schedule.__dict__[name]
+        self.schedule.profiler = None
+        self.schedule = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.detach()
+        return False
+
+    def _timed(self, name, method):
+        calls = self.calls
+        seconds = self.seconds
+        clock = time.perf_counter
+        
+        def wrapper(*args, **kwargs):
+            started = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds[name] += clock() - started
+                calls[name] += 1
+        return wrapper
+
+    def _course_stats(self, course):
+        stats = self.courses.get(course.id)
+        if stats is None:
+            stats = {
+                "name": course.name,
+                "searches": 0,
+                "candidates": 0,
+                "feasible": 0,
+                "rejections": dict.fromkeys(self.REJECTION_REASONS, 0),
+                "fallbacks": []
+            }
+            self.courses[course.id] = stats
+        return stats
+
+    def _count_rejections(self, course, hours_duration, allowed, checks):
+        """Charge each start rejected by a search to the first of the (reason, passing starts) checks it fails"""
+        stats = self._course_stats(course)
+        stats["searches"] += 1
+        remaining = start_hour_mask(8, 17 - hours_duration)
+        stats["candidates"] += count_bits(remaining)
+        stats["feasible"] += count_bits(allowed)
+        rejections = stats["rejections"]
+        for reason, passing in checks:
+            rejections[reason] += count_bits(remaining & ~passing)
+            remaining &= passing
+
+    def _cohort_busy(self, course, day):
+        if self.schedule.cohort_conflicts != "hard":
+            return 0
+        return self.schedule.occupancy.cohort_mask(course_cohort(course), day)
+
+    def _counting_rejections(self, method):
+        occupancy = self.schedule.occupancy
+        
+        def wrapper(course, instructor, classroom, day, hours_duration):
+            allowed = method(course, instructor, classroom, day, hours_duration)
+            
+            # Re-derive which constraint removed each start, in the order feasible_start_mask applies them
+            self._count_rejections(course, hours_duration, allowed, (
+                ("instructor_rules", instructor.masks.allowed_starts(hours_duration)[DAY_INDEX[day]]),
+                ("instructor_busy", ~overlapping_starts(occupancy.instructor_mask(instructor.id, day), hours_duration)),
+                ("room_busy", ~overlapping_starts(occupancy.room_mask(classroom.id, day), hours_duration)),
+                ("cohort_busy", ~overlapping_starts(self._cohort_busy(course, day), hours_duration)),
+                ("consecutive_hours", allowed)
+            ))
+            return allowed
+        return wrapper
+
+    def _counting_pool_rejections(self, method):
+        schedule = self.schedule
+        occupancy = schedule.occupancy
+        
+        def wrapper(course, instructor, rooms, day, hours_duration):
+            allowed = method(course, instructor, rooms, day, hours_duration)
+            
+            # any_room_start_mask checks the instructor side first and the rooms last
+            self._count_rejections(course, hours_duration, allowed, (
+                ("instructor_rules", instructor.masks.allowed_starts(hours_duration)[DAY_INDEX[day]]),
+                ("instructor_busy", ~overlapping_starts(occupancy.instructor_mask(instructor.id, day), hours_duration)),
+                ("cohort_busy", ~overlapping_starts(self._cohort_busy(course, day), hours_duration)),
+                ("consecutive_hours", schedule._instructor_start_mask(course, instructor, day, hours_duration)),
+                ("room_busy", allowed)
+            ))
+            return allowed
+        return wrapper
+
+    def record_fallback(self, course, hours_per_session):
+        """Note that no slot was found for a session of hours_per_session hours"""
+        self._course_stats(course)["fallbacks"].append(hours_per_session)
+
+    def report(self):
+        """Structured summary of everything recorded so far"""
+        totals = dict.fromkeys(self.REJECTION_REASONS, 0)
+        for stats in self.courses.values():
+            for reason, count in stats["rejections"].items():
+                totals[reason] += count
+        return {
+            "functions": {
+                name: {"calls": self.calls[name], "seconds": self.seconds[name],
+                       "local_search_only": name in self.LOCAL_SEARCH_METHODS}
+                for name in self.PROFILED_METHODS
+            },
+            "rejections": totals,
+            "courses": {
+                course_id: {
+                    "name": stats["name"],
+                    "searches": stats["searches"],
+                    "candidates": stats["candidates"],
+                    "feasible": stats["feasible"],
+                    "rejections": dict(stats["rejections"]),
+                    "fallbacks": list(stats["fallbacks"])
+                }
+                for course_id, stats in self.courses.items()
+            }
+        }
+
+    def prometheus_text(self, prefix="scheduler"):
+        """The report in the Prometheus text exposition format"""
+        lines = []
+        
+        def metric(name, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{self._escape_label(val)}"' for key, val in labels)
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}")
+        
+        metric("function_calls_total", "Calls of profiled scheduler methods.",
+               [((("function", name),), self.calls[name]) for name in self.PROFILED_METHODS])
+        metric("function_seconds_total", "Time spent in profiled scheduler methods (inclusive).",
+               [((("function", name),), f"{self.seconds[name]:.6f}") for name in self.PROFILED_METHODS])
+        metric("slot_rejections_total", "Candidate start hours rejected, by constraint.",
+               [((("reason", reason),), count) for reason, count in self.report()["rejections"].items()])
+        metric("course_candidates_total", "Candidate start hours examined per course.",
+               [((("course_id", course_id), ("course", stats["name"])), stats["candidates"])
+                for course_id, stats in self.courses.items()])
+        metric("course_fallbacks_total", "Times the session length was lowered for lack of a slot, per course.",
+               [((("course_id", course_id), ("course", stats["name"])), len(stats["fallbacks"]))
+                for course_id, stats in self.courses.items()])
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _escape_label(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class BacktrackingSolver:
+    """Complete search for a schedule that places every remaining hour of every course.
+
+    Each course's remaining hours are split into sessions, the variables of the
+    search. A session's domain is a per-day mask of start hours built from the
+    same rules as is_instructor_available, is_classroom_available and the
+    4-hours-per-day limit (which also bounds consecutive hours), so pruning is
+    done with mask operations. Sessions already in the schedule stay fixed.
+    With flexible room assignment a start stays in the domain while any of the
+    course's candidate rooms is free there, and each value also picks the room.
+
+    The search uses forward checking, most-constrained-first (MRV) variable
+    order and conflict-directed backjumping (FC-CBJ); with flexible rooms it
+    backtracks one session at a time instead, as the conflict sets don't record
+    which sessions filled a room pool. On top of forward
+    checking, every instructor, (fixed) room, cohort and course whose sessions lost
+    values is counted: if its unplaced sessions need more hours than their
+    domains still cover (for a course, at most 4 a day), the value fails
+    at once. Splits into 3-hour, then
+    2-hour, then 1-hour sessions are tried in turn. Every timetable can be
+    written with 1-hour sessions, so exhausting that split proves that no
+    complete schedule exists.
+    """
+    SPLITS = (("3-hour sessions", 3), ("2-hour sessions", 2), ("1-hour sessions", 1))
+
+    def __init__(self, schedule, node_limit=None, time_limit=None, cancel=None):
+        self.schedule = schedule
+        self.node_limit = node_limit
+        self.time_limit = time_limit
+        self.cancel = cancel  # A threading.Event (or anything with is_set()) that stops the search
+        self.nodes = 0
+
+    def solve(self):
+        """Search for a complete schedule and assign it.
+
+        Returns a dict whose "status" is "solved", "infeasible" (search space
+        exhausted: no complete schedule exists), "limit" (node or time limit
+        hit first) or "cancelled"; in the last two the schedule is left unchanged. On an empty schedule
+        analyze_feasibility runs first, and if its bound already rules out a
+        complete schedule the result is "infeasible" with no search and the
+        analysis "issues".
+        """
+        schedule = self.schedule
+        self.nodes = 0
+        self.deadline = time.perf_counter() + self.time_limit if self.time_limit is not None else None
+        
+        self.courses = []
+        skipped = []
+        for course in schedule.courses:
+            instructor, classroom, problem = schedule.get_course_resources(course)
+            if problem:
+                skipped.append(problem)
+            elif schedule.get_unscheduled_hours(course) > 0:
+                self.courses.append((course, instructor, classroom))
+        
+        # The bound counts every hour of every course, so it only applies before anything is placed
+        if all(schedule.get_unscheduled_hours(course) == course.hours_per_week for course in schedule.courses):
+            analysis = schedule.analyze_feasibility()
+            issues = [issue for issue in analysis["issues"] if issue["kind"] != "missing_resource"]
+            if issues:
+                culprit = schedule.courses_by_id[issues[0]["course_ids"][0]]
+                return {
+                    "status": "infeasible",
+                    "split": None,
+                    "nodes": 0,
+                    "skipped": skipped,
+                    "culprit": culprit.name,
+                    "issues": issues
+                }
+        
+        previous_sessions = None
+        for split_name, session_hours in self.SPLITS:
+            sessions = self._split_sessions(session_hours)
+            if sessions == previous_sessions:
+                continue
+            previous_sessions = sessions
+            
+            status, culprit = self._search(sessions)
+            if status == "infeasible":
+                continue
+            if status == "limit" and self.cancel is not None and self.cancel.is_set():
+                status = "cancelled"
+            
+            result = {"status": status, "split": split_name, "nodes": self.nodes, "skipped": skipped}
+            if status == "solved":
+                for var, (day_idx, start_hour, classroom) in enumerate(self.values):
+                    course, instructor, _, hours_duration = sessions[var]
+                    schedule.assign_slot(course, instructor, classroom, DAYS[day_idx], start_hour, hours_duration)
+            return result
+        
+        return {
+            "status": "infeasible",
+            "split": "1-hour sessions",
+            "nodes": self.nodes,
+            "skipped": skipped,
+            "culprit": culprit.name if culprit else None
+        }
+
+    def _split_sessions(self, session_hours):
+        sessions = []
+        for course, instructor, classroom in self.courses:
+            hours_left = self.schedule.get_unscheduled_hours(course)
+            while hours_left > 0:
+                hours_duration = min(session_hours, hours_left)
+                sessions.append((course, instructor, classroom, hours_duration))
+                hours_left -= hours_duration
+        return sessions
+
+    def _out_of_budget(self):
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            return True
+        if self.cancel is not None and self.cancel.is_set():
+            return True
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def _search(self, sessions):
+        """Run FC-CBJ over the sessions; returns (status, course that ended an infeasible search)"""
+        schedule = self.schedule
+        occupancy = schedule.occupancy
+        n = len(sessions)
+        
+        flexible = schedule.room_assignment == "flexible"
+        
+        # Rooms each session may take, in order of preference; with flexible rooms
+        # the hours they are taken, by bookings and by the search, per day
+        rooms = []
+        room_members = defaultdict(set)
+        room_busy = {}
+        for var, (course, _, classroom, _) in enumerate(sessions):
+            rooms.append(schedule.candidate_rooms(course) if flexible else [classroom])
+            if flexible:
+                for room in rooms[var]:
+                    room_members[room.id].add(var)
+                    for day_idx, day in enumerate(DAYS):
+                        room_busy[room.id, day_idx] = occupancy.room_mask(room.id, day)
+        
+        def room_starts(var, day_idx, wanted):
+            """The wanted start hours of a session where at least one of its rooms is free"""
+            hours_duration = sessions[var][3]
+            starts = 0
+            for room in rooms[var]:
+                starts |= wanted & ~overlapping_starts(room_busy[room.id, day_idx], hours_duration)
+                if starts == wanted:
+                    break
+            return starts
+        
+        # Static domains: instructor rules, fixed sessions and hours already used per day
+        hours_on_day = {}
+        for course, _, _ in self.courses:
+            hours_on_day[course] = [schedule.get_course_hours_on_day(course, day) for day in DAYS]
+        domains = []
+        for var, (course, instructor, classroom, hours_duration) in enumerate(sessions):
+            allowed = instructor.masks.allowed_starts(hours_duration)
+            domain = []
+            for day_idx, day in enumerate(DAYS):
+                busy = occupancy.instructor_mask(instructor.id, day)
+                if not flexible:
+                    busy |= occupancy.room_mask(classroom.id, day)
+                if schedule.cohort_conflicts == "hard":
+                    busy |= occupancy.cohort_mask(course_cohort(course), day)
+                mask = allowed[day_idx] & ~overlapping_starts(busy, hours_duration)
+                if flexible and mask:
+                    mask = room_starts(var, day_idx, mask)
+                if hours_on_day[course][day_idx] + hours_duration > 4:
+                    mask = 0
+                domain.append(mask)
+            domains.append(domain)
+        sizes = [sum(count_bits(mask) for mask in domain) for domain in domains]
+        
+        # Sessions that compete for the same instructor or room (a flexible room's
+        # sessions can move to another room, so they are neither counted nor neighbours)
+        by_resource = defaultdict(list)
+        for var, (course, instructor, classroom, _) in enumerate(sessions):
+            by_resource[("instructor", instructor.id)].append(var)
+            if not flexible:
+                by_resource[("room", classroom.id)].append(var)
+            by_resource[("course", course)].append(var)
+            if schedule.cohort_conflicts == "hard":
+                by_resource[("cohort", course_cohort(course))].append(var)
+        # Resources counted after an assignment; one of those with the same sessions is enough
+        resources = [[] for _ in range(n)]
+        counted = {}
+        for key, group in by_resource.items():
+            signature = (key[0] == "course", tuple(group))
+            if signature not in counted:
+                counted[signature] = key
+                for var in group:
+                    resources[var].append(key)
+        neighbours = [set() for _ in range(n)]
+        for group in by_resource.values():
+            for var in group:
+                neighbours[var].update(group)
+        neighbour_sets = [group - {var} for var, group in enumerate(neighbours)]
+        neighbours = [sorted(group) for group in neighbour_sets]
+        
+        degree = [len(group) for group in neighbours]
+        self.values = [None] * n
+        position = [None] * n  # Order in which assigned variables were assigned
+        conflict_set = [set() for _ in range(n)]
+        past_fc = [set() for _ in range(n)]  # Assigned variables that pruned each variable's domain
+        unassigned = set(range(n))
+        stack = []  # Frames: [var, candidate values (best last), reductions of the current value or None]
+        
+        def select():
+            if not unassigned:
+                return None
+            return min(unassigned, key=lambda var: (sizes[var], -sessions[var][3], -degree[var], var))
+        
+        def candidate_values(var):
+            course, instructor, _, hours_duration = sessions[var]
+            masks = instructor.masks
+            preferred = masks.preferred_starts(hours_duration)
+            values = []
+            for day_idx, mask in enumerate(domains[var]):
+                while mask:
+                    low_bit = mask & -mask
+                    mask ^= low_bit
+                    start_hour = HOURS[0] + low_bit.bit_length() - 1
+                    score = day_idx * 10 + (start_hour - 8)
+                    if masks.has_preferences and not preferred[day_idx] & low_bit:
+                        score += 100
+                    span = hour_mask(start_hour, start_hour + hours_duration)
+                    for rank, room in enumerate(rooms[var]):
+                        if flexible and room_busy[room.id, day_idx] & span:
+                            continue
+                        values.append((score, rank, day_idx, start_hour, room))
+            values.sort(reverse=True)
+            return [(day_idx, start_hour, room) for _, _, day_idx, start_hour, room in values]
+        
+        # Hours each session's domain can still cover, every day in one mask one day after the other
+        width = len(HOURS)
+        whole_day = (1 << width) - 1
+        
+        def coverage(var):
+            starts = 0
+            for day_idx, mask in enumerate(domains[var]):
+                starts |= mask << (day_idx * width)
+            covered = starts
+            for offset in range(1, sessions[var][3]):
+                covered |= starts << offset
+            return covered
+        
+        covers = [coverage(var) for var in range(n)]
+        saved_covers = [[] for _ in range(n)]  # Covers the current value of each variable changed
+        
+        def overloaded(key):
+            """The unplaced sessions of a resource need more hours than their domains cover"""
+            demand = 0
+            covered = 0
+            for var in by_resource[key]:
+                if self.values[var] is None:
+                    demand += sessions[var][3]
+                    covered |= covers[var]
+            if not demand:
+                return False
+            if key[0] != "course":
+                return demand > count_bits(covered)
+            if demand > count_bits(covered):
+                return True
+            free = 0
+            for day_idx, used in enumerate(hours_on_day[key[1]]):
+                day_covered = covered >> (day_idx * width) & whole_day
+                if day_covered:
+                    free += min(count_bits(day_covered), 4 - used)
+                    if free >= demand:
+                        return False
+            return True
+        
+        def overload_culprits(key):
+            """Assigned variables that the shortage of a resource depends on"""
+            culprits = set()
+            for var in by_resource[key]:
+                if self.values[var] is None:
+                    culprits |= past_fc[var]
+                elif key[0] == "course":
+                    culprits.add(var)  # Its hours count against the 4 hours a day
+            return culprits
+        
+        def undo(var, reductions):
+            for other, day_idx, removed in reductions:
+                domains[other][day_idx] |= removed
+                sizes[other] += count_bits(removed)
+                past_fc[other].discard(var)
+            for other, cover in saved_covers[var]:
+                covers[other] = cover
+            saved_covers[var] = []
+            day_idx, start_hour, room = self.values[var]
+            hours_on_day[sessions[var][0]][day_idx] -= sessions[var][3]
+            if flexible:
+                room_busy[room.id, day_idx] ^= hour_mask(start_hour, start_hour + sessions[var][3])
+            self.values[var] = None
+        
+        def assign(var, value):
+            """Assign and forward check; returns the reductions, or None after a domain wipe-out"""
+            course, _, _, hours_duration = sessions[var]
+            day_idx, start_hour, room = value
+            self.values[var] = value
+            hours_on_day[course][day_idx] += hours_duration
+            span = hour_mask(start_hour, start_hour + hours_duration)
+            reductions = []
+            
+            targets = neighbours[var]
+            if flexible:
+                room_busy[room.id, day_idx] |= span
+                targets = sorted(neighbour_sets[var] | room_members[room.id])
+            for other in targets:
+                if self.values[other] is not None:
+                    continue
+                other_course, _, _, other_hours = sessions[other]
+                domain = domains[other]
+                pruned = False
+                
+                new_mask = domain[day_idx]
+                if other in neighbour_sets[var]:
+                    new_mask &= ~overlapping_starts(span, other_hours)
+                if flexible and new_mask and other in room_members[room.id]:
+                    new_mask = room_starts(other, day_idx, new_mask)
+                if other_course is course:
+                    if hours_on_day[course][day_idx] + other_hours > 4:
+                        new_mask = 0
+                    if other_hours == hours_duration:
+                        # Symmetry breaking: equal sessions of a course are placed in increasing order
+                        if other > var:
+                            new_mask &= ~start_hour_mask(HOURS[0], start_hour)
+                            days = range(day_idx)
+                        else:
+                            new_mask &= ~start_hour_mask(start_hour, HOURS[-1])
+                            days = range(day_idx + 1, len(DAYS))
+                        for other_day in days:
+                            if domain[other_day]:
+                                reductions.append((other, other_day, domain[other_day]))
+                                sizes[other] -= count_bits(domain[other_day])
+                                domain[other_day] = 0
+                                pruned = True
+                removed = domain[day_idx] & ~new_mask
+                if removed:
+                    reductions.append((other, day_idx, removed))
+                    sizes[other] -= count_bits(removed)
+                    domain[day_idx] = new_mask
+                    pruned = True
+                
+                if pruned:
+                    past_fc[other].add(var)
+                    if sizes[other] == 0:
+                        conflict_set[var] |= past_fc[other]
+                        undo(var, reductions)
+                        return None
+            
+            # Count the resources that lost hours or sessions
+            keys = dict.fromkeys(resources[var])
+            for other in dict.fromkeys(other for other, _, _ in reductions):
+                saved_covers[var].append((other, covers[other]))
+                covers[other] = coverage(other)
+                keys.update(dict.fromkeys(resources[other]))
+            for key in keys:
+                if overloaded(key):
+                    conflict_set[var] |= overload_culprits(key)
+                    undo(var, reductions)
+                    return None
+            return reductions
+        
+        for key in counted.values():
+            if overloaded(key):
+                return "infeasible", sessions[by_resource[key][0]][0]
+        
+        var = select()
+        if var is None:
+            return "solved", None
+        stack.append([var, candidate_values(var), None])
+        unassigned.discard(var)
+        position[var] = 0
+        
+        while True:
+            frame = stack[-1]
+            var = frame[0]
+            if frame[2] is not None:
+                undo(var, frame[2])
+                frame[2] = None
+            if self._out_of_budget():
+                return "limit", None
+            
+            if not frame[1]:
+                # Every value failed: jump back to the latest variable responsible
+                culprits = (conflict_set[var] | past_fc[var]) - {var}
+                if flexible:
+                    # A start is lost to a full room pool by every session holding one of
+                    # its rooms, which the conflict sets don't record: step back one at a time
+                    culprits = {frame[0] for frame in stack[:-1]}
+                conflict_set[var] = set()
+                stack.pop()
+                unassigned.add(var)
+                position[var] = None
+                if not culprits:
+                    return "infeasible", sessions[var][0]
+                target = max(culprits, key=lambda other: position[other])
+                conflict_set[target] |= culprits - {target}
+                while stack[-1][0] != target:
+                    jumped, _, reductions = stack.pop()
+                    undo(jumped, reductions)
+                    conflict_set[jumped] = set()
+                    unassigned.add(jumped)
+                    position[jumped] = None
+                continue
+            
+            reductions = assign(var, frame[1].pop())
+            if reductions is None:
+                continue
+            frame[2] = reductions
+            self.nodes += 1
+            
+            next_var = select()
+            if next_var is None:
+                return "solved", None
+            unassigned.discard(next_var)
+            position[next_var] = len(stack)
+            stack.append([next_var, candidate_values(next_var), None])
+
+class DisjointSet:
+    """Union-find with path halving and union by size"""
+    def __init__(self, items=()):
+        self.parent = {}
+        self.size = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+    def groups(self):
+        """Items of each set, sets and items in the order they were added"""
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return list(groups.values())
+
+class FlowNetwork:
+    """Directed graph with edge capacities and Dinic's maximum flow algorithm.
+
+    Nodes are any hashable keys and are created by add_edge.
+    """
+    def __init__(self):
+        self.nodes = {}  # key -> node index
+        self.adjacent = []  # node index -> edge indexes
+        self.targets = []  # edge index -> node index; edge i ^ 1 is the reverse of edge i
+        self.capacities = []  # edge index -> remaining capacity
+
+    def _node(self, key):
+        index = self.nodes.get(key)
+        if index is None:
+            index = self.nodes[key] = len(self.adjacent)
+            self.adjacent.append([])
+        return index
+
+    def add_edge(self, source, target, capacity):
+        source, target = self._node(source), self._node(target)
+        self.adjacent[source].append(len(self.targets))
+        self.targets.append(target)
+        self.capacities.append(capacity)
+        self.adjacent[target].append(len(self.targets))
+        self.targets.append(source)
+        self.capacities.append(0)
+
+    def max_flow(self, source, sink):
+        if source not in self.nodes or sink not in self.nodes:
+            return 0
+        source, sink = self.nodes[source], self.nodes[sink]
+        adjacent, targets, capacities = self.adjacent, self.targets, self.capacities
+        flow = 0
+        while True:
+            # Breadth-first levels of the residual graph
+            level = [-1] * len(adjacent)
+            level[source] = 0
+            queue = [source]
+            for node in queue:
+                for edge in adjacent[node]:
+                    if capacities[edge] and level[targets[edge]] < 0:
+                        level[targets[edge]] = level[node] + 1
+                        queue.append(targets[edge])
+            if level[sink] < 0:
+                return flow
+            
+            # Blocking flow along level-increasing paths
+            next_edge = [0] * len(adjacent)
+            
+            def push(node, limit):
+                if node == sink:
+                    return limit
+                edges = adjacent[node]
+                while next_edge[node] < len(edges):
+                    edge = edges[next_edge[node]]
+                    target = targets[edge]
+                    if capacities[edge] and level[target] == level[node] + 1:
+                        pushed = push(target, min(limit, capacities[edge]))
+                        if pushed:
+                            capacities[edge] -= pushed
+                            capacities[edge ^ 1] += pushed
+                            return pushed
+                    next_edge[node] += 1
+                return 0
+            
+            while True:
+                pushed = push(source, float("inf"))
+                if not pushed:
+                    break
+                flow += pushed
+
+class Schedule:
+    def __init__(self, room_assignment="fixed", cohort_conflicts="off", objective=None):
+        if room_assignment not in ROOM_ASSIGNMENT_MODES:
+            raise ValueError(f"Unknown room assignment mode: {room_assignment}")
+        if cohort_conflicts not in COHORT_CONFLICT_MODES:
+            raise ValueError(f"Unknown cohort conflict mode: {cohort_conflicts}")
+        # How clashes between courses of the same major and section are treated (see COHORT_CONFLICT_MODES);
+        # "off" unless asked for, so schedules built without it come out as before
+        self.cohort_conflicts = cohort_conflicts
+        # Weighted terms of the slot score (see SlotObjective)
+        self.objective = objective or SlotObjective()
+        # "fixed": every session is held in the course's classroom_id;
+        # "flexible": the greedy pass may use any suitable room (see candidate_rooms)
+        self.room_assignment = room_assignment
+        self.courses = []
+        self.instructors = []
+        self.classrooms = []
+        self.days = list(DAYS)
+        self.hours = list(HOURS)  # 8 AM to 10 PM
+        self.occupancy = OccupancyGrid(self.days, self.hours)
+        self.validator = ScheduleValidator(self)
+        # Applied edits as (assigned, course, instructor, classroom, day, start_hour, hours_duration, index),
+        # where index is the session's position in course.assigned_slots, or InputChange for changes
+        # made through resolve_delta
+        self.history = []
+        self.redo_stack = []
+        # Current node in the tree of versions; history is always the path from the root to it
+        self.version = ScheduleVersion()
+        # SolverProfiler attached with enable_profiling(), if any
+        self.profiler = None
+        # Lookup indexes kept up to date by add_course / add_instructor / add_classroom
+        self.classrooms_by_id = {}
+        self.instructors_by_id = {}
+        self.courses_by_id = {}
+        self.courses_by_instructor = defaultdict(list)
+        self.courses_by_major = defaultdict(list)
+        # (course, day, start_hour, end_hour) -> classroom, for sessions held outside the course's classroom_id
+        self.session_rooms = {}
+        self._room_index = None
+        self._candidate_rooms = {}  # course -> ((name, student_count, classroom_id), rooms)
+
+    @property
+    def timetable(self):
+        """Schedule view derived from the occupancy grid: day -> hour -> room_id -> (course, instructor)"""
+        return self.occupancy.timetable
+        
+    def add_course(self, course):
+        self.courses.append(course)
+        self._index_course(course)
+        
+    def add_instructor(self, instructor):
+        self.instructors.append(instructor)
+        # The first entity added with an id wins, as with a linear search
+        self.instructors_by_id.setdefault(instructor.id, instructor)
+        instructor.masks  # Compile availability masks up front
+        
+    def add_classroom(self, classroom):
+        self.classrooms.append(classroom)
+        self.classrooms_by_id.setdefault(classroom.id, classroom)
+        self.invalidate_room_index()
+
+    def invalidate_room_index(self):
+        """Forget the room index and candidate rooms; call after changing a classroom directly"""
+        self._room_index = None
+        self._candidate_rooms.clear()
+
+    @property
+    def room_index(self):
+        if self._room_index is None:
+            self._room_index = RoomIndex(self.classrooms)
+        return self._room_index
+
+    def candidate_rooms(self, course):
+        """Suitable rooms for the course in order of preference.
+
+        The course's own classroom comes first if it is suitable, then every
+        other room that fits, smallest first. Found with a range query on
+        room_index and cached per course until the course or the rooms change.
+        """
+        key = (course.name, course.student_count, course.classroom_id)
+        cached = self._candidate_rooms.get(course)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        
+        room_type = "computer_lab" if needs_computer_lab(course.name) else None
+        rooms = self.room_index.rooms_with_capacity(course.student_count, room_type)
+        home = self.get_classroom(course.classroom_id)
+        if home is not None and self.check_classroom_capacity(course, home) and self.check_classroom_type(course, home):
+            rooms = [home] + [room for room in rooms if room is not home]
+        self._candidate_rooms[course] = (key, rooms)
+        return rooms
+
+    def session_classroom(self, course, day, start_hour, end_hour):
+        """Classroom an assigned session is held in"""
+        room = self.session_rooms.get((course, day, start_hour, end_hour))
+        return room if room is not None else self.get_classroom(course.classroom_id)
+
+    def courses_in_room(self, room_id):
+        """Courses with a session in the room or with it as their classroom_id"""
+        courses = dict.fromkeys(course for course in self.courses if course.classroom_id == room_id)
+        courses.update(dict.fromkeys(key[0] for key, room in self.session_rooms.items() if room.id == room_id))
+        return list(courses)
+
+    def first_free_room(self, rooms, day, start_hour, end_hour):
+        """First room of the list that is free for the whole slot (None if none is)"""
+        for room in rooms:
+            if self.occupancy.is_room_free(room.id, day, start_hour, end_hour):
+                return room
+        return None
+
+    def get_instructor(self, instructor_id):
+        """Look up an instructor by id (None if unknown)"""
+        return self.instructors_by_id.get(instructor_id)
+
+    def get_classroom(self, classroom_id):
+        """Look up a classroom by id (None if unknown)"""
+        return self.classrooms_by_id.get(classroom_id)
+
+    def get_course_instructor(self, course):
+        """Instructor teaching the course (None if unknown)"""
+        return self.instructors_by_id.get(course.instructor_id)
+
+    def get_instructor_courses(self, instructor_id):
+        """Courses taught by the instructor"""
+        return self.courses_by_instructor.get(instructor_id, [])
+
+    def get_major_courses(self, major):
+        """Courses offered for the major"""
+        return self.courses_by_major.get(major, [])
+
+    def cohort_clash_hours(self, major=None):
+        """Hours in which a cohort (major, section) has more than one class, counted once per extra class"""
+        clashes = 0
+        for (cohort_major, _), counts in self.occupancy.cohort_counts.items():
+            if major is None or cohort_major == major:
+                clashes += sum(count - 1 for day_counts in counts for count in day_counts if count > 1)
+        return clashes
+
+    def is_instructor_available(self, instructor, day, start_hour, end_hour):
+        """Check if instructor is available in the given time slot"""
+        masks = instructor.masks
+        day_idx = DAY_INDEX[day]
+        
+        # If not a preferred slot, apply restrictions
+        if not (masks.has_preferences and masks.is_preferred(day_idx, start_hour, end_hour)):
+            # Restrict to Monday-Friday (no weekends)
+            if day in WEEKEND_DAYS:
+                return False
+            
+            # Restrict to 8am-5pm
+            if start_hour < 8 or end_hour > 17:
+                return False
+        
+        # Check instructor unavailability
+        if masks.unavailable[day_idx] & hour_mask(start_hour, end_hour):
+            return False
+                    
+        # Check if instructor is already assigned to another course at this time
+        return self.occupancy.is_instructor_free(instructor.id, day, start_hour, end_hour)
+
+    def is_session_allowed(self, instructor, day, start_hour, end_hour):
+        """Check an already placed session against the instructor's current rules.
+
+        Every hour must be a weekday 8am-5pm hour or inside a preferred slot,
+        and none may be unavailable. Other bookings are not considered.
+        """
+        masks = instructor.masks
+        day_idx = DAY_INDEX[day]
+        slot_hours = hour_mask(start_hour, end_hour)
+        if masks.unavailable[day_idx] & slot_hours:
+            return False
+        if day in WEEKEND_DAYS:
+            restricted = slot_hours
+        else:
+            restricted = slot_hours & ~hour_mask(8, 17)
+        return not restricted & ~masks.preferred_hours[day_idx]
+
+    def is_classroom_available(self, classroom, day, start_hour, end_hour):
+        """Check if classroom is available in the given time slot"""
+        return self.occupancy.is_room_free(classroom.id, day, start_hour, end_hour)
+
+    def check_classroom_capacity(self, course, classroom):
+        """Check if classroom has enough capacity for the course"""
+        return classroom.capacity >= course.student_count
+
+    def check_classroom_type(self, course, classroom):   
+        """Check if classroom type is suitable for the course"""
+        # Implement specific logic for classroom type requirements
+        # This is a simplified example - you'd need to expand based on your requirements
+        if needs_computer_lab(course.name) and classroom.room_type != "computer_lab":
+            return False
+        return True
+
+    def get_course_hours_on_day(self, course, day):
+        """Get total hours already scheduled for this course on the given day"""
+        return course.assigned_slots.hours_on_day(DAY_INDEX[day])
+
+    def would_exceed_consecutive_hours(self, course, day, start_hour, hours_duration):
+        """Check if adding this slot would exceed 4 consecutive hours on a day"""
+        # The new session joins every run it touches, on either side
+        return course.assigned_slots.run_length_with(DAY_INDEX[day], start_hour, start_hour + hours_duration) > 4
+
+    def assign_slot(self, course, instructor, classroom, day, start_hour, hours_duration):
+        """Assign a course to a specific time slot"""
+        index = len(course.assigned_slots)
+        self._assign(course, instructor, classroom, day, start_hour, hours_duration)
+        self._record((True, course, instructor, classroom, day, start_hour, hours_duration, index))
+        return True
+
+    def unassign_slot(self, course, instructor, classroom, day, start_hour, hours_duration):
+        """Remove a session previously placed with assign_slot (False if it is not assigned)"""
+        end_hour = start_hour + hours_duration
+        if (day, start_hour, end_hour) not in course.assigned_slots:
+            return False
+        index = course.assigned_slots.index((day, start_hour, end_hour))
+        self._unassign(course, instructor, classroom, day, start_hour, hours_duration)
+        self._record((False, course, instructor, classroom, day, start_hour, hours_duration, index))
+        return True
+
+    def _record(self, edit):
+        self.history.append(edit)
+        self.version = ScheduleVersion(self.version, edit)
+        self.redo_stack.clear()
+
+    def _assign(self, course, instructor, classroom, day, start_hour, hours_duration, index=None):
+        end_hour = start_hour + hours_duration
+        self._place(course, instructor, classroom, day, start_hour, end_hour, index)
+        self.validator.slot_changed(course, instructor, classroom, day, start_hour, end_hour, assigned=True)
+
+    def _place(self, course, instructor, classroom, day, start_hour, end_hour, index=None):
+        # Mark the instructor and room busy (also fills the timetable view)
+        self.occupancy.occupy(course, instructor, classroom, day, start_hour, end_hour)
+        
+        # Update course's assigned slots, at the given position (undoing a removal) or at the end
+        if index is None:
+            course.assigned_slots.append((day, start_hour, end_hour))
+        else:
+            course.assigned_slots.insert(index, (day, start_hour, end_hour))
+        if classroom.id != course.classroom_id:
+            self.session_rooms[(course, day, start_hour, end_hour)] = classroom
+        
+        # Update instructor's assigned courses if not already assigned
+        instructor.add_assigned_course(course)
+
+    def _unassign(self, course, instructor, classroom, day, start_hour, hours_duration):
+        end_hour = start_hour + hours_duration
+        if (day, start_hour, end_hour) not in course.assigned_slots:
+            return False
+        
+        self.occupancy.release(course, instructor, classroom, day, start_hour, end_hour)
+        course.assigned_slots.remove((day, start_hour, end_hour))
+        self.session_rooms.pop((course, day, start_hour, end_hour), None)
+        
+        if not course.assigned_slots:
+            instructor.remove_assigned_course(course)
+        
+        self.validator.slot_changed(course, instructor, classroom, day, start_hour, end_hour, assigned=False)
+        return True
+
+    def _apply_edit(self, edit, forward):
+        if isinstance(edit, InputChange):
+            self._apply_input_change(edit, forward)
+            return
+        assigned, course, instructor, classroom, day, start_hour, hours_duration, index = edit
+        if assigned == forward:
+            # Undoing a removal puts the session back where it was, so the order of the sessions is kept
+            self._assign(course, instructor, classroom, day, start_hour, hours_duration, index)
+        else:
+            self._unassign(course, instructor, classroom, day, start_hour, hours_duration)
+
+    def undo(self):
+        """Revert the latest assign_slot / unassign_slot call (None if there is nothing to undo)"""
+        if not self.history:
+            return None
+        edit = self.history.pop()
+        self._apply_edit(edit, forward=False)
+        self.version = self.version.parent
+        self.redo_stack.append(edit)
+        return edit
+
+    def redo(self):
+        """Re-apply the latest undone edit (None if there is nothing to redo)"""
+        if not self.redo_stack:
+            return None
+        edit = self.redo_stack.pop()
+        self._apply_edit(edit, forward=True)
+        self.history.append(edit)
+        self.version = ScheduleVersion(self.version, edit)
+        return edit
+
+    def checkpoint(self):
+        """Marker for the current state that rollback() can return to"""
+        return len(self.history)
+
+    def rollback(self, checkpoint):
+        """Discard every edit made since the checkpoint (they cannot be redone)"""
+        while len(self.history) > checkpoint:
+            self._apply_edit(self.history.pop(), forward=False)
+            self.version = self.version.parent
+        self.redo_stack.clear()
+
+    def replay(self, edits):
+        """Apply a sequence of recorded edits, e.g. a slice of history taken before a rollback"""
+        for edit in edits:
+            self._apply_edit(edit, forward=True)
+            self._record(edit)
+
+    def snapshot(self):
+        """The current state as a ScheduleVersion that restore() can return to.
+
+        Taking a snapshot copies nothing: versions share the edit history
+        they have in common.
+        """
+        return self.version
+
+    def restore(self, snapshot):
+        """Move to the state of a snapshot, undoing and replaying only the edits that differ.
+
+        The snapshot may lie on another branch, e.g. one left by fork() or by
+        rolling back. The cost is the number of edits between the two states.
+        """
+        # Find the common ancestor before changing anything
+        current, target = self.version, snapshot
+        while current.depth > target.depth:
+            current = current.parent
+        while target.depth > current.depth:
+            target = target.parent
+        while current is not target:
+            current, target = current.parent, target.parent
+            if current is None:
+                raise ValueError("Snapshot does not belong to this schedule")
+        common = current
+        
+        while self.version is not common:
+            self._apply_edit(self.history.pop(), forward=False)
+            self.version = self.version.parent
+        
+        path = []
+        version = snapshot
+        while version is not common:
+            path.append(version.edit)
+            version = version.parent
+        for edit in reversed(path):
+            self._apply_edit(edit, forward=True)
+            self.history.append(edit)
+        self.version = snapshot
+        self.redo_stack.clear()
+
+    def fork(self, changes=None, release_neighbours=False, verbose=False):
+        """Try a what-if change on a branch of the current state, then come back.
+
+        The changes (see resolve_delta) are applied and repaired on a new
+        branch, the branch is scored, and the schedule is restored to where
+        it was. Only the branch's own edits are kept, so many branches can be
+        compared side by side; call restore() on one to adopt it.
+
+        Returns a dict with the branch "snapshot", the "base" snapshot, the
+        resolve_delta "result" and the branch's "total_penalty",
+        "unscheduled_hours" and "error_count".
+        """
+        base = self.snapshot()
+        try:
+            result = self.resolve_delta(changes or {}, release_neighbours=release_neighbours, verbose=verbose)
+            branch = {
+                "snapshot": self.snapshot(),
+                "base": base,
+                "result": result,
+                "total_penalty": self.total_penalty(),
+                "unscheduled_hours": sum(self.get_unscheduled_hours(course) for course in self.courses),
+                "error_count": self.validator.error_count
+            }
+        finally:
+            self.restore(base)
+        return branch
+
+    def calculate_slot_score(self, course, instructor, classroom, day, start_hour, hours_duration):
+        """Calculate a score for a potential time slot (lower is better), weighted by self.objective.
+
+        The slot may also be one of the course's assigned sessions, as in total_penalty.
+        """
+        objective = self.objective
+        weights = objective.weights
+        score = 0
+        day_index = DAY_INDEX[day]
+        
+        # Base score based on day and time
+        score += weights["earliness"] * (day_index * 10  # Earlier days are preferred
+                                         + (start_hour - 8))  # Earlier times are preferred
+        
+        # Penalty for not using instructor's preferred slots (for part-time)
+        masks = instructor.masks
+        if masks.has_preferences and not masks.is_preferred(DAY_INDEX[day], start_hour, start_hour + hours_duration):
+            score += weights["preference"]  # Heavy penalty for not using preferred slots
+        
+        # Spread the course, the instructor and the room use over the week
+        if objective.balances_load:
+            placed = (day, start_hour, start_hour + hours_duration) in course.assigned_slots
+            score += objective.day_cost(self, course, instructor, day_index, hours_duration, placed)
+            score += objective.room_load_cost(self, day_index, start_hour, hours_duration, placed)
+        if objective.extra_terms:
+            score += objective.extra_cost(self, course, instructor, classroom, day, start_hour, hours_duration)
+        
+        # Check for online/offline proximity
+        score += self.mode_switch_penalty(course, day, start_hour, hours_duration)
+        
+        # Penalty for hours the course's students already have another class
+        score += self.cohort_penalty(course, day, start_hour, hours_duration)
+        
+        # Add a high penalty for slots that would create more than 4 consecutive hours
+        if self.would_exceed_consecutive_hours(course, day, start_hour, hours_duration):
+            score += weights["consecutive"]
+        
+        return score
+
+    def cohort_penalty(self, course, day, start_hour, hours_duration):
+        """Penalty for hours of the slot taken by other courses of the same major and section"""
+        if self.cohort_conflicts != "weighted":
+            return 0
+        cohort = course_cohort(course)
+        span = hour_mask(start_hour, start_hour + hours_duration)
+        busy = self.occupancy.cohort_mask(cohort, day) & span
+        if not busy:
+            return 0
+        own = self._course_day_mask(course, DAY_INDEX[day]) & busy
+        clashes = count_bits(busy & ~own)
+        # In hours the course holds itself, only a second booking is another class
+        while own:
+            low_bit = own & -own
+            own ^= low_bit
+            if self.occupancy.cohort_count(cohort, day, self.hours[0] + low_bit.bit_length() - 1) > 1:
+                clashes += 1
+        return clashes * self.objective.weights["cohort"]
+
+    @staticmethod
+    def _course_day_mask(course, day_idx):
+        """Hours of the course's sessions on the day"""
+        mask = 0
+        for slot_start, slot_end in course.assigned_slots.runs_on_day(day_idx):
+            mask |= hour_mask(slot_start, slot_end)
+        return mask
+
+    def mode_switch_penalty(self, course, day, start_hour, hours_duration):
+        """Penalty for online/offline classes running in the hours around the slot"""
+        opposite = self.occupancy.opposite_mode_counts(day, course.is_online)
+        first_hour = self.occupancy.first_hour
+        switches = 0
+        for hour in range(start_hour, start_hour + hours_duration):
+            # Previous hour - if it exists and is a different mode (online/offline)
+            if hour > 8:
+                switches += opposite[hour - 1 - first_hour]
+            # Next hour - if it exists and is a different mode (online/offline)
+            if hour < 17:
+                switches += opposite[hour + 1 - first_hour]
+        return switches * self.objective.weights["mode_switch"]  # Penalty for switching between online/offline
+
+    def feasible_start_mask(self, course, instructor, classroom, day, hours_duration):
+        """Bitmask of start hours where a session passes every check generate_schedule applies.
+
+        Bit ``i`` stands for the start hour ``self.hours[0] + i``. This is the batched
+        equivalent of calling is_instructor_available, is_classroom_available and
+        would_exceed_consecutive_hours for every start hour of the day. With hard
+        cohort conflicts, starts that clash with the students' other classes are left out too.
+        """
+        allowed = self._instructor_start_mask(course, instructor, day, hours_duration)
+        if not allowed:
+            return 0
+        return allowed & ~overlapping_starts(self.occupancy.room_mask(classroom.id, day), hours_duration)
+
+    def any_room_start_mask(self, course, instructor, rooms, day, hours_duration):
+        """Bitmask of start hours where a session fits the instructor and at least one of the rooms.
+
+        The rooms are probed in order until every start the instructor allows
+        has a free room, so on a campus with spare rooms only the first few
+        are looked at.
+        """
+        allowed = self._instructor_start_mask(course, instructor, day, hours_duration)
+        if not allowed:
+            return 0
+        starts = 0
+        for room in rooms:
+            starts |= allowed & ~overlapping_starts(self.occupancy.room_mask(room.id, day), hours_duration)
+            if starts == allowed:
+                break
+        return starts
+
+    def _instructor_start_mask(self, course, instructor, day, hours_duration):
+        """Start hours allowed by the instructor's rules and bookings, the consecutive-hours limit
+        and, with hard cohort conflicts, the other classes of the course's students"""
+        day_idx = DAY_INDEX[day]
+        allowed = instructor.masks.allowed_starts(hours_duration)[day_idx]
+        if not allowed:
+            return 0
+        
+        # A start is blocked if any hour of the session is already busy
+        busy = self.occupancy.instructor_mask(instructor.id, day)
+        if self.cohort_conflicts == "hard":
+            busy |= self.occupancy.cohort_mask(course_cohort(course), day)
+        allowed &= ~overlapping_starts(busy, hours_duration)
+        
+        # Starts that would join existing runs into more than 4 consecutive hours.
+        # Overlapping starts are already blocked by the instructor's own bookings,
+        # so only sessions right after a run, right before one or bridging two count.
+        if hours_duration > 4:
+            return 0
+        runs = course.assigned_slots.runs_on_day(day_idx)
+        for i, (run_start, run_end) in enumerate(runs):
+            length = run_end - run_start + hours_duration
+            if i + 1 < len(runs) and runs[i + 1][0] - run_end == hours_duration:
+                length += runs[i + 1][1] - runs[i + 1][0]  # Fills the gap up to the next run
+            if length > 4:
+                allowed &= ~start_hour_mask(run_end, run_end)
+            if run_end - run_start + hours_duration > 4:
+                allowed &= ~start_hour_mask(run_start - hours_duration, run_start - hours_duration)
+        
+        return allowed
+
+    def find_best_slot(self, course, instructor, classroom, hours_per_session, rooms=None):
+        """Find the lowest scoring (day, start_hour, hours) slot for the next session of a course.
+
+        All start hours of a day are checked at once through feasible_start_mask and
+        scored with the same terms as calculate_slot_score. Ties go to the earliest
+        day and start hour, as with a stable sort of the candidates. Returns None if
+        no slot is free. If rooms is given the session may use any of them
+        instead of classroom (see any_room_start_mask and first_free_room).
+        """
+        first_hour = self.occupancy.first_hour
+        masks = instructor.masks
+        assigned_slots = course.assigned_slots
+        objective = self.objective
+        earliness = objective.weights["earliness"]
+        preference_penalty = objective.weights["preference"]
+        room_load = objective.weights["room_load"] if self.classrooms else 0
+        best = None
+        best_score = None
+        
+        for day_index, day in enumerate(self.days):
+            # Every slot on this day scores at least its earliness term, so nothing later can win
+            if best_score is not None and best_score <= earliness * day_index * 10:
+                break
+            
+            # Skip if adding more hours would exceed 4 hours on this day
+            remaining_hours = 4 - assigned_slots.hours_on_day(day_index)
+            if remaining_hours <= 0:
+                continue
+            this_session_hours = min(hours_per_session, remaining_hours)
+            
+            if rooms is None:
+                starts = self.feasible_start_mask(course, instructor, classroom, day, this_session_hours)
+            else:
+                starts = self.any_room_start_mask(course, instructor, rooms, day, this_session_hours)
+            if not starts:
+                continue
+            
+            preferred = masks.preferred_starts(this_session_hours)[day_index]
+            day_cost = objective.day_cost(self, course, instructor, day_index, this_session_hours)
+            if room_load:
+                # Sessions per hour, read once per day for the room_load term
+                hour_load = [online + offline for online, offline in
+                             zip(self.occupancy.online_counts[day_index], self.occupancy.offline_counts[day_index])]
+            
+            while starts:
+                low_bit = starts & -starts
+                starts ^= low_bit
+                offset = low_bit.bit_length() - 1
+                start_hour = first_hour + offset
+                
+                score = earliness * (day_index * 10 + (start_hour - 8)) + day_cost
+                if masks.has_preferences and not preferred & low_bit:
+                    score += preference_penalty  # Heavy penalty for not using preferred slots
+                if best_score is not None and score >= best_score:
+                    continue
+                score += self.mode_switch_penalty(course, day, start_hour, this_session_hours)
+                score += self.cohort_penalty(course, day, start_hour, this_session_hours)
+                if room_load:
+                    score += room_load * sum(hour_load[offset:offset + this_session_hours]) / len(self.classrooms)
+                if objective.extra_terms:
+                    score += objective.extra_cost(self, course, instructor, classroom, day, start_hour, this_session_hours)
+                if best_score is None or score < best_score:
+                    best = (day, start_hour, this_session_hours)
+                    best_score = score
+        
+        return best
+
+    def get_course_resources(self, course):
+        """Return (instructor, classroom, problem) for a course; problem explains why it cannot be scheduled"""
+        instructor = self.get_course_instructor(course)
+        if not instructor:
+            return None, None, f"No instructor found for course {course.name}"
+        
+        if self.room_assignment == "flexible":
+            rooms = self.candidate_rooms(course)
+            if not rooms:
+                return instructor, None, f"No suitable classroom found for course {course.name}"
+            return instructor, rooms[0], None
+        
+        classroom = self.get_classroom(course.classroom_id)
+        if not classroom:
+            return instructor, None, f"No classroom found for course {course.name}"
+        
+        if not self.check_classroom_capacity(course, classroom):
+            return instructor, classroom, f"Classroom {classroom.name} does not have enough capacity for course {course.name}"
+        
+        if not self.check_classroom_type(course, classroom):
+            return instructor, classroom, f"Classroom {classroom.name} type is not suitable for course {course.name}"
+        
+        return instructor, classroom, None
+
+    def generate_schedule(self, course_order=None, verbose=True, engine="greedy"):
+        """Generate an optimal schedule using a greedy algorithm.
+
+        course_order overrides the order in which courses are placed; verbose=False
+        silences the warnings about courses that could not be scheduled.
+        engine="backtracking" runs solve_backtracking() instead of the greedy pass,
+        and engine="partitioned" runs solve_partitioned().
+        """
+        if engine == "backtracking":
+            return self.solve_backtracking(verbose=verbose)
+        if engine == "partitioned":
+            return self.solve_partitioned(verbose=verbose)
+        if engine != "greedy":
+            raise ValueError(f"Unknown scheduling engine: {engine}")
+        
+        # Sort courses by priority (more hours per week first, then by student count)
+        if course_order is not None:
+            sorted_courses = course_order
+        else:
+            sorted_courses = self.priority_order()
+        
+        # For each course, find the best available slot
+        for course in sorted_courses:
+            # Get the instructor and classroom for this course and check the room is suitable
+            instructor, classroom, problem = self.get_course_resources(course)
+            if problem:
+                if verbose:
+                    print(f"Warning: {problem}")
+                continue
+            
+            self._place_course_hours(course, instructor, classroom, course.hours_per_week, verbose)
+
+    def find_slot_and_room(self, course, instructor, classroom, hours_per_session):
+        """find_best_slot plus the room to use: (day, start_hour, hours, classroom) or None.
+
+        With flexible room assignment every candidate room is considered and
+        the first free one in order of preference is taken.
+        """
+        if self.room_assignment == "fixed":
+            slot = self.find_best_slot(course, instructor, classroom, hours_per_session)
+            return slot + (classroom,) if slot else None
+        rooms = self.candidate_rooms(course)
+        slot = self.find_best_slot(course, instructor, classroom, hours_per_session, rooms=rooms)
+        if not slot:
+            return None
+        day, start_hour, hours_duration = slot
+        return day, start_hour, hours_duration, self.first_free_room(rooms, day, start_hour, start_hour + hours_duration)
+
+    def priority_order(self, courses=None):
+        """Courses in the greedy pass's order: more hours per week first, then more students"""
+        return sorted(self.courses if courses is None else courses,
+                      key=lambda x: (x.hours_per_week, x.student_count), reverse=True)
+
+    def _place_course_hours(self, course, instructor, classroom, hours_left, verbose=True, on_place=None):
+        """Greedily place hours_left more hours of a course, dividing them into sessions if needed.
+
+        on_place(course, instructor, classroom, day, start_hour, hours_duration)
+        is called for every session just before it is assigned.
+        Returns the hours that could not be placed.
+        """
+        # Limit single session to at most 4 hours (new constraint)
+        max_hours_per_session = min(4, hours_left)
+        hours_per_session = min(3, max_hours_per_session)  # Default remains 3 hours per session
+        
+        # Hours the instructor's rules leave for the course (see analyze_feasibility):
+        # sessions too long for what is left cannot be placed, so don't search for them
+        capacity_left = instructor.masks.weekly_course_hours
+        longest_day = max(instructor.masks.course_hours_per_day)
+        
+        while hours_left > 0:
+            if hours_per_session <= min(capacity_left, longest_day):
+                best_slot = self.find_slot_and_room(course, instructor, classroom, hours_per_session)
+            else:
+                best_slot = None
+            
+            # If we found a suitable slot, assign it
+            if best_slot:
+                best_day, best_start, best_duration, best_room = best_slot
+                if on_place is not None:
+                    on_place(course, instructor, best_room, best_day, best_start, best_duration)
+                self.assign_slot(course, instructor, best_room, best_day, best_start, best_duration)
+                hours_left -= best_duration
+                capacity_left -= best_duration
+            else:
+                # If no slots found, try with fewer hours per session
+                if self.profiler is not None:
+                    self.profiler.record_fallback(course, hours_per_session)
+                hours_per_session -= 1
+                if hours_per_session == 0:
+                    if verbose:
+                        print(f"Warning: Could not schedule all hours for course {course.name}. {hours_left} hours remaining.")
+                    break
+        return max(0, hours_left)
+
+    def solve_backtracking(self, node_limit=100000, time_limit=None, cancel=None, verbose=True):
+        """Place every remaining course hour with the complete BacktrackingSolver.
+
+        Unlike the greedy pass this finds a complete schedule whenever one
+        exists (within node_limit / time_limit), or reports that none does.
+        Setting the cancel event stops the search. Returns the solver's result dict.
+        """
+        result = BacktrackingSolver(self, node_limit=node_limit, time_limit=time_limit, cancel=cancel).solve()
+        if verbose:
+            for problem in result["skipped"]:
+                print(f"Warning: {problem}")
+            if result["status"] == "infeasible":
+                for issue in result.get("issues", ()):
+                    print(f"Warning: {issue['message']}")
+                print(f"Warning: No complete schedule exists (search ended at course {result['culprit']}).")
+            elif result["status"] == "limit":
+                print(f"Warning: Backtracking search stopped after {result['nodes']} nodes without a complete schedule.")
+            elif result["status"] == "cancelled":
+                print(f"Warning: Backtracking search cancelled after {result['nodes']} nodes.")
+        return result
+
+    def solve_anytime(self, time_limit=None, max_iterations=None, cancel=None, progress=None, progress_interval=0.5,
+                      local_search=True, method="annealing", seed=0):
+        """Place the remaining course hours within a budget, reporting progress, and keep whatever was found.
+
+        The budget is time_limit seconds of wall-clock time and/or
+        max_iterations, where every course the greedy pass tries and every
+        local search move is one iteration. cancel is a threading.Event (or
+        anything with is_set()) another thread can set to stop the solve.
+        Both are checked between courses and between moves. Budget left after
+        the greedy pass goes to optimize_schedule (unless local_search is
+        False), which ends on the best schedule it saw; with no budget only
+        the greedy pass runs.
+
+        progress(report) is called at most every progress_interval seconds
+        and once at the end. The report has the phase ("greedy" or
+        "local_search"), elapsed_seconds, iterations, courses_tried, courses,
+        placed_hours, unscheduled_hours and score, the total_penalty so far
+        (kept up to date from placement_cost deltas rather than recomputed).
+
+        Sessions placed before a stop stay in the schedule. Returns the final
+        report plus status ("complete" when no hours are left, else
+        "partial"), stop_reason (None, "time_limit", "iteration_limit" or
+        "cancelled"), the optimize_schedule result (or None) and "unplaced",
+        a diagnose_course() dict for every course with hours left. Courses the
+        greedy pass never got to are listed with the reason "not_attempted".
+        """
+        started = time.perf_counter()
+        deadline = started + time_limit if time_limit is not None else None
+        order = self.priority_order()
+        phase = "greedy"
+        iterations = courses_tried = 0
+        placed_hours = sum(self.get_scheduled_hours(course) for course in self.courses)
+        unscheduled_hours = sum(self.get_unscheduled_hours(course) for course in self.courses)
+        score = self.total_penalty()
+        next_report = started + progress_interval
+        
+        def stop_reason():
+            if cancel is not None and cancel.is_set():
+                return "cancelled"
+            if deadline is not None and time.perf_counter() >= deadline:
+                return "time_limit"
+            if max_iterations is not None and iterations >= max_iterations:
+                return "iteration_limit"
+            return None
+        
+        def report():
+            nonlocal placed_hours, unscheduled_hours
+            if phase == "local_search":
+                placed_hours = sum(self.get_scheduled_hours(course) for course in self.courses)
+                unscheduled_hours = sum(self.get_unscheduled_hours(course) for course in self.courses)
+            return {
+                "phase": phase,
+                "elapsed_seconds": time.perf_counter() - started,
+                "iterations": iterations,
+                "courses_tried": courses_tried,
+                "courses": len(order),
+                "placed_hours": placed_hours,
+                "unscheduled_hours": unscheduled_hours,
+                "score": score
+            }
+        
+        def maybe_report():
+            nonlocal next_report
+            if progress is not None and time.perf_counter() >= next_report:
+                progress(report())
+                next_report = time.perf_counter() + progress_interval
+        
+        def on_place(course, instructor, classroom, day, start_hour, hours_duration):
+            nonlocal score
+            score += self.placement_cost(course, instructor, classroom, day, start_hour, hours_duration)
+        
+        # The running score is only needed for progress reports
+        track_score = on_place if progress is not None else None
+        reason = None
+        for course in order:
+            reason = stop_reason()
+            if reason:
+                break
+            iterations += 1
+            courses_tried += 1
+            instructor, classroom, problem = self.get_course_resources(course)
+            hours_left = self.get_unscheduled_hours(course)
+            if hours_left and not problem:
+                # The last session may be longer than the hours left, so count what was actually placed
+                scheduled = self.get_scheduled_hours(course)
+                self._place_course_hours(course, instructor, classroom, hours_left, verbose=False, on_place=track_score)
+                placed_hours += self.get_scheduled_hours(course) - scheduled
+                placed_off = hours_left - self.get_unscheduled_hours(course)
+                unscheduled_hours -= placed_off
+                score -= placed_off * UNSCHEDULED_HOUR_PENALTY
+            maybe_report()
+        
+        search_result = None
+        if reason is None and local_search and (deadline is not None or max_iterations is not None):
+            phase = "local_search"
+            greedy_iterations = iterations
+            
+            def callback(moves, current_penalty):
+                nonlocal iterations, score
+                iterations = greedy_iterations + moves
+                score = current_penalty
+                maybe_report()
+                return stop_reason() is not None
+            
+            search_result = self.optimize_schedule(time_limit=None, seed=seed, method=method, callback=callback)
+            score = search_result["final_penalty"]
+            reason = stop_reason()
+        
+        result = report()
+        if phase == "greedy":
+            # placement_cost leaves out the consecutive-hours penalty a session can add to the
+            # course's neighbouring sessions, so the final score is computed in full
+            result["score"] = self.total_penalty()
+        if progress is not None:
+            progress(result)
+        unplaced = [self.diagnose_course(course) for course in order[:courses_tried]
+                    if self.get_unscheduled_hours(course)]
+        for course in order[courses_tried:]:
+            if self.get_unscheduled_hours(course):
+                unplaced.append({
+                    "course_id": course.id,
+                    "course": course.name,
+                    "unscheduled_hours": self.get_unscheduled_hours(course),
+                    "reason": "not_attempted",
+                    "message": f"The solve stopped before course {course.name} was tried"
+                })
+        result.update(
+            status="partial" if result["unscheduled_hours"] else "complete",
+            stop_reason=reason,
+            local_search=search_result,
+            unplaced=unplaced
+        )
+        return result
+
+    def diagnose_course(self, course):
+        """Why a course has unscheduled hours, as a JSON-ready dict.
+
+        The reason is "missing_resource" if get_course_resources() reports a
+        problem. Otherwise every 1-hour start of the week is checked against
+        the constraints in the order feasible_start_mask applies them, and
+        "rejections" counts the starts each one rules out (see
+        SolverProfiler.REJECTION_REASONS). The reason is the constraint that
+        rules out the most, or "free_slots" if some starts are still free
+        (the hours were never tried, or only longer sessions were).
+        """
+        diagnosis = {
+            "course_id": course.id,
+            "course": course.name,
+            "unscheduled_hours": self.get_unscheduled_hours(course)
+        }
+        instructor, classroom, problem = self.get_course_resources(course)
+        if problem:
+            diagnosis.update(reason="missing_resource", message=problem)
+            return diagnosis
+        
+        rooms = self.candidate_rooms(course) if self.room_assignment == "flexible" else [classroom]
+        occupancy = self.occupancy
+        cohort = course_cohort(course)
+        rejections = dict.fromkeys(SolverProfiler.REJECTION_REASONS, 0)
+        free_starts = 0
+        for day_idx, day in enumerate(self.days):
+            room_free = 0
+            for room in rooms:
+                room_free |= ~overlapping_starts(occupancy.room_mask(room.id, day), 1)
+            cohort_busy = occupancy.cohort_mask(cohort, day) if self.cohort_conflicts == "hard" else 0
+            remaining = start_hour_mask(8, 16)
+            for reason, passing in (
+                ("instructor_rules", instructor.masks.allowed_starts(1)[day_idx]),
+                ("instructor_busy", ~overlapping_starts(occupancy.instructor_mask(instructor.id, day), 1)),
+                ("room_busy", room_free),
+                ("cohort_busy", ~overlapping_starts(cohort_busy, 1)),
+                ("consecutive_hours", self._instructor_start_mask(course, instructor, day, 1))
+            ):
+                rejections[reason] += count_bits(remaining & ~passing)
+                remaining &= passing
+            free_starts += count_bits(remaining)
+        
+        if free_starts:
+            reason = "free_slots"
+            message = f"{free_starts} free 1-hour slots remain for course {course.name}"
+        else:
+            reason = max(rejections, key=rejections.get)
+            message = f"No free slot for course {course.name}, mostly because of {reason.replace('_', ' ')}"
+        diagnosis.update(reason=reason, message=message, free_starts=free_starts, rejections=rejections)
+        return diagnosis
+
+    def analyze_feasibility(self):
+        """Find demand that cannot be met before any search, and a lower bound on unscheduled hours.
+
+        Only the inputs are looked at, never the current assignments:
+            missing_resource - get_course_resources() reports a problem, so none of the course's hours fit
+            course_hours     - a course needs more hours than its instructor's rules allow a course
+                               (InstructorMasks.weekly_course_hours)
+            instructor_hours - an instructor's courses need more hours than the instructor can teach
+            room_hours       - (fixed rooms) the courses of a room need more hours than fit in it
+            room_pool        - (flexible rooms) the courses that need a room of some size or type
+                               need more room hours than the rooms that fit them have
+            cohort_hours     - (hard cohort conflicts) a cohort's courses need more hours than fit
+        The instructor, room and cohort checks are maximum flows from each
+        course through its days to the hours of the week its instructor
+        allows, where each hour can be used once (see _placeable_hours). The
+        room pool check counts room hours for every capacity threshold.
+
+        Every issue gives the hours that certainly cannot be placed. Courses
+        of different instructors (or rooms, or cohorts) never overlap, so
+        those shortfalls add up, and lower_bound_unscheduled_hours is the
+        missing resource hours plus the biggest of the instructor, room and
+        cohort totals. "feasible" is False if the bound is above 0.
+        """
+        issues = []
+        missing_hours = 0
+        schedulable = []
+        for course in self.courses:
+            instructor, classroom, problem = self.get_course_resources(course)
+            if problem:
+                issues.append({"kind": "missing_resource", "message": problem, "hours": course.hours_per_week,
+                               "course_ids": [course.id]})
+                missing_hours += course.hours_per_week
+                continue
+            schedulable.append((course, instructor))
+            weekly_hours = instructor.masks.weekly_course_hours
+            if course.hours_per_week > weekly_hours:
+                issues.append({
+                    "kind": "course_hours",
+                    "message": f"Course {course.name} needs {course.hours_per_week} hours a week but the rules of "
+                               f"instructor {instructor.name} leave room for {weekly_hours}",
+                    "hours": course.hours_per_week - weekly_hours,
+                    "course_ids": [course.id]
+                })
+        
+        def shortfalls(kind, groups, describe):
+            """Sum of the shortfalls of the groups, reporting those not explained by single courses"""
+            total = 0
+            for key, group in groups.items():
+                demand = sum(course.hours_per_week for course, _ in group)
+                shortfall = demand - self._placeable_hours(group)
+                if not shortfall:
+                    continue
+                total += shortfall
+                course_shortfall = sum(max(0, course.hours_per_week - instructor.masks.weekly_course_hours)
+                                       for course, instructor in group)
+                if shortfall > course_shortfall:
+                    issues.append({
+                        "kind": kind,
+                        "message": f"{describe(key)} has {demand} hours of courses but only {demand - shortfall} fit",
+                        "hours": shortfall,
+                        "course_ids": [course.id for course, _ in group]
+                    })
+            return total
+        
+        by_instructor = defaultdict(list)
+        by_room = defaultdict(list)
+        by_cohort = defaultdict(list)
+        for course, instructor in schedulable:
+            by_instructor[instructor].append((course, instructor))
+            by_room[course.classroom_id].append((course, instructor))
+            by_cohort[course_cohort(course)].append((course, instructor))
+        
+        bounds = [shortfalls("instructor_hours", by_instructor, lambda instructor: f"Instructor {instructor.name}")]
+        if self.room_assignment == "fixed":
+            bounds.append(shortfalls("room_hours", by_room,
+                                     lambda room_id: f"Room {self.get_classroom(room_id).name}"))
+        else:
+            bounds.append(self._room_pool_shortfall(schedulable, issues))
+        if self.cohort_conflicts == "hard":
+            bounds.append(shortfalls("cohort_hours", by_cohort,
+                                     lambda cohort: f"Students of {cohort[0]} section {cohort[1]}"))
+        
+        lower_bound = missing_hours + max(bounds)
+        return {
+            "feasible": lower_bound == 0,
+            "lower_bound_unscheduled_hours": lower_bound,
+            "demand_hours": sum(course.hours_per_week for course in self.courses),
+            "issues": issues
+        }
+
+    def _placeable_hours(self, group):
+        """Most hours of the (course, instructor) pairs that fit when no two of them may share an hour.
+
+        A maximum flow from each course (its weekly hours) through its days
+        (course_hours_per_day of its instructor) to the hours its instructor
+        allows, each hour used at most once.
+        """
+        network = FlowNetwork()
+        used_hours = set()
+        if len({id(instructor) for _, instructor in group}) == 1:
+            # One instructor: every course allows the same hours, so whole days will do
+            masks = group[0][1].masks
+            for day_idx, allowed in enumerate(masks.allowed_starts(1)):
+                if allowed:
+                    network.add_edge(("day", day_idx), "sink", count_bits(allowed))
+            for course_index, (course, _) in enumerate(group):
+                network.add_edge("source", ("course", course_index), course.hours_per_week)
+                for day_idx, day_hours in enumerate(masks.course_hours_per_day):
+                    if day_hours:
+                        network.add_edge(("course", course_index), ("day", day_idx), day_hours)
+            return network.max_flow("source", "sink")
+        
+        for course_index, (course, instructor) in enumerate(group):
+            masks = instructor.masks
+            network.add_edge("source", ("course", course_index), course.hours_per_week)
+            for day_idx, allowed in enumerate(masks.allowed_starts(1)):
+                if not allowed:
+                    continue
+                network.add_edge(("course", course_index), ("course_day", course_index, day_idx),
+                                 masks.course_hours_per_day[day_idx])
+                for hour_idx in range(len(self.hours)):
+                    if allowed >> hour_idx & 1:
+                        network.add_edge(("course_day", course_index, day_idx), ("hour", day_idx, hour_idx), 1)
+                        used_hours.add((day_idx, hour_idx))
+        for day_idx, hour_idx in used_hours:
+            network.add_edge(("hour", day_idx, hour_idx), "sink", 1)
+        return network.max_flow("source", "sink")
+
+    def _room_pool_shortfall(self, schedulable, issues):
+        """Flexible rooms: the worst shortfall of room hours over the capacity thresholds.
+
+        The courses with at least k students can only use rooms that seat
+        k or more, for at most the hours any of their instructors allows. The
+        same holds within the computer labs for the courses that need one.
+        """
+        worst = 0
+        lab_courses = [pair for pair in schedulable if needs_computer_lab(pair[0].name)]
+        for label, room_type, group in (("rooms", None, schedulable), ("computer labs", "computer_lab", lab_courses)):
+            demand = 0
+            allowed = [0] * len(self.days)
+            worst_issue = None
+            group = sorted(group, key=lambda pair: pair[0].student_count, reverse=True)
+            for position, (course, instructor) in enumerate(group):
+                demand += course.hours_per_week
+                allowed = [day_mask | day_allowed
+                           for day_mask, day_allowed in zip(allowed, instructor.masks.allowed_starts(1))]
+                if position + 1 < len(group) and group[position + 1][0].student_count == course.student_count:
+                    continue  # Take every course with the same student count together
+                rooms = len(self.room_index.rooms_with_capacity(course.student_count, room_type))
+                supply = rooms * sum(count_bits(day_mask) for day_mask in allowed)
+                if demand - supply > worst:
+                    worst = demand - supply
+                    worst_issue = {
+                        "kind": "room_pool",
+                        "message": f"Courses of {course.student_count} or more students need {demand} hours in "
+                                   f"{label} but the {rooms} {label} that seat them have {supply} usable hours",
+                        "hours": demand - supply,
+                        "course_ids": [pair[0].id for pair in group[:position + 1]]
+                    }
+            if worst_issue is not None:
+                issues.append(worst_issue)
+        return worst
+
+    def resolve_delta(self, changes, release_neighbours=False, verbose=True):
+        """Apply a small change to the inputs and repair only the sessions it affects.
+
+        changes is a dict with any of these keys:
+            "courses": {course_id: {attribute: value}}, e.g. {7: {"hours_per_week": 4}}
+            "instructors": {instructor_id: {attribute: value}}, e.g. new unavailable_slots
+            "classrooms": {room_id: {attribute: value}}
+            "add_courses", "add_instructors", "add_classrooms": lists of new entities
+            "remove_courses": list of course ids
+
+        Released sessions are those the instructor's new rules no longer allow,
+        all sessions of a course whose instructor, room, size, name or mode
+        changed or whose room no longer suits it, and the latest sessions of a
+        course whose hours_per_week went down. With release_neighbours=True,
+        sessions sharing the instructor or room of a released session and
+        touching its hours are released too, so they can move. Every other
+        session stays pinned. The affected courses are then topped up with the
+        greedy pass in its usual priority order. Input changes are recorded in
+        the history as InputChange edits next to the slot edits, so the whole
+        repair can be undone, rolled back or branched with fork().
+
+        Returns a dict with the "released" and "placed" sessions as
+        (course_id, day, start_hour, end_hour) and the "unscheduled_hours" left
+        on the affected courses.
+        """
+        released = []
+        affected = {}  # id(course) -> course
+        
+        def release(course, instructor, classroom, day, start_hour, end_hour):
+            if self.unassign_slot(course, instructor, classroom, day, start_hour, end_hour - start_hour):
+                released.append((course, instructor, classroom, day, start_hour, end_hour))
+            affected[id(course)] = course
+        
+        def release_all(course):
+            instructor = self.get_course_instructor(course)
+            for day, start_hour, end_hour in list(course.assigned_slots):
+                release(course, instructor, self.session_classroom(course, day, start_hour, end_hour),
+                        day, start_hour, end_hour)
+        
+        for classroom in changes.get("add_classrooms", ()):
+            self._change_input(InputChange("add_classroom", classroom))
+        for instructor in changes.get("add_instructors", ()):
+            self._change_input(InputChange("add_instructor", instructor))
+        
+        for course_id in changes.get("remove_courses", ()):
+            course = self._changed_entity(self.courses_by_id, course_id, "course")
+            release_all(course)
+            affected.pop(id(course), None)
+            self._change_input(InputChange("remove_course", course, old=self.courses.index(course)))
+        
+        # Course edits are applied first, while the sessions still use the old instructor and room
+        for course_id, updates in changes.get("courses", {}).items():
+            course = self._changed_entity(self.courses_by_id, course_id, "course")
+            if "id" in updates or "assigned_slots" in updates:
+                raise ValueError("Course ids and assigned slots cannot be changed through resolve_delta")
+            if updates.keys() & {"instructor_id", "classroom_id", "student_count", "name", "is_online", "major", "section"}:
+                release_all(course)
+            elif updates.get("hours_per_week", course.hours_per_week) < course.hours_per_week:
+                instructor = self.get_course_instructor(course)
+                while course.assigned_slots and self.get_scheduled_hours(course) > updates["hours_per_week"]:
+                    day, start_hour, end_hour = course.assigned_slots[-1]
+                    release(course, instructor, self.session_classroom(course, day, start_hour, end_hour),
+                            day, start_hour, end_hour)
+            
+            for name, value in updates.items():
+                self._change_input(InputChange("set", course, name, getattr(course, name), value))
+            affected[id(course)] = course
+        
+        for instructor_id, updates in changes.get("instructors", {}).items():
+            instructor = self._changed_entity(self.instructors_by_id, instructor_id, "instructor")
+            if "id" in updates:
+                raise ValueError("Instructor ids cannot be changed through resolve_delta")
+            for name, value in updates.items():
+                self._change_input(InputChange("set", instructor, name, self._input_value(getattr(instructor, name)), value))
+            for course in self.get_instructor_courses(instructor_id):
+                for day, start_hour, end_hour in list(course.assigned_slots):
+                    if not self.is_session_allowed(instructor, day, start_hour, end_hour):
+                        release(course, instructor, self.session_classroom(course, day, start_hour, end_hour),
+                                day, start_hour, end_hour)
+        
+        for room_id, updates in changes.get("classrooms", {}).items():
+            classroom = self._changed_entity(self.classrooms_by_id, room_id, "classroom")
+            if "id" in updates:
+                raise ValueError("Classroom ids cannot be changed through resolve_delta")
+            for name, value in updates.items():
+                self._change_input(InputChange("set", classroom, name, getattr(classroom, name), value))
+            # Release the sessions held in the room that no longer fit it
+            for course in self.courses_in_room(room_id):
+                instructor = self.get_course_instructor(course)
+                for day, start_hour, end_hour in list(course.assigned_slots):
+                    room = self.session_classroom(course, day, start_hour, end_hour)
+                    if room is classroom and not (self.check_classroom_capacity(course, room) and
+                                                  self.check_classroom_type(course, room)):
+                        release(course, instructor, room, day, start_hour, end_hour)
+        
+        for course in changes.get("add_courses", ()):
+            self._change_input(InputChange("add_course", course))
+            affected[id(course)] = course
+        
+        if release_neighbours:
+            for _, instructor, classroom, day, start_hour, end_hour in list(released):
+                neighbours = dict.fromkeys(self.get_instructor_courses(instructor.id))
+                neighbours.update(dict.fromkeys(self.courses_in_room(classroom.id)))
+                for course in neighbours:
+                    for slot_day, slot_start, slot_end in list(course.assigned_slots):
+                        if slot_day == day and slot_start <= end_hour and slot_end >= start_hour:
+                            release(course, self.get_course_instructor(course),
+                                    self.session_classroom(course, slot_day, slot_start, slot_end),
+                                    slot_day, slot_start, slot_end)
+        
+        # Re-place the missing hours of every affected course, pinning all other sessions
+        checkpoint = self.checkpoint()
+        unscheduled_hours = 0
+        for course in self.priority_order(affected.values()):
+            hours_left = self.get_unscheduled_hours(course)
+            if not hours_left:
+                continue
+            instructor, classroom, problem = self.get_course_resources(course)
+            if problem:
+                if verbose:
+                    print(f"Warning: {problem}")
+                unscheduled_hours += hours_left
+                continue
+            unscheduled_hours += self._place_course_hours(course, instructor, classroom, hours_left, verbose)
+        
+        return {
+            "released": [(course.id, day, start_hour, end_hour) for course, _, _, day, start_hour, end_hour in released],
+            "placed": [
+                (course.id, day, start_hour, start_hour + hours_duration)
+                for assigned, course, _, _, day, start_hour, hours_duration, _ in self.history[checkpoint:]
+                if assigned
+            ],
+            "unscheduled_hours": unscheduled_hours
+        }
+
+    def _change_input(self, change):
+        self._apply_input_change(change, forward=True)
+        self._record(change)
+
+    @staticmethod
+    def _input_value(value):
+        # Slot lists are owned by their instructor, so keep a plain copy for undo
+        return list(value) if isinstance(value, list) else value
+
+    def _apply_input_change(self, change, forward):
+        entity = change.entity
+        kind = change.kind
+        if kind == "set":
+            self._set_input_attribute(entity, change.name, change.new if forward else change.old)
+        elif kind == "add_course":
+            if forward:
+                self.add_course(entity)
+            else:
+                self._remove_course(entity)
+        elif kind == "remove_course":
+            if forward:
+                self._remove_course(entity)
+            else:
+                self.courses.insert(change.old, entity)
+                self._index_course(entity)
+        elif kind == "add_instructor":
+            if forward:
+                self.add_instructor(entity)
+            else:
+                self.instructors.remove(entity)
+                self._unindex(self.instructors_by_id, self.instructors, entity)
+        elif kind == "add_classroom":
+            if forward:
+                self.add_classroom(entity)
+            else:
+                self.classrooms.remove(entity)
+                self._unindex(self.classrooms_by_id, self.classrooms, entity)
+                self.invalidate_room_index()
+        else:
+            raise ValueError(f"Unknown input change: {kind}")
+
+    def _set_input_attribute(self, entity, name, value):
+        if isinstance(entity, Course):
+            if name == "instructor_id":
+                self.courses_by_instructor[entity.instructor_id].remove(entity)
+                self.courses_by_instructor[value].append(entity)
+            elif name == "major":
+                self.courses_by_major[entity.major].remove(entity)
+                self.courses_by_major[value].append(entity)
+            setattr(entity, name, self._input_value(value))
+            self.validator.check_course(entity)
+        elif isinstance(entity, Instructor):
+            setattr(entity, name, self._input_value(value))
+            # Sessions that stay may have changed their restricted-slot status
+            for course in self.get_instructor_courses(entity.id):
+                for day, start_hour, end_hour in course.assigned_slots:
+                    room_id = self.session_classroom(course, day, start_hour, end_hour).id
+                    for hour in range(start_hour, end_hour):
+                        self.validator._check_hour(course, entity, room_id, day, hour)
+        else:
+            setattr(entity, name, self._input_value(value))
+            self.invalidate_room_index()
+
+    def _remove_course(self, course):
+        self.courses.remove(course)
+        self.courses_by_instructor[course.instructor_id].remove(course)
+        self.courses_by_major[course.major].remove(course)
+        self._unindex(self.courses_by_id, self.courses, course)
+        self.validator._set(("course_hours", course.id), None)
+
+    def _index_course(self, course):
+        self.courses_by_id.setdefault(course.id, course)
+        self.courses_by_instructor[course.instructor_id].append(course)
+        self.courses_by_major[course.major].append(course)
+        self.validator.check_course(course)
+
+    @staticmethod
+    def _unindex(index, entities, entity):
+        """Drop entity from an id index, falling back to the next entity with the same id"""
+        if index.get(entity.id) is entity:
+            del index[entity.id]
+            for other in entities:
+                if other.id == entity.id:
+                    index[other.id] = other
+                    break
+
+    @staticmethod
+    def _changed_entity(index, entity_id, kind):
+        entity = index.get(entity_id)
+        if entity is None:
+            raise ValueError(f"Unknown {kind} in changes: {entity_id}")
+        return entity
+
+    def enable_profiling(self, profiler=None):
+        """Attach a SolverProfiler (a new one by default) and return it"""
+        if self.profiler is not None:
+            return self.profiler
+        return (profiler or SolverProfiler()).attach(self)
+
+    def disable_profiling(self):
+        """Detach the current profiler and return it (None if profiling was off)"""
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.detach()
+        return profiler
+
+    def to_problem(self, courses=None):
+        """Compact, picklable description of the inputs (rooms, instructors, courses) without assignments.
+
+        Given a list of courses, only those courses and the instructors and
+        rooms they can use (see problem_resources) are described.
+        """
+        if courses is None:
+            courses, instructors, classrooms = self.courses, self.instructors, self.classrooms
+        else:
+            instructors, classrooms = self.problem_resources(courses)
+        return {
+            "room_assignment": self.room_assignment,
+            "cohort_conflicts": self.cohort_conflicts,
+            "objective": dict(self.objective.weights),  # Terms added with add_term are not included
+            "classrooms": [(c.id, c.name, c.capacity, c.room_type) for c in classrooms],
+            "instructors": [
+                (i.id, i.name, i.is_part_time, tuple(i.unavailable_slots), tuple(i.preferred_slots))
+                for i in instructors
+            ],
+            "courses": [
+                (c.id, c.name, c.section, c.major, c.instructor_id, c.classroom_id,
+                 c.hours_per_week, c.student_count, c.is_online, c.department)
+                for c in courses
+            ]
+        }
+
+    def problem_resources(self, courses):
+        """(instructors, classrooms) the courses can use, in schedule order.
+
+        With flexible room assignment every classroom is included.
+        """
+        instructor_ids = {course.instructor_id for course in courses}
+        instructors = [instructor for instructor in self.instructors if instructor.id in instructor_ids]
+        if self.room_assignment == "flexible":
+            return instructors, self.classrooms
+        room_ids = {course.classroom_id for course in courses}
+        return instructors, [room for room in self.classrooms if room.id in room_ids]
+
+    @classmethod
+    def from_problem(cls, problem):
+        """Build an empty schedule from the output of to_problem()"""
+        schedule = cls(room_assignment=problem.get("room_assignment", "fixed"),
+                       cohort_conflicts=problem.get("cohort_conflicts", "off"),
+                       objective=SlotObjective(problem.get("objective")))
+        for room in problem["classrooms"]:
+            schedule.add_classroom(Classroom(*room))
+        for instructor_id, name, is_part_time, unavailable_slots, preferred_slots in problem["instructors"]:
+            instructor = Instructor(instructor_id, name, is_part_time)
+            instructor.unavailable_slots = list(unavailable_slots)
+            instructor.preferred_slots = list(preferred_slots)
+            schedule.add_instructor(instructor)
+        for course in problem["courses"]:
+            schedule.add_course(Course(*course))
+        # Hours kept free for other partitions (see solve_partitioned)
+        for reservation in problem.get("reservations", ()):
+            schedule.occupancy.reserve(*reservation)
+        return schedule
+
+    def get_assignments(self):
+        """Assigned sessions as compact (course index, day index, start_hour, hours, classroom index) tuples"""
+        room_indexes = {id(room): i for i, room in enumerate(self.classrooms)}
+        return [
+            (course_index, DAY_INDEX[day], start_hour, end_hour - start_hour,
+             room_indexes[id(self.session_classroom(course, day, start_hour, end_hour))])
+            for course_index, course in enumerate(self.courses)
+            for day, start_hour, end_hour in course.assigned_slots
+        ]
+
+    def apply_assignments(self, assignments):
+        """Assign sessions given in the format returned by get_assignments().
+
+        The classroom index may be left out, for the course's own classroom.
+        """
+        for course_index, day_idx, start_hour, hours_duration, *room in assignments:
+            course = self.courses[course_index]
+            instructor, classroom, _ = self.get_course_resources(course)
+            if room:
+                classroom = self.classrooms[room[0]]
+            self.assign_slot(course, instructor, classroom, DAYS[day_idx], start_hour, hours_duration)
+
+    def load_assignments(self, assignments):
+        """Assign sessions given in the get_assignments() format as the schedule's starting state.
+
+        Unlike apply_assignments no history is recorded, and the validator is
+        rebuilt once at the end instead of after every session.
+        """
+        for course_index, day_idx, start_hour, hours_duration, *room in assignments:
+            course = self.courses[course_index]
+            classroom = self.classrooms[room[0]] if room else self.get_classroom(course.classroom_id)
+            self._place(course, self.get_course_instructor(course), classroom,
+                        DAYS[day_idx], start_hour, start_hour + hours_duration)
+        self.validator.rebuild()
 
-class Schedule:
-    def __init__(self):
-        self.courses = []
-        self.instructors = []
-        self.classrooms = []
-        self.days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        self.hours = list(range(8, 22))  # 8 AM to 10 PM
-        # Schedule representation: day -> hour -> room_id -> (course, instructor)
-        self.timetable = {day: {hour: {} for hour in self.hours} for day in self.days}
+    def clear_assignments(self):
+        """Remove every assigned session"""
+        for course in self.courses:
+            instructor = self.get_course_instructor(course)
+            for day, start_hour, end_hour in list(course.assigned_slots):
+                classroom = self.session_classroom(course, day, start_hour, end_hour)
+                self.unassign_slot(course, instructor, classroom, day, start_hour, end_hour - start_hour)
+
+    def solve_parallel(self, n_workers=None, n_starts=None, seed=0, local_search_iterations=0):
+        """Run many perturbed greedy orderings in a process pool and keep the best schedule.
+
+        The problem is sent to each worker process once; each start only
+        sends back its compact assignments. Start 0 uses the normal greedy
+        order, so the result is never worse than generate_schedule(). Every
+        start can optionally be followed by local_search_iterations of
+        optimize_schedule. The best start has the fewest unscheduled hours,
+        then the lowest total_penalty. Its sessions replace any current
+        assignments of this schedule.
+
+        Returns a dict describing the best start and a summary of every start.
+        """
+        n_workers = n_workers or os.cpu_count() or 1
+        n_starts = n_starts or n_workers * 4
+        problem = self.to_problem()
         
-    def add_course(self, course):
-        self.courses.append(course)
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_parallel_worker,
+                                 initargs=(problem,)) as executor:
+            futures = [
+                executor.submit(_run_parallel_start, start_index, seed, local_search_iterations)
+                for start_index in range(n_starts)
+            ]
+            results = [future.result() for future in futures]
         
-    def add_instructor(self, instructor):
-        self.instructors.append(instructor)
+        best = min(results, key=lambda result: (result["unscheduled_hours"], result["total_penalty"], result["start"]))
+        self.clear_assignments()
+        self.apply_assignments(best["assignments"])
         
-    def add_classroom(self, classroom):
-        self.classrooms.append(classroom)
+        return {
+            "best_start": best["start"],
+            "unscheduled_hours": best["unscheduled_hours"],
+            "total_penalty": best["total_penalty"],
+            "starts": [
+                {key: result[key] for key in ("start", "unscheduled_hours", "total_penalty")}
+                for result in results
+            ]
+        }
 
-    def is_instructor_available(self, instructor, day, start_hour, end_hour):
-        """Check if instructor is available in the given time slot"""
-        # Check if the slot is a preferred slot for this instructor
-        is_preferred_slot = False
-        if instructor.is_part_time and instructor.preferred_slots:
-            for pref_day, pref_start, pref_end in instructor.preferred_slots:
-                if day == pref_day and start_hour >= pref_start and end_hour <= pref_end:
-                    is_preferred_slot = True
-                    break
-        
-        # If not a preferred slot, apply restrictions
-        if not is_preferred_slot:
-            # Restrict to Monday-Friday (no weekends)
-            if day in ["Saturday", "Sunday"]:
-                return False
-            
-            # Restrict to 8am-5pm
-            if start_hour < 8 or end_hour > 17:
-                return False
+    def course_department(self, course):
+        """Department the course is solved with by solve_partitioned: its department, else its major"""
+        return course.department if course.department is not None else course.major
+
+    def connected_components(self):
+        """Groups of courses linked by a shared instructor, classroom or (unless cohort conflicts are off) cohort.
+
+        Courses of different components never compete for a resource, so each
+        component can be solved on its own. With flexible room assignment
+        classrooms do not link courses, since almost any course could use
+        almost any room; solve_partitioned shares them through reservations.
+        """
+        components = DisjointSet(range(len(self.courses)))
+        first_course = {}  # resource -> index of the first course that uses it
+        for course_index, course in enumerate(self.courses):
+            resources = [("instructor", course.instructor_id)]
+            if self.room_assignment == "fixed":
+                resources.append(("room", course.classroom_id))
+            if self.cohort_conflicts != "off":
+                resources.append(("cohort", course_cohort(course)))
+            for resource in resources:
+                components.union(first_course.setdefault(resource, course_index), course_index)
+        return [[self.courses[course_index] for course_index in group] for group in components.groups()]
+
+    def partition(self, max_part_size=None):
+        """Split the courses into parts that are solved separately.
+
+        Connected components stay whole unless they have more than
+        max_part_size courses and more than one department; those are split
+        by department. The pieces are then packed, biggest first, into parts
+        of up to max_part_size courses (one part if max_part_size is None).
+        Returns (parts, number of components that were split).
+        """
+        pieces = []
+        split_components = 0
+        for component in self.connected_components():
+            departments = defaultdict(list)
+            for course in component:
+                departments[self.course_department(course)].append(course)
+            if max_part_size is None or len(component) <= max_part_size or len(departments) == 1:
+                pieces.append(component)
+            else:
+                pieces.extend(departments.values())
+                split_components += 1
         
-        # Check instructor unavailability
-        for unavail_day, unavail_start, unavail_end in instructor.unavailable_slots:
-            if day == unavail_day:
-                # Check if time ranges overlap
-                if not (end_hour <= unavail_start or start_hour >= unavail_end):
-                    return False
-                    
-        # Check if instructor is already assigned to another course at this time
-        for hour in range(start_hour, end_hour):
-            for room_id in self.timetable[day][hour]:
-                if self.timetable[day][hour][room_id] is not None:
-                    course_at_slot, instructor_at_slot = self.timetable[day][hour][room_id]
-                    if instructor_at_slot.id == instructor.id:
-                        return False
+        parts = []
+        for piece in sorted(pieces, key=len, reverse=True):
+            if not parts or (max_part_size is not None and len(parts[-1]) + len(piece) > max_part_size):
+                parts.append([])
+            parts[-1].extend(piece)
+        return parts, split_components
+
+    def part_reservations(self, parts):
+        """Divide the instructors and rooms that several parts use between those parts.
+
+        Every day of a shared resource is cut into RESERVATION_BLOCKS, and
+        each block goes to the part with the most hours on the resource per
+        hour it has been given so far, so parts get blocks in proportion to
+        their demand, spread over the week. With flexible room assignment
+        only instructors are divided: cutting every room of the pool into
+        blocks leaves too little of each, while sessions that end up in the
+        same room are cheap to repair with the rest of the pool free. With
+        hard cohort conflicts the cohorts' hours are divided as well.
+        Returns for each part the (kind, id, day_idx, start_hour, end_hour)
+        blocks it must keep free for the other parts.
+        """
+        demand = defaultdict(lambda: defaultdict(float))  # (kind, id) -> part index -> hours
+        for part_index, part in enumerate(parts):
+            for course in part:
+                demand[("instructor", course.instructor_id)][part_index] += course.hours_per_week
+                if self.room_assignment == "fixed":
+                    demand[("room", course.classroom_id)][part_index] += course.hours_per_week
+                if self.cohort_conflicts == "hard":
+                    demand[("cohort", course_cohort(course))][part_index] += course.hours_per_week
         
-        return True
+        reservations = [[] for _ in parts]
+        for (kind, entity_id), users in demand.items():
+            if len(users) < 2:
+                continue
+            given = dict.fromkeys(users, 0)
+            for day_idx in range(len(self.days)):
+                for start_hour, end_hour in RESERVATION_BLOCKS:
+                    owner = max(users, key=lambda part_index: (users[part_index] / (given[part_index] + 1), -part_index))
+                    given[owner] += end_hour - start_hour
+                    for part_index in users:
+                        if part_index != owner:
+                            reservations[part_index].append((kind, entity_id, day_idx, start_hour, end_hour))
+        return reservations
 
-    def is_classroom_available(self, classroom, day, start_hour, end_hour):
-        """Check if classroom is available in the given time slot"""
-        for hour in range(start_hour, end_hour):
-            if classroom.id in self.timetable[day][hour] and self.timetable[day][hour][classroom.id] is not None:
-                return False
-        return True
+    def solve_partitioned(self, n_workers=None, max_part_size=None, reserve=True, engine="greedy",
+                          local_search_iterations=0, seed=0, cancel=None, verbose=True):
+        """Solve a large multi-department problem as separate parts in a process pool, then merge them.
 
-    def check_classroom_capacity(self, course, classroom):
-        """Check if classroom has enough capacity for the course"""
-        return classroom.capacity >= course.student_count
+        The courses are split with partition(). By default max_part_size gives
+        about two parts per worker; with one worker the whole problem is a
+        single part. Components with nothing in common are solved apart with
+        no loss. In split components the departments share instructors and rooms, and
+        each part only gets the blocks of them part_reservations() gives it,
+        so parts do not book the same hours. reserve=False skips this and
+        leaves every clash to the repair.
 
-    def check_classroom_type(self, course, classroom):   
-        """Check if classroom type is suitable for the course"""
-        # Implement specific logic for classroom type requirements
-        # This is a simplified example - you'd need to expand based on your requirements
-        if course.name.lower().find("computer") >= 0 and classroom.room_type != "computer_lab":
-            return False
-        return True
+        Splitting a component costs solution quality: each part only sees its
+        own blocks of the shared instructors and rooms, so sessions land in
+        worse slots and can end up unscheduled where one greedy pass would
+        place them. benchmark.py --engine partitioned reports the cost
+        (partition_loss_hours, partition_penalty_ratio).
 
-    def get_course_hours_on_day(self, course, day):
-        """Get total hours already scheduled for this course on the given day"""
-        total_hours = 0
-        for assigned_day, start_hour, end_hour in course.assigned_slots:
-            if assigned_day == day:
-                total_hours += (end_hour - start_hour)
-        return total_hours
+        Each part is solved with generate_schedule(engine=engine) plus
+        local_search_iterations of optimize_schedule. The merged sessions
+        replace the current assignments, and repair_conflicts() then removes
+        any clashes and places the hours still missing without reservations.
+        Returns a dict with the part sizes and what the repair did.
 
-    def would_exceed_consecutive_hours(self, course, day, start_hour, hours_duration):
-        """Check if adding this slot would exceed 4 consecutive hours on a day"""
-        end_hour = start_hour + hours_duration
+        cancel is a threading.Event (or anything with is_set()) checked while
+        the parts are solved; once it is set, parts not started are dropped
+        and the schedule is left unchanged, with "cancelled" True in the result.
+        """
+        def cancelled():
+            return cancel is not None and cancel.is_set()
         
-        # Get all existing slots for this course on this day
-        day_slots = [(s, e) for d, s, e in course.assigned_slots if d == day]
+        n_workers = n_workers or os.cpu_count() or 1
+        if max_part_size is None and n_workers > 1:
+            max_part_size = max(1, math.ceil(len(self.courses) / (n_workers * 2)))
+        parts, split_components = self.partition(max_part_size)
+        reservations = self.part_reservations(parts) if reserve else [[] for _ in parts]
         
-        # If no existing slots, just check if current request is > 4 hours
-        if not day_slots:
-            return hours_duration > 4
-            
-        # Check if the new slot would create > 4 consecutive hours
-        # with any existing slot
-        for slot_start, slot_end in day_slots:
-            # Check if slots are adjacent
-            if slot_end == start_hour:  # Existing slot is right before new slot
-                if (slot_end - slot_start) + hours_duration > 4:
-                    return True
-            elif end_hour == slot_start:  # New slot is right before existing slot
-                if hours_duration + (slot_end - slot_start) > 4:
-                    return True
+        problems = []
+        for part, part_reservations in zip(parts, reservations):
+            problem = self.to_problem(part)
+            problem["reservations"] = part_reservations
+            problems.append(problem)
+        results = []
+        if n_workers == 1 or len(problems) < 2:
+            for problem in problems:
+                if cancelled():
+                    break
+                results.append(_solve_partition(problem, engine, local_search_iterations, seed))
+        else:
+            executor = ProcessPoolExecutor(max_workers=min(n_workers, len(problems)))
+            try:
+                futures = [
+                    executor.submit(_solve_partition, problem, engine, local_search_iterations, seed)
+                    for problem in problems
+                ]
+                pending = set(futures)
+                while pending and not cancelled():
+                    # Wake up now and then to look at cancel
+                    _, pending = wait(pending, timeout=None if cancel is None else 0.1, return_when=FIRST_COMPLETED)
+                if not pending:
+                    results = [future.result() for future in futures]
+            finally:
+                # Parts already running finish in the background after a cancel
+                executor.shutdown(wait=not cancelled(), cancel_futures=True)
+        reserved_hours = sum(end_hour - start_hour for blocks in reservations for *_, start_hour, end_hour in blocks)
+        if cancelled():
+            return {
+                "parts": [len(part) for part in parts],
+                "split_components": split_components,
+                "reserved_hours": reserved_hours,
+                "removed_sessions": 0,
+                "placed_hours": 0,
+                "unscheduled_hours": sum(self.get_unscheduled_hours(course) for course in self.courses),
+                "cancelled": True
+            }
         
-        return False
+        # Map each part's course and classroom indexes back to this schedule's
+        course_indexes = {id(course): i for i, course in enumerate(self.courses)}
+        room_indexes = {id(room): i for i, room in enumerate(self.classrooms)}
+        assignments = []
+        for part, part_assignments in zip(parts, results):
+            _, classrooms = self.problem_resources(part)
+            for course_index, day_idx, start_hour, hours_duration, room_index in part_assignments:
+                assignments.append((course_indexes[id(part[course_index])], day_idx, start_hour, hours_duration,
+                                    room_indexes[id(classrooms[room_index])]))
+        self.clear_assignments()
+        self.apply_assignments(assignments)
+        repair = self.repair_conflicts(verbose=verbose)
+        
+        return {
+            "parts": [len(part) for part in parts],
+            "split_components": split_components,
+            "reserved_hours": reserved_hours,
+            **repair,
+            "unscheduled_hours": sum(self.get_unscheduled_hours(course) for course in self.courses),
+            "cancelled": False
+        }
 
-    def assign_slot(self, course, instructor, classroom, day, start_hour, hours_duration):
-        """Assign a course to a specific time slot"""
-        end_hour = start_hour + hours_duration
+    def repair_conflicts(self, verbose=True):
+        """Remove sessions that clash, then greedily place the hours courses are missing.
+
+        A session clashes if its instructor or room (or, with hard cohort
+        conflicts, its students) has another session in one of its hours.
+        Courses are visited lowest priority first, so when two sessions clash
+        the one of the less important course is removed. The missing hours
+        are then placed in priority order. Returns the number of sessions
+        removed and hours placed.
+        """
+        occupancy = self.occupancy
+        hard_cohorts = self.cohort_conflicts == "hard"
+        removed_sessions = 0
+        for course in reversed(self.priority_order()):
+            instructor = self.get_course_instructor(course)
+            if instructor is None:
+                continue
+            cohort = course_cohort(course)
+            for day, start_hour, end_hour in list(course.assigned_slots):
+                classroom = self.session_classroom(course, day, start_hour, end_hour)
+                if any(occupancy.instructor_count(instructor.id, day, hour) > 1
+                       or occupancy.room_count(classroom.id, day, hour) > 1
+                       or (hard_cohorts and occupancy.cohort_count(cohort, day, hour) > 1)
+                       for hour in range(start_hour, end_hour)):
+                    self.unassign_slot(course, instructor, classroom, day, start_hour, end_hour - start_hour)
+                    removed_sessions += 1
         
-        # Assign the slot in the timetable
-        for hour in range(start_hour, end_hour):
-            self.timetable[day][hour][classroom.id] = (course, instructor)
+        placed_hours = 0
+        for course in self.priority_order():
+            hours_left = self.get_unscheduled_hours(course)
+            if not hours_left:
+                continue
+            instructor, classroom, problem = self.get_course_resources(course)
+            if problem:
+                continue
+            placed_hours += hours_left - self._place_course_hours(course, instructor, classroom, hours_left, verbose)
+        return {"removed_sessions": removed_sessions, "placed_hours": placed_hours}
+
+    def get_scheduled_hours(self, course):
+        """Weekly hours of the course that have a slot"""
+        return sum(end - start for _, start, end in course.assigned_slots)
+
+    def get_unscheduled_hours(self, course):
+        """Weekly hours of the course that have no slot yet"""
+        return max(0, course.hours_per_week - self.get_scheduled_hours(course))
+
+    def total_penalty(self):
+        """Sum of the slot scores of every session plus a penalty for each unscheduled hour"""
+        penalty = 0
+        for course in self.courses:
+            instructor, classroom, problem = self.get_course_resources(course)
+            if problem:
+                continue
+            for day, start_hour, end_hour in course.assigned_slots:
+                penalty += self.calculate_slot_score(course, instructor, classroom, day, start_hour, end_hour - start_hour)
+            penalty += self.get_unscheduled_hours(course) * UNSCHEDULED_HOUR_PENALTY
+        return penalty
+
+    def optimize_schedule(self, time_limit=5.0, max_iterations=None, seed=0, method="annealing",
+                          initial_temperature=100.0, cooling_rate=0.9995, tabu_tenure=25, tabu_sample=8,
+                          callback=None):
+        """Improve the current (usually greedy) schedule with local search.
+
+        Moves relocate one session of a course, swap the times of two sessions
+        of the same length, or place leftover hours of a course. Each move is
+        applied through assign_slot / unassign_slot, delta-evaluated with
+        calculate_slot_score (see placement_cost) and rolled back if rejected. method is
+        "annealing" (simulated annealing) or "tabu" (tabu search). The search
+        stops after time_limit seconds or max_iterations moves, whichever comes
+        first, and ends on the best schedule it saw. With max_iterations set
+        and time_limit=None the run only depends on seed. callback(iterations,
+        current_penalty) is called before every move, and returning True
+        stops the search as well.
+
+        Returns a dict with the iteration count and the penalty and
+        unscheduled hours before and after.
+        """
+        if method not in ("annealing", "tabu"):
+            raise ValueError(f"Unknown local search method: {method}")
+        
+        rng = random.Random(seed)
+        resources = {}
+        for course in self.courses:
+            instructor, classroom, problem = self.get_course_resources(course)
+            if not problem:
+                resources[course] = (instructor, classroom)
+        courses = [course for course in self.courses if course in resources]
         
-        # Update course's assigned slots
-        course.assigned_slots.append((day, start_hour, end_hour))
+        initial_penalty = current_penalty = best_penalty = self.total_penalty()
+        unfinished = [course for course in courses if self.get_unscheduled_hours(course) > 0]
+        initial_unscheduled = sum(self.get_unscheduled_hours(course) for course in unfinished)
+        start_checkpoint = best_checkpoint = self.checkpoint()
+        tabu_until = {}  # (course id, day, start_hour) -> iteration until which returning there is tabu
+        temperature = initial_temperature
+        deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        iteration = 0
         
-        # Update instructor's assigned courses if not already assigned
-        if course not in instructor.assigned_courses:
-            instructor.assigned_courses.append(course)
+        while courses:
+            if max_iterations is not None and iteration >= max_iterations:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if callback is not None and callback(iteration, current_penalty):
+                break
+            iteration += 1
+            # Moves never add unscheduled hours, so the list only shrinks
+            unfinished = [course for course in unfinished if self.get_unscheduled_hours(course) > 0]
             
-        return True
+            if method == "annealing":
+                checkpoint = self.checkpoint()
+                move = self._local_search_move(rng, courses, resources, unfinished)
+                if move is None:
+                    continue
+                delta, _ = move
+                if delta <= 0 or rng.random() < math.exp(-delta / max(temperature, 1e-9)):
+                    current_penalty += delta
+                else:
+                    self.rollback(checkpoint)
+                temperature *= cooling_rate
+            else:
+                # Tabu search: sample some moves and take the best one that is not tabu
+                checkpoint = self.checkpoint()
+                best_move = None
+                for _ in range(tabu_sample):
+                    move = self._local_search_move(rng, courses, resources, unfinished)
+                    if move is None:
+                        continue
+                    delta, vacated = move
+                    edits = self.history[checkpoint:]
+                    self.rollback(checkpoint)
+                    is_tabu = any(tabu_until.get(key, 0) >= iteration for key in self._placed_keys(edits))
+                    if is_tabu and current_penalty + delta >= best_penalty:
+                        continue  # Aspiration: tabu moves are only allowed if they beat the best
+                    if best_move is None or delta < best_move[0]:
+                        best_move = (delta, vacated, edits)
+                if best_move is None:
+                    continue
+                delta, vacated, edits = best_move
+                self.replay(edits)
+                current_penalty += delta
+                for key in vacated:
+                    tabu_until[key] = iteration + tabu_tenure
+            
+            if current_penalty < best_penalty:
+                best_penalty = current_penalty
+                best_checkpoint = self.checkpoint()
+        
+        # Return to the best schedule seen. Deltas only cover the moved sessions'
+        # own scores, so keep the starting schedule if the search made it worse.
+        self.rollback(best_checkpoint)
+        if self.total_penalty() > initial_penalty:
+            self.rollback(start_checkpoint)
+        
+        return {
+            "method": method,
+            "iterations": iteration,
+            "initial_penalty": initial_penalty,
+            "final_penalty": self.total_penalty(),
+            "initial_unscheduled_hours": initial_unscheduled,
+            "final_unscheduled_hours": sum(self.get_unscheduled_hours(course) for course in courses)
+        }
 
-    def calculate_slot_score(self, course, instructor, classroom, day, start_hour, hours_duration):
-        """Calculate a score for a potential time slot (lower is better)"""
-        score = 0
-        day_index = self.days.index(day)
+    @staticmethod
+    def _placed_keys(edits):
+        return [(edit[1].id, edit[4], edit[5]) for edit in edits if edit[0]]
+
+    def placement_cost(self, course, instructor, classroom, day, start_hour, hours_duration):
+        """Change in total_penalty caused by placing the session, assuming it is not placed yet.
+
+        This is the session's own calculate_slot_score plus the online/offline
+        switch penalty it adds to the opposite-mode sessions around it and the
+        cohort penalty it adds to a class of the cohort that was alone in an
+        hour. The load terms of SlotObjective are symmetric (session hours
+        times other hours), so the other sessions gain exactly its own load terms.
+        """
+        cost = self.calculate_slot_score(course, instructor, classroom, day, start_hour, hours_duration)
+        objective = self.objective
+        day_idx = DAY_INDEX[day]
+        if objective.balances_load:
+            cost += objective.day_cost(self, course, instructor, day_idx, hours_duration)
+            cost += objective.room_load_cost(self, day_idx, start_hour, hours_duration)
+        if self.cohort_conflicts == "weighted" and objective.weights["cohort"]:
+            cohort = course_cohort(course)
+            own = self._course_day_mask(course, day_idx)
+            for hour in range(start_hour, start_hour + hours_duration):
+                others = self.occupancy.cohort_count(cohort, day, hour) - (own >> (hour - self.hours[0]) & 1)
+                if others == 1:
+                    cost += objective.weights["cohort"]
+        opposite = self.occupancy.opposite_mode_counts(day, course.is_online)
+        first_hour = self.occupancy.first_hour
+        switches = 0
+        for hour in range(start_hour, start_hour + hours_duration):
+            # A session in the previous hour looks at its next hour only before 17:00
+            if 8 <= hour - 1 < 17:
+                switches += opposite[hour - 1 - first_hour]
+            # A session in the next hour always looks back at its previous hour
+            if hour + 1 <= self.hours[-1]:
+                switches += opposite[hour + 1 - first_hour]
+        return cost + switches * objective.weights["mode_switch"]
+
+    def _local_search_move(self, rng, courses, resources, unfinished):
+        """Apply one random neighbourhood move.
+
+        Returns (penalty delta, keys of the vacated (course id, day, start) slots),
+        or None if the move could not be made (nothing is changed then).
+        """
+        # Half of the moves try to place leftover hours while there are any
+        if unfinished and rng.random() < 0.5:
+            course = rng.choice(unfinished)
+            instructor, classroom = resources[course]
+            hours_left = self.get_unscheduled_hours(course)
+            for hours_per_session in range(min(3, hours_left), 0, -1):
+                slot = self.find_slot_and_room(course, instructor, classroom, hours_per_session)
+                if slot:
+                    day, start_hour, duration, classroom = slot
+                    score = self.placement_cost(course, instructor, classroom, day, start_hour, duration)
+                    self.assign_slot(course, instructor, classroom, day, start_hour, duration)
+                    return score - duration * UNSCHEDULED_HOUR_PENALTY, []
+            # No room for it: try to move a session that competes for its instructor or room
+            competitors = self.get_instructor_courses(instructor.id)
+            course = rng.choice(competitors) if competitors else course
+            if course not in resources or not course.assigned_slots:
+                return None
+        else:
+            course = rng.choice(courses)
+            if not course.assigned_slots:
+                return None
         
-        # Base score based on day and time
-        score += day_index * 10  # Earlier days are preferred
-        score += (start_hour - 8)  # Earlier times are preferred
+        if rng.random() < 0.3:
+            return self._swap_move(rng, course, courses, resources)
+        return self._relocate_move(rng, course, resources)
+
+    def _relocate_move(self, rng, course, resources):
+        """Move one session of the course to a random feasible slot"""
+        instructor, _ = resources[course]
+        day, start_hour, end_hour = rng.choice(course.assigned_slots)
+        duration = end_hour - start_hour
+        classroom = self.session_classroom(course, day, start_hour, end_hour)  # The session keeps its room
         
-        # Penalty for not using instructor's preferred slots (for part-time)
-        if instructor.is_part_time and instructor.preferred_slots:
-            is_preferred = False
-            for pref_day, pref_start, pref_end in instructor.preferred_slots:
-                if day == pref_day and start_hour >= pref_start and (start_hour + hours_duration) <= pref_end:
-                    is_preferred = True
-                    break
-            if not is_preferred:
-                score += 100  # Heavy penalty for not using preferred slots
+        checkpoint = self.checkpoint()
+        self.unassign_slot(course, instructor, classroom, day, start_hour, duration)
+        old_score = self.placement_cost(course, instructor, classroom, day, start_hour, duration)
         
-        # Check for online/offline proximity
-        end_hour = start_hour + hours_duration
-        for hour in range(start_hour, end_hour):
-            # Check previous hour - if it exists and is a different mode (online/offline)
-            if hour > 8:
-                for room_id in self.timetable[day][hour-1]:
-                    if self.timetable[day][hour-1][room_id] is not None:
-                        prev_course, _ = self.timetable[day][hour-1][room_id]
-                        if prev_course.is_online != course.is_online:
-                            score += 50  # Penalty for switching between online/offline
-                            
-            # Check next hour - if it exists and is a different mode (online/offline)
-            if hour < 17:
-                for room_id in self.timetable[day][hour+1]:
-                    if self.timetable[day][hour+1][room_id] is not None:
-                        next_course, _ = self.timetable[day][hour+1][room_id]
-                        if next_course.is_online != course.is_online:
-                            score += 50  # Penalty for switching between online/offline
+        candidates = []
+        for new_day in self.days:
+            if self.get_course_hours_on_day(course, new_day) + duration > 4:
+                continue
+            starts = self.feasible_start_mask(course, instructor, classroom, new_day, duration)
+            if new_day == day:
+                starts &= ~hour_mask(start_hour, start_hour + 1)
+            while starts:
+                low_bit = starts & -starts
+                starts ^= low_bit
+                candidates.append((new_day, HOURS[0] + low_bit.bit_length() - 1))
         
-        # Add a high penalty for slots that would create more than 4 consecutive hours
-        if self.would_exceed_consecutive_hours(course, day, start_hour, hours_duration):
-            score += 1000
+        if not candidates:
+            self.rollback(checkpoint)
+            return None
         
-        return score
+        new_day, new_start = rng.choice(candidates)
+        new_score = self.placement_cost(course, instructor, classroom, new_day, new_start, duration)
+        self.assign_slot(course, instructor, classroom, new_day, new_start, duration)
+        return new_score - old_score, [(course.id, day, start_hour)]
 
-    def generate_schedule(self):
-        """Generate an optimal schedule using a greedy algorithm"""
-        # Sort courses by priority (more hours per week first, then by student count)
-        sorted_courses = sorted(self.courses, key=lambda x: (x.hours_per_week, x.student_count), reverse=True)
+    def _swap_move(self, rng, course, courses, resources):
+        """Swap the times of a session of the course with an equally long session of another course"""
+        day, start_hour, end_hour = rng.choice(course.assigned_slots)
+        duration = end_hour - start_hour
+        other = rng.choice(courses)
+        matching = [slot for slot in other.assigned_slots
+                    if slot[2] - slot[1] == duration and (slot[0], slot[1]) != (day, start_hour)]
+        if other is course or not matching:
+            return None
+        other_day, other_start, _ = rng.choice(matching)
         
-        # For each course, find the best available slot
-        for course in sorted_courses:
-            # Get the instructor for this course
-            instructor = next((i for i in self.instructors if i.id == course.instructor_id), None)
-            if not instructor:
-                print(f"Warning: No instructor found for course {course.name}")
-                continue
-                
-            # Get the classroom for this course
-            classroom = next((c for c in self.classrooms if c.id == course.classroom_id), None)
-            if not classroom:
-                print(f"Warning: No classroom found for course {course.name}")
-                continue
-                
-            # Check if classroom is suitable
-            if not self.check_classroom_capacity(course, classroom):
-                print(f"Warning: Classroom {classroom.name} does not have enough capacity for course {course.name}")
-                continue
-                
-            if not self.check_classroom_type(course, classroom):
-                print(f"Warning: Classroom {classroom.name} type is not suitable for course {course.name}")
-                continue
-            
-            # Schedule the course hours - dividing into multiple sessions if needed
-            hours_left = course.hours_per_week
-            
-            # Limit single session to at most 4 hours (new constraint)
-            max_hours_per_session = min(4, hours_left)
-            hours_per_session = min(3, max_hours_per_session)  # Default remains 3 hours per session
-            
-            while hours_left > 0:
-                best_slots = []  # List of (day, start_hour, score) tuples
-                
-                # Try to find available slots for this session
-                for day in self.days:
-                    # Get already scheduled hours for this course on this day
-                    day_hours = self.get_course_hours_on_day(course, day)
-                    
-                    # Skip if adding more hours would exceed 4 hours on this day
-                    remaining_hours = 4 - day_hours
-                    if remaining_hours <= 0:
-                        continue
-                    
-                    # Adjust hours_per_session if needed
-                    this_session_hours = min(hours_per_session, remaining_hours)
-                    
-                    for start_hour in range(8, 18 - this_session_hours):
-                        end_hour = start_hour + this_session_hours
-                        
-                        # Check if instructor is available
-                        if not self.is_instructor_available(instructor, day, start_hour, end_hour):
-                            continue
-                            
-                        # Check if classroom is available
-                        if not self.is_classroom_available(classroom, day, start_hour, end_hour):
-                            continue
-                            
-                        # Check if this would create > 4 consecutive hours
-                        if self.would_exceed_consecutive_hours(course, day, start_hour, this_session_hours):
-                            continue
-                            
-                        # Calculate score for this slot
-                        score = self.calculate_slot_score(course, instructor, classroom, day, start_hour, this_session_hours)
-                        best_slots.append((day, start_hour, this_session_hours, score))
-                
-                # Sort slots by score (lower is better)
-                best_slots.sort(key=lambda x: x[3])
-                
-                # If we found a suitable slot, assign it
-                if best_slots:
-                    best_day, best_start, best_duration, _ = best_slots[0]
-                    self.assign_slot(course, instructor, classroom, best_day, best_start, best_duration)
-                    hours_left -= best_duration
-                else:
-                    # If no slots found, try with fewer hours per session
-                    hours_per_session -= 1
-                    if hours_per_session == 0:
-                        print(f"Warning: Could not schedule all hours for course {course.name}. {hours_left} hours remaining.")
-                        break
+        instructor, _ = resources[course]
+        other_instructor, _ = resources[other]
+        classroom = self.session_classroom(course, day, start_hour, end_hour)
+        other_classroom = self.session_classroom(other, other_day, other_start, other_start + duration)
+        checkpoint = self.checkpoint()
+        self.unassign_slot(course, instructor, classroom, day, start_hour, duration)
+        self.unassign_slot(other, other_instructor, other_classroom, other_day, other_start, duration)
+        old_score = (self.placement_cost(course, instructor, classroom, day, start_hour, duration) +
+                     self.placement_cost(other, other_instructor, other_classroom, other_day, other_start, duration))
+        
+        new_score = 0
+        for moved, moved_instructor, moved_classroom, new_day, new_start in (
+                (course, instructor, classroom, other_day, other_start),
+                (other, other_instructor, other_classroom, day, start_hour)):
+            fits_day = self.get_course_hours_on_day(moved, new_day) + duration <= 4
+            starts = self.feasible_start_mask(moved, moved_instructor, moved_classroom, new_day, duration)
+            if not fits_day or not starts & hour_mask(new_start, new_start + 1):
+                self.rollback(checkpoint)
+                return None
+            new_score += self.placement_cost(moved, moved_instructor, moved_classroom, new_day, new_start, duration)
+            self.assign_slot(moved, moved_instructor, moved_classroom, new_day, new_start, duration)
+        
+        return new_score - old_score, [(course.id, day, start_hour), (other.id, other_day, other_start)]
 
     def print_schedule(self):
         """Print the generated schedule"""
@@ -297,22 +3692,24 @@ class Schedule:
                 for room_id in self.timetable[day][hour]:
                     if self.timetable[day][hour][room_id] is not None:
                         course, instructor = self.timetable[day][hour][room_id]
-                        classroom = next((c for c in self.classrooms if c.id == room_id), None)
+                        classroom = self.classrooms_by_id.get(room_id)
                         course_type = "ONLINE" if course.is_online else "IN-PERSON"
                         print(f"  Room {classroom.name}: {course.name} (Section {course.section}) - {course_type} - Prof. {instructor.name}")
 
     def export_schedule_json(self):
         """Export the schedule as JSON for API purposes"""
-        schedule_data = []
-        
+        return json.dumps(list(self.iter_schedule_entries()), indent=2)
+
+    def iter_schedule_entries(self):
+        """Yield one export entry per occupied (day, hour, room) cell"""
         for day in self.days:
             for hour in self.hours:
                 for room_id in self.timetable[day][hour]:
                     if self.timetable[day][hour][room_id] is not None:
                         course, instructor = self.timetable[day][hour][room_id]
-                        classroom = next((c for c in self.classrooms if c.id == room_id), None)
+                        classroom = self.classrooms_by_id.get(room_id)
                         
-                        schedule_entry = {
+                        yield {
                             "day": day,
                             "hour": hour,
                             "course_id": course.id,
@@ -324,144 +3721,291 @@ class Schedule:
                             "room_name": classroom.name,
                             "is_online": course.is_online
                         }
-                        
-                        schedule_data.append(schedule_entry)
-        
-        return json.dumps(schedule_data, indent=2)
 
-    def check_schedule_validity(self):
-        """Check if the generated schedule is valid (no conflicts)"""
-        # Check instructor conflicts
+    def iter_schedule_runs(self):
+        """Yield (day, start_hour, end_hour, course, instructor, room_id) for every run of consecutive
+        hours a course holds in a room, ordered by day and start hour"""
+        end_of_day = self.hours[-1] + 1
         for day in self.days:
+            open_runs = {}  # room_id -> (start_hour, course, instructor)
+            runs = []
             for hour in self.hours:
-                instructors_at_hour = {}
-                for room_id in self.timetable[day][hour]:
-                    if self.timetable[day][hour][room_id] is not None:
-                        _, instructor = self.timetable[day][hour][room_id]
-                        if instructor.id in instructors_at_hour:
-                            print(f"ERROR: Instructor {instructor.name} is scheduled in multiple rooms at {day} {hour}:00")
-                            return False
-                        instructors_at_hour[instructor.id] = True
-        
-        # Check classroom conflicts
-        for day in self.days:
-            for hour in self.hours:
-                for room_id in self.timetable[day][hour]:
-                    if room_id in self.timetable[day][hour]:
-                        if len(self.timetable[day][hour][room_id]) > 1:
-                            print(f"ERROR: Multiple courses scheduled in room {room_id} at {day} {hour}:00")
-                            return False
-        
-        # Check course hour integrity
-        for course in self.courses:
-            total_hours = 0
-            for day, start, end in course.assigned_slots:
-                total_hours += (end - start)
-            
-            if total_hours != course.hours_per_week:
-                print(f"ERROR: Course {course.name} is scheduled for {total_hours} hours, but requires {course.hours_per_week} hours")
-                return False
-        
-        # Check online/offline proximity
-        for day in self.days:
-            for hour in range(8, 17):  # Check current and next hour
-                online_courses_current = []
-                offline_courses_current = []
-                
-                for room_id in self.timetable[day][hour]:
-                    if self.timetable[day][hour][room_id] is not None:
-                        course, _ = self.timetable[day][hour][room_id]
-                        if course.is_online:
-                            online_courses_current.append(course)
-                        else:
-                            offline_courses_current.append(course)
-                
-                online_courses_next = []
-                offline_courses_next = []
-                
-                for room_id in self.timetable[day][hour+1]:
-                    if self.timetable[day][hour+1][room_id] is not None:
-                        course, _ = self.timetable[day][hour+1][room_id]
-                        if course.is_online:
-                            online_courses_next.append(course)
-                        else:
-                            offline_courses_next.append(course)
-                
-                # Warning if there's a mix of online and offline in adjacent hours
-                if (online_courses_current and offline_courses_next) or (offline_courses_current and online_courses_next):
-                    print(f"WARNING: Mix of online and offline classes scheduled near each other at {day} {hour}:00-{hour+1}:00")
-        
-        # Check for more than 4 consecutive hours on any day
-        for course in self.courses:
-            # Group slots by day
-            day_slots = {}
-            for day, start, end in course.assigned_slots:
-                if day not in day_slots:
-                    day_slots[day] = []
-                day_slots[day].append((start, end))
-            
-            # Check consecutive hours on each day
-            for day, slots in day_slots.items():
-                # Sort slots by start time
-                slots.sort()
-                
-                # Find consecutive slots
-                consecutive_hours = 0
-                last_end = None
-                
-                for start, end in slots:
-                    if last_end is not None and start == last_end:
-                        # Slots are consecutive
-                        consecutive_hours += (end - start)
-                        if consecutive_hours > 4:
-                            print(f"ERROR: Course {course.name} has more than 4 consecutive hours on {day}")
-                            return False
-                    else:
-                        # Reset consecutive counter
-                        consecutive_hours = end - start
-                    
-                    last_end = end
-        
-        # Check instructor time and day restrictions for non-preferred slots
-        for day in self.days:
-            # Check weekend restrictions
-            is_weekend = day in ["Saturday", "Sunday"]
-            
-            for hour in range(8, 22):
-                is_outside_hours = hour < 8 or hour >= 17  # Outside of 8am-5pm
-                
-                # Check if either weekend or outside 8am-5pm
-                if is_weekend or is_outside_hours:
-                    for room_id in self.timetable[day][hour]:
-                        if self.timetable[day][hour][room_id] is not None:
-                            course, instructor = self.timetable[day][hour][room_id]
-                            
-                            # Check if this is a preferred slot for the instructor
-                            is_preferred = False
-                            if instructor.is_part_time and instructor.preferred_slots:
-                                for pref_day, pref_start, pref_end in instructor.preferred_slots:
-                                    if day == pref_day and hour >= pref_start and hour < pref_end:
-                                        is_preferred = True
-                                        break
-                            
-                            if not is_preferred:
-                                if is_weekend:
-                                    print(f"ERROR: Instructor {instructor.name} is scheduled on weekend {day} in a non-preferred slot at {hour}:00")
-                                else:
-                                    print(f"ERROR: Instructor {instructor.name} is scheduled outside 8am-5pm in a non-preferred slot at {day} {hour}:00")
-                                return False
+                cell = self.timetable[day][hour]
+                for room_id in list(open_runs):
+                    start_hour, course, instructor = open_runs[room_id]
+                    if cell.get(room_id) != (course, instructor):
+                        runs.append((start_hour, hour, course, instructor, room_id))
+                        del open_runs[room_id]
+                for room_id, entry in cell.items():
+                    if entry is not None and room_id not in open_runs:
+                        open_runs[room_id] = (hour, entry[0], entry[1])
+            for room_id, (start_hour, course, instructor) in open_runs.items():
+                runs.append((start_hour, end_of_day, course, instructor, room_id))
+            # Only one day's runs are held at a time
+            runs.sort(key=lambda run: run[0])
+            for start_hour, end_hour, course, instructor, room_id in runs:
+                yield day, start_hour, end_hour, course, instructor, room_id
+
+    def iter_schedule_sessions(self):
+        """Yield one export record per session, with consecutive hours merged into (day, start, end)"""
+        for day, start_hour, end_hour, course, instructor, room_id in self.iter_schedule_runs():
+            classroom = self.classrooms_by_id.get(room_id)
+            yield {
+                "day": day,
+                "start_hour": start_hour,
+                "end_hour": end_hour,
+                "course_id": course.id,
+                "course_name": course.name,
+                "section": course.section,
+                "major": course.major,
+                "instructor_id": instructor.id,
+                "instructor_name": instructor.name,
+                "room_id": classroom.id,
+                "room_name": classroom.name,
+                "is_online": course.is_online
+            }
+
+    def iter_schedule_json(self, export_format="hours", chunk_size=65536):
+        """Stream the schedule as UTF-8 JSON in chunks of about chunk_size bytes.
+
+        export_format is "hours" (the export_schedule_json entries, in the schema
+        post_schedule has always sent), "sessions" (merged session records, which
+        also carry the course's major) or "compact": courses, instructors and rooms
+        are listed once and every session is a row of indexes into them:
+        {"format": "compact-v1", "days": [...], "courses": [[id, name, section, major, is_online]],
+         "instructors": [[id, name]], "rooms": [[id, name]],
+         "columns": ["day", "start_hour", "end_hour", "course", "instructor", "room"], "sessions": [[...]]}
+        """
+        if export_format == "hours":
+            head, rows, tail = "[", (json.dumps(entry) for entry in self.iter_schedule_entries()), "]"
+        elif export_format == "sessions":
+            head, rows, tail = "[", (json.dumps(entry) for entry in self.iter_schedule_sessions()), "]"
+        elif export_format == "compact":
+            course_index = {id(course): i for i, course in enumerate(self.courses)}
+            instructor_index = {id(instructor): i for i, instructor in enumerate(self.instructors)}
+            room_index = {classroom.id: i for i, classroom in enumerate(self.classrooms)}
+            head = json.dumps({
+                "format": "compact-v1",
+                "days": self.days,
+                "courses": [[c.id, c.name, c.section, c.major, c.is_online] for c in self.courses],
+                "instructors": [[i.id, i.name] for i in self.instructors],
+                "rooms": [[c.id, c.name] for c in self.classrooms],
+                "columns": ["day", "start_hour", "end_hour", "course", "instructor", "room"]
+            })[:-1] + ', "sessions": ['
+            rows = (
+                json.dumps([DAY_INDEX[day], start_hour, end_hour, course_index[id(course)],
+                            instructor_index[id(instructor)], room_index[room_id]], separators=(",", ":"))
+                for day, start_hour, end_hour, course, instructor, room_id in self.iter_schedule_runs()
+            )
+            tail = "]}"
+        else:
+            raise ValueError(f"Unknown export format: {export_format}")
         
-        return True
+        buffer = [head]
+        size = len(head)
+        separator = ""
+        for row in rows:
+            buffer.append(separator + row)
+            size += len(row) + 1
+            separator = ","
+            if size >= chunk_size:
+                yield "".join(buffer).encode("utf-8")
+                buffer = []
+                size = 0
+        buffer.append(tail)
+        yield "".join(buffer).encode("utf-8")
+
+    def check_schedule_validity(self):
+        """Check if the generated schedule is valid (no conflicts)"""
+        return self.validator.is_valid()
+
+    def get_violations(self, severity=None):
+        """Structured list of the rules the schedule currently breaks"""
+        return self.validator.get_violations(severity)
+
+    def print_violations(self):
+        """Print every error and warning of the current schedule"""
+        for violation in self.get_violations():
+            print(f"{violation.severity.upper()}: {violation.message}")
+
+
+# Process pool workers for Schedule.solve_parallel and Schedule.solve_partitioned
+_worker_problem = None
+
+def _init_parallel_worker(problem):
+    global _worker_problem
+    _worker_problem = problem
+
+def _run_parallel_start(start_index, seed, local_search_iterations):
+    """Solve one randomized start of the worker's problem"""
+    schedule = Schedule.from_problem(_worker_problem)
+    rng = random.Random(seed * 1000003 + start_index)
+    
+    course_order = None
+    if start_index > 0:
+        # Perturb the greedy priority so similar courses are tried in a different order
+        course_order = sorted(
+            schedule.courses,
+            key=lambda x: (x.hours_per_week + rng.random() * 2, x.student_count * rng.uniform(0.5, 1.5)),
+            reverse=True
+        )
+    schedule.generate_schedule(course_order=course_order, verbose=False)
+    if local_search_iterations:
+        schedule.optimize_schedule(time_limit=None, max_iterations=local_search_iterations, seed=rng.randrange(2 ** 32))
+    
+    return {
+        "start": start_index,
+        "assignments": schedule.get_assignments(),
+        "unscheduled_hours": sum(schedule.get_unscheduled_hours(course) for course in schedule.courses),
+        "total_penalty": schedule.total_penalty()
+    }
+
+
+def _solve_partition(problem, engine, local_search_iterations, seed):
+    """Solve one part of Schedule.solve_partitioned and return its assignments"""
+    schedule = Schedule.from_problem(problem)
+    schedule.generate_schedule(verbose=False, engine=engine)
+    if local_search_iterations:
+        schedule.optimize_schedule(time_limit=None, max_iterations=local_search_iterations, seed=seed)
+    return schedule.get_assignments()
 
 
 # API Integration for data import/export
+class ResponseCache:
+    """On-disk cache of API GET responses, one JSON file per endpoint and query.
+
+    Entries younger than their endpoint's TTL are served without any request.
+    Older entries are revalidated with If-None-Match / If-Modified-Since, so an
+    unchanged dataset costs a 304 instead of a full download. In offline mode
+    cached entries are always served and nothing is fetched.
+    """
+    def __init__(self, directory, ttl=3600, endpoint_ttls=None, offline=False, stale_if_error=True):
+        self.directory = directory
+        self.ttl = ttl  # Seconds an entry is used without revalidation
+        self.endpoint_ttls = endpoint_ttls or {}  # e.g. {"courses": 600, "unavailability": 60}
+        self.offline = offline
+        # Serve an expired entry when the API cannot be reached or keeps answering with 5XX errors
+        self.stale_if_error = stale_if_error
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def endpoint_name(path):
+        """Endpoint an API path belongs to: "courses", "instructors", "classrooms" or "unavailability" """
+        if path.rstrip("/").endswith("/unavailability"):
+            return "unavailability"
+        return path.strip("/").split("/")[0]
+
+    def _file_path(self, path, params):
+        key = json.dumps([path, sorted((params or {}).items())], default=str)
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.directory, f"{self.endpoint_name(path)}-{digest}.json")
+
+    def load(self, path, params=None):
+        """Cached entry for the request, or None"""
+        try:
+            with open(self._file_path(path, params), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, path, params, data, etag=None, last_modified=None):
+        entry = {
+            "stored_at": time.time(),
+            "etag": etag,
+            "last_modified": last_modified,
+            "data": data
+        }
+        file_path = self._file_path(path, params)
+        # Write to a temporary file first so readers never see half an entry
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(temp_path, file_path)
+        return entry
+
+    def is_fresh(self, path, entry):
+        ttl = self.endpoint_ttls.get(self.endpoint_name(path), self.ttl)
+        return time.time() - entry["stored_at"] < ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+
 class SchedulerAPI:
-    def __init__(self, base_url=None):
+    def __init__(self, base_url=None, timeout=10, max_retries=3, backoff_factor=0.5,
+                 pool_size=16, max_workers=8, bulk_chunk_size=200, session=None, cache=None):
         self.base_url = base_url or "https://api.university.example/scheduler"
+        self.cache = cache  # Optional ResponseCache for GET requests
+        self.timeout = timeout  # Seconds, or a (connect, read) tuple
+        self.max_workers = max_workers  # Concurrent requests when fetching per instructor
+        self.bulk_chunk_size = bulk_chunk_size  # Instructor ids per bulk unavailability request
+        self.bulk_unavailability_supported = True  # Set to False once the server rejects the bulk endpoint
+        self.session = session or self._create_session(max_retries, backoff_factor, pool_size)
+
+    @staticmethod
+    def _create_session(max_retries, backoff_factor, pool_size):
+        """Keep-alive session with a connection pool and bounded retries of idempotent requests"""
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def _get_json(self, path, params=None):
+        cache = self.cache
+        entry = None
+        headers = {}
+        if cache is not None:
+            entry = cache.load(path, params)
+            if entry is not None and (cache.offline or cache.is_fresh(path, entry)):
+                return entry["data"]
+            if cache.offline:
+                raise requests.ConnectionError(f"Offline mode: no cached response for {path}")
+            if entry is not None:
+                headers = cache.conditional_headers(entry)
+        
+        try:
+            response = self.session.get(f"{self.base_url}{path}", params=params, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and entry is not None:
+                # Unchanged on the server: keep the cached data and restart its TTL
+                cache.store(path, params, entry["data"], entry.get("etag"), entry.get("last_modified"))
+                return entry["data"]
+            response.raise_for_status()  # Raise exception for 4XX/5XX responses
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.RetryError, requests.HTTPError) as e:
+            # A 4XX answer is the request's fault and is not covered up; server errors are
+            unreachable = not isinstance(e, requests.HTTPError) or e.response is None or e.response.status_code >= 500
+            if unreachable and entry is not None and cache.stale_if_error:
+                print(f"Warning: using cached {path} after request failure: {e}")
+                return entry["data"]
+            raise
+        
+        data = response.json()
+        if cache is not None:
+            cache.store(path, params, data, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return data
         
     def fetch_courses(self, semester=None, department=None):
         """Fetch courses from the API"""
-        url = f"{self.base_url}/courses"
         params = {}
         
         if semester:
@@ -470,32 +4014,26 @@ class SchedulerAPI:
             params["department"] = department
             
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()  # Raise exception for 4XX/5XX responses
-            return response.json()
+            return self._get_json("/courses", params)
         except requests.RequestException as e:
             print(f"Error fetching courses: {e}")
             return []
     
     def fetch_instructors(self, department=None):
         """Fetch instructors from the API"""
-        url = f"{self.base_url}/instructors"
         params = {}
         
         if department:
             params["department"] = department
             
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
+            return self._get_json("/instructors", params)
         except requests.RequestException as e:
             print(f"Error fetching instructors: {e}")
             return []
     
     def fetch_classrooms(self, building=None, room_type=None):
         """Fetch classrooms from the API"""
-        url = f"{self.base_url}/classrooms"
         params = {}
         
         if building:
@@ -504,9 +4042,7 @@ class SchedulerAPI:
             params["type"] = room_type
             
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
+            return self._get_json("/classrooms", params)
         except requests.RequestException as e:
             print(f"Error fetching classrooms: {e}")
             return []
@@ -516,33 +4052,118 @@ class SchedulerAPI:
         url = f"{self.base_url}/schedules"
         
         try:
-            response = requests.post(url, json=schedule_data)
+            response = self.session.post(url, json=schedule_data, timeout=self.timeout)
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
             print(f"Error posting schedule: {e}")
             return None
 
-    def get_instructor_unavailability(self, instructor_id):
-        """Fetch instructor unavailability data"""
-        url = f"{self.base_url}/instructors/{instructor_id}/unavailability"
+    def post_schedule_stream(self, chunks):
+        """Send a schedule given as an iterable of JSON byte chunks (see Schedule.iter_schedule_json).
+
+        The body is sent with chunked transfer encoding as it is produced, so
+        the whole payload never has to be held in memory.
+        """
+        url = f"{self.base_url}/schedules"
         
         try:
-            response = requests.get(url)
+            response = self.session.post(url, data=iter(chunks), headers={"Content-Type": "application/json"},
+                                         timeout=self.timeout)
             response.raise_for_status()
             return response.json()
+        except requests.RequestException as e:
+            print(f"Error posting schedule: {e}")
+            return None
+
+    def get_instructor_unavailability(self, instructor_id):
+        """Fetch instructor unavailability data"""
+        try:
+            return self._get_json(f"/instructors/{instructor_id}/unavailability")
         except requests.RequestException as e:
             print(f"Error fetching instructor unavailability: {e}")
             return []
 
+    def fetch_unavailability_bulk(self, instructor_ids):
+        """Fetch unavailability for many instructors as {instructor_id: [slots]}.
+
+        Uses the bulk endpoint GET /instructors/unavailability?ids=1,2,3 (which
+        answers with an object keyed by instructor id), in chunks of
+        bulk_chunk_size ids. If the server does not offer that endpoint it falls
+        back to per-instructor requests, at most max_workers at a time.
+        """
+        instructor_ids = list(instructor_ids)
+        result = {}
+        
+        if self.bulk_unavailability_supported:
+            try:
+                for offset in range(0, len(instructor_ids), self.bulk_chunk_size):
+                    chunk = instructor_ids[offset:offset + self.bulk_chunk_size]
+                    data = self._get_json("/instructors/unavailability", {"ids": ",".join(str(i) for i in chunk)})
+                    # JSON object keys are strings, so map them back to the ids we asked for
+                    for instructor_id in chunk:
+                        result[instructor_id] = data.get(str(instructor_id), [])
+                return result
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code not in (400, 404, 405, 501):
+                    print(f"Error fetching instructor unavailability: {e}")
+                    return {instructor_id: [] for instructor_id in instructor_ids}
+                self.bulk_unavailability_supported = False
+            except requests.RequestException as e:
+                print(f"Error fetching instructor unavailability: {e}")
+                return {instructor_id: [] for instructor_id in instructor_ids}
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for instructor_id, slots in zip(instructor_ids, executor.map(self.get_instructor_unavailability, instructor_ids)):
+                result[instructor_id] = slots
+        return result
+
 
 # Function to build schedule from API data
-def build_schedule_from_api(api, semester=None, department=None):
-    """Build a schedule using data from the API"""
-    schedule = Schedule()
+def build_schedule_from_api(api, semester=None, department=None, departments=None, cohort_conflicts="off"):
+    """Build a schedule using data from the API.
+
+    Classrooms, instructors and courses are fetched concurrently, and
+    instructor unavailability is fetched in bulk once the instructors are known.
+    Given a list of departments, the courses and instructors of all of them
+    are fetched into one schedule. Instructors who teach in several
+    departments are added once, and every course keeps the department it
+    was fetched for (see Schedule.solve_partitioned).
+    cohort_conflicts is the Schedule's cohort conflict mode.
+    """
+    if departments is None:
+        departments = [department]
+    with ThreadPoolExecutor(max_workers=1 + 2 * len(departments)) as executor:
+        classroom_future = executor.submit(api.fetch_classrooms)
+        instructor_futures = [executor.submit(api.fetch_instructors, dept) for dept in departments]
+        course_futures = [executor.submit(api.fetch_courses, semester, dept) for dept in departments]
+        
+        instructor_data = list({
+            instr["id"]: instr for future in instructor_futures for instr in future.result()
+        }.values())
+        unavailability = api.fetch_unavailability_bulk([instr["id"] for instr in instructor_data])
+        classroom_data = classroom_future.result()
+        course_data = []
+        for dept, future in zip(departments, course_futures):
+            for course in future.result():
+                if dept is not None and "department" not in course:
+                    course = dict(course, department=dept)
+                course_data.append(course)
+    
+    return build_schedule_from_data(classroom_data, instructor_data, course_data, unavailability, cohort_conflicts)
+
+
+def build_schedule_from_data(classroom_data, instructor_data, course_data, unavailability=None, cohort_conflicts="off"):
+    """Build a schedule from classroom, instructor and course records in the API's JSON format.
+
+    Instructor unavailability comes from the unavailability map (instructor
+    id -> slot records) or else from an "unavailable_slots" list on the
+    instructor record. cohort_conflicts is the Schedule's cohort conflict mode.
+    """
+    schedule = Schedule(cohort_conflicts=cohort_conflicts)
+    unavailability = unavailability or {}
     
-    # Fetch classrooms
-    classroom_data = api.fetch_classrooms()
+    # Add classrooms
     for room in classroom_data:
         schedule.add_classroom(Classroom(
             id=room["id"],
@@ -551,8 +4172,7 @@ def build_schedule_from_api(api, semester=None, department=None):
             room_type=room["type"]
         ))
     
-    # Fetch instructors
-    instructor_data = api.fetch_instructors(department)
+    # Add instructors
     for instr in instructor_data:
         instructor = Instructor(
             id=instr["id"],
@@ -560,9 +4180,8 @@ def build_schedule_from_api(api, semester=None, department=None):
             is_part_time=instr.get("is_part_time", False)
         )
         
-        # Get instructor unavailability
-        unavail_data = api.get_instructor_unavailability(instr["id"])
-        for slot in unavail_data:
+        # Set instructor unavailability
+        for slot in unavailability.get(instr["id"], instr.get("unavailable_slots", [])):
             instructor.unavailable_slots.append((
                 slot["day"],
                 slot["start_hour"],
@@ -580,8 +4199,7 @@ def build_schedule_from_api(api, semester=None, department=None):
         
         schedule.add_instructor(instructor)
     
-    # Fetch courses
-    course_data = api.fetch_courses(semester, department)
+    # Add courses
     for course in course_data:
         schedule.add_course(Course(
             id=course["id"],
@@ -592,32 +4210,39 @@ def build_schedule_from_api(api, semester=None, department=None):
             classroom_id=course["classroom_id"],
             hours_per_week=course["hours_per_week"],
             student_count=course["student_count"],
-            is_online=course.get("is_online", False)
+            is_online=course.get("is_online", False),
+            department=course.get("department")
         ))
     
     return schedule
 
 
 # Usage Example with API integration
-def create_and_submit_schedule():
-    # Initialize API client
-    api = SchedulerAPI()
-    
-    # Build schedule from API data
-    schedule = build_schedule_from_api(api, semester="Spring2025", department="CS")
+def create_and_submit_schedule(cache_dir=".scheduler_cache", offline=False, export_format="hours", departments=None,
+                               cohort_conflicts="weighted"):
+    # Initialize API client; fetched data is cached on disk between runs
+    cache = ResponseCache(cache_dir, offline=offline) if cache_dir else None
+    api = SchedulerAPI(cache=cache)
     
-    # Generate the schedule
-    schedule.generate_schedule()
+    # Build schedule from API data; several departments are solved together so shared rooms
+    # and instructors are not double booked
+    if departments:
+        schedule = build_schedule_from_api(api, semester="Spring2025", departments=departments,
+                                           cohort_conflicts=cohort_conflicts)
+        schedule.solve_partitioned()
+    else:
+        schedule = build_schedule_from_api(api, semester="Spring2025", department="CS", cohort_conflicts=cohort_conflicts)
+        schedule.generate_schedule()
     
     # Print and validate the schedule
     schedule.print_schedule()
+    schedule.print_violations()
     is_valid = schedule.check_schedule_validity()
     print(f"\nSchedule is {'valid' if is_valid else 'invalid'}.")
     
-    # If valid, export to JSON and submit to API
+    # If valid, stream the JSON export straight to the API
     if is_valid:
-        schedule_json = schedule.export_schedule_json()
-        result = api.post_schedule(json.loads(schedule_json))
+        result = api.post_schedule_stream(schedule.iter_schedule_json(export_format))
         if result:
             print(f"Schedule successfully submitted to API. Schedule ID: {result.get('id')}")
         else:
@@ -659,6 +4284,7 @@ def create_sample_schedule_with_api():
     
     # Print and validate the schedule
     schedule.print_schedule()
+    schedule.print_violations()
     is_valid = schedule.check_schedule_validity()
     print(f"\nSchedule is {'valid' if is_valid else 'invalid'}.")
     
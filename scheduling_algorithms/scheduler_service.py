@@ -0,0 +1,595 @@
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from schedule_file import read_schedule, write_schedule
+from scheduler_api import (ResponseCache, Schedule, SchedulerAPI, build_schedule_from_api,
+                           build_schedule_from_data)
+
+JOB_KINDS = ("solve", "validate", "analyze", "resolve", "load", "save")
+EXPORT_FORMATS = ("hours", "sessions", "compact")
+PROGRESS_INTERVAL = 0.2  # Seconds between progress updates of a greedy solve
+COHORT_CONFLICTS = "weighted"  # Cohort conflict mode of the schedules the service builds (see Schedule)
+
+HTTP_REASONS = {200: "OK", 201: "Created", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed", 409: "Conflict", 411: "Length Required", 500: "Internal Server Error"}
+
+
+class ServiceError(Exception):
+    """A request the service rejects, with the HTTP status to answer with"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """A solve, validate, analyze, re-solve, load or save request for one schedule"""
+    def __init__(self, job_id, schedule_id, kind, params):
+        self.id = job_id
+        self.schedule_id = schedule_id
+        self.kind = kind
+        self.params = params
+        self.status = "queued"  # queued, running, done, failed or cancelled
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = threading.Event()  # Checked by worker threads between batches
+
+    def check_cancelled(self):
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "schedule_id": self.schedule_id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+
+class LoadedProblem:
+    """A schedule kept in memory between requests"""
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.lock = asyncio.Lock()  # Held by jobs that change the schedule, so they take turns
+        self.edit_lock = asyncio.Lock()  # Held while the schedule object is edited in place or streamed
+        self.loaded = time.time()
+
+
+class SchedulerService:
+    """Keeps schedules loaded per schedule id and runs jobs on them.
+
+    Jobs enter through an asyncio queue. Validation is answered on the event
+    loop straight away. Solves, re-solves and loads run in a thread pool on
+    their own copy of the problem, so they never hold up validation or other
+    schedules. Jobs that change a schedule (solve, resolve, load) take
+    turns per schedule id. A solve can be cancelled between courses
+    (greedy), search nodes (backtracking) or parts (partitioned), and a greedy
+    solve reports its progress; the stored schedule only changes when a job
+    finishes. A greedy solve with a "time_limit" param stops after that
+    many seconds and keeps the sessions placed so far. Load reads from the scheduling API, or from a binary
+    schedule file given as the "file" param; save writes one. Analyze runs
+    Schedule.analyze_feasibility in the thread pool without waiting for
+    solves, since it only reads the inputs.
+    """
+    def __init__(self, max_workers=2, max_finished_jobs=1000):
+        self.max_workers = max_workers
+        self.max_finished_jobs = max_finished_jobs
+        self.problems = {}  # schedule_id -> LoadedProblem
+        self.jobs = {}  # job_id -> Job
+        self._job_ids = itertools.count(1)
+        self._queue = None
+        self._executor = None
+        self._worker_slots = None
+        self._tasks = set()
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """Start the job dispatcher and the HTTP server; returns the bound (host, port)"""
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scheduler-job")
+        self._worker_slots = asyncio.Semaphore(self.max_workers)
+        self._spawn(self._dispatch())
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for job in self.jobs.values():
+            job.cancel_requested.set()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # Problems
+
+    def put_problem(self, schedule_id, schedule):
+        problem = self.problems.get(schedule_id)
+        if problem is None:
+            self.problems[schedule_id] = LoadedProblem(schedule)
+        else:
+            problem.schedule = schedule
+            problem.loaded = time.time()
+
+    def get_problem(self, schedule_id):
+        problem = self.problems.get(schedule_id)
+        if problem is None:
+            raise ServiceError(404, f"Unknown schedule: {schedule_id}")
+        return problem
+
+    def summary(self, schedule_id):
+        schedule = self.get_problem(schedule_id).schedule
+        return {
+            "schedule_id": schedule_id,
+            "courses": len(schedule.courses),
+            "instructors": len(schedule.instructors),
+            "classrooms": len(schedule.classrooms),
+            "sessions": sum(len(course.assigned_slots) for course in schedule.courses),
+            "unscheduled_hours": sum(schedule.get_unscheduled_hours(course) for course in schedule.courses),
+            "is_valid": schedule.check_schedule_validity(),
+            "error_count": schedule.validator.error_count
+        }
+
+    # Jobs
+
+    def submit(self, schedule_id, kind, params=None):
+        """Queue a job and return it"""
+        if kind not in JOB_KINDS:
+            raise ServiceError(400, f"Unknown job kind: {kind}")
+        if kind != "load":
+            self.get_problem(schedule_id)
+        job = Job(str(next(self._job_ids)), schedule_id, kind, params or {})
+        self.jobs[job.id] = job
+        self._forget_finished_jobs()
+        self._queue.put_nowait(job)
+        return job
+
+    def cancel(self, job_id):
+        job = self.get_job(job_id)
+        if job.status in ("queued", "running"):
+            job.cancel_requested.set()
+            if job.status == "queued":
+                self._finish(job, "cancelled")
+        return job
+
+    def get_job(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ServiceError(404, f"Unknown job: {job_id}")
+        return job
+
+    def _forget_finished_jobs(self):
+        finished = [job for job in self.jobs.values() if job.finished is not None]
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job.id]
+
+    def _finish(self, job, status, result=None, error=None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished = time.time()
+        if status == "done":
+            job.progress = 1.0
+
+    async def _dispatch(self):
+        while True:
+            job = await self._queue.get()
+            if job.status == "queued":
+                self._spawn(self._run_job(job))
+
+    async def _run_job(self, job):
+        try:
+            if job.kind == "validate":
+                job.status, job.started = "running", time.time()
+                self._finish(job, "done", self._validate(job))
+                return
+            if job.kind == "load":
+                # Build the new schedule before taking the lock, so reads keep working meanwhile
+                async with self._worker_slots:
+                    job.check_cancelled()
+                    job.status, job.started = "running", time.time()
+                    schedule = await self._in_worker(self._load, job)
+                problem = self.problems.get(job.schedule_id)
+                if problem is None:
+                    self.put_problem(job.schedule_id, schedule)
+                else:
+                    async with problem.lock:
+                        job.check_cancelled()
+                        self.put_problem(job.schedule_id, schedule)
+                self._finish(job, "done", self.summary(job.schedule_id))
+                return
+
+            problem = self.get_problem(job.schedule_id)
+            if job.kind == "analyze":
+                # Reads the inputs only, so no turn is needed, just no edits meanwhile
+                async with problem.edit_lock, self._worker_slots:
+                    job.check_cancelled()
+                    job.status, job.started = "running", time.time()
+                    result = await self._in_worker(problem.schedule.analyze_feasibility)
+                self._finish(job, "done", result)
+                return
+            async with problem.lock:
+                job.check_cancelled()
+                if job.kind == "resolve":
+                    async with self._worker_slots:
+                        job.check_cancelled()
+                        job.status, job.started = "running", time.time()
+                        # Repaired on a copy, so reads of the stored schedule go on meanwhile
+                        inputs, assignments = problem.schedule.to_problem(), problem.schedule.get_assignments()
+                        schedule, result = await self._in_worker(self._resolve, job, inputs, assignments)
+                    job.check_cancelled()
+                    problem.schedule = schedule
+                    self._finish(job, "done", result)
+                    return
+                if job.kind == "save":
+                    path = job.params.get("file")
+                    if not path:
+                        raise ServiceError(400, "A save job needs a file param")
+                    # No edits while the file is written
+                    async with problem.edit_lock, self._worker_slots:
+                        job.status, job.started = "running", time.time()
+                        await self._in_worker(write_schedule, problem.schedule, path)
+                    self._finish(job, "done", {"file": path})
+                    return
+                async with self._worker_slots:
+                    job.check_cancelled()
+                    job.status, job.started = "running", time.time()
+                    inputs = problem.schedule.to_problem()
+                    schedule, result = await self._in_worker(self._solve, job, inputs)
+                job.check_cancelled()
+                problem.schedule = schedule
+                self._finish(job, "done", result)
+        except JobCancelled:
+            self._finish(job, "cancelled")
+        except ServiceError as e:
+            self._finish(job, "failed", error=e.message)
+        except Exception as e:
+            self._finish(job, "failed", error=f"{type(e).__name__}: {e}")
+
+    async def _in_worker(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _validate(self, job):
+        schedule = self.get_problem(job.schedule_id).schedule
+        severity = job.params.get("severity")
+        return {
+            "is_valid": schedule.check_schedule_validity(),
+            "violations": [violation.to_dict() for violation in schedule.get_violations(severity)]
+        }
+
+    @staticmethod
+    def _resolve(job, inputs, assignments):
+        """Worker thread: apply the changes to a copy of the schedule and repair it"""
+        schedule = Schedule.from_problem(inputs)
+        schedule.load_assignments(assignments)
+        result = schedule.resolve_delta(changes_from_json(schedule, job.params.get("changes", {})),
+                                        release_neighbours=job.params.get("release_neighbours", False),
+                                        verbose=False)
+        result["is_valid"] = schedule.check_schedule_validity()
+        return schedule, result
+
+    @staticmethod
+    def _solve(job, inputs):
+        """Worker thread: solve a fresh copy of the problem"""
+        started = time.perf_counter()
+        schedule = Schedule.from_problem(inputs)
+        engine = job.params.get("engine", "greedy")
+        stop_reason = None
+        unplaced = []
+        if engine == "greedy":
+            # An anytime solve, so a "time_limit" param ends it early with the sessions placed so far
+            def report(progress):
+                job.progress = 0.9 * progress["courses_tried"] / max(1, progress["courses"])
+            
+            solved = schedule.solve_anytime(time_limit=job.params.get("time_limit"), cancel=job.cancel_requested,
+                                            progress=report, progress_interval=PROGRESS_INTERVAL, local_search=False)
+            job.check_cancelled()
+            stop_reason = solved["stop_reason"]
+            unplaced = solved["unplaced"]
+        elif engine == "backtracking":
+            schedule.solve_backtracking(node_limit=job.params.get("node_limit", 100000),
+                                        time_limit=job.params.get("time_limit"), cancel=job.cancel_requested,
+                                        verbose=False)
+            job.check_cancelled()
+        elif engine == "partitioned":
+            schedule.solve_partitioned(n_workers=job.params.get("workers"), cancel=job.cancel_requested,
+                                       verbose=False)
+            job.check_cancelled()
+        else:
+            raise ServiceError(400, f"Unknown scheduling engine: {engine}")
+
+        iterations = job.params.get("local_search_iterations", 0)
+        if iterations:
+            job.check_cancelled()
+            schedule.optimize_schedule(time_limit=None, max_iterations=iterations, seed=job.params.get("seed", 0))
+
+        return schedule, {
+            "engine": engine,
+            "seconds": time.perf_counter() - started,
+            "sessions": sum(len(course.assigned_slots) for course in schedule.courses),
+            "unscheduled_hours": sum(schedule.get_unscheduled_hours(course) for course in schedule.courses),
+            "total_penalty": schedule.total_penalty(),
+            "is_valid": schedule.check_schedule_validity(),
+            "stop_reason": stop_reason,
+            "unplaced": unplaced
+        }
+
+    @staticmethod
+    def _load(job):
+        """Worker thread: read a schedule file, or fetch every input from the scheduling API"""
+        params = job.params
+        if params.get("file"):
+            return read_schedule(params["file"])
+        cache = ResponseCache(params["cache_dir"]) if params.get("cache_dir") else None
+        api = SchedulerAPI(params.get("base_url"), cache=cache)
+        try:
+            return build_schedule_from_api(api, semester=params.get("semester"), department=params.get("department"),
+                                           cohort_conflicts=COHORT_CONFLICTS)
+        finally:
+            api.close()
+
+    # HTTP
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            try:
+                method, path, query, body = await self._read_request(reader)
+                status, payload = await self._route(method, path, query, body)
+            except ServiceError as e:
+                status, payload = e.status, {"error": e.message}
+            except Exception as e:
+                status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+            await self._write_response(writer, status, payload)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            raise ConnectionError("Empty request")
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise ServiceError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", ""):
+            raise ServiceError(411, "Send request bodies with a Content-Length")
+        length = int(headers.get("content-length", 0) or 0)
+        body = None
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except ValueError:
+                raise ServiceError(400, "Request body is not valid JSON")
+
+        url = urlsplit(target)
+        path = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return method.upper(), path, query, body
+
+    async def _route(self, method, path, query, body):
+        """Map a request to (status, JSON payload or iterable of byte chunks)"""
+        if path == ["health"] and method == "GET":
+            return 200, {"status": "ok", "schedules": len(self.problems), "jobs": len(self.jobs)}
+
+        if path[:1] == ["schedules"] and len(path) >= 2:
+            schedule_id = path[1]
+            rest = path[2:]
+            if not rest:
+                if method == "PUT":
+                    if not isinstance(body, dict):
+                        raise ServiceError(400, "Expected a JSON object with classrooms, instructors and courses")
+                    schedule = build_schedule_from_data(body.get("classrooms", []), body.get("instructors", []),
+                                                        body.get("courses", []), cohort_conflicts=COHORT_CONFLICTS)
+                    if schedule_id in self.problems:
+                        async with self.problems[schedule_id].lock:
+                            self.put_problem(schedule_id, schedule)
+                    else:
+                        self.put_problem(schedule_id, schedule)
+                    return 201, self.summary(schedule_id)
+                if method == "GET":
+                    return 200, self.summary(schedule_id)
+                if method == "DELETE":
+                    self.get_problem(schedule_id)
+                    del self.problems[schedule_id]
+                    return 200, {"schedule_id": schedule_id, "deleted": True}
+                raise ServiceError(405, f"{method} is not supported on a schedule")
+            if rest == ["export"] and method == "GET":
+                export_format = query.get("format", "hours")
+                if export_format not in EXPORT_FORMATS:
+                    raise ServiceError(400, f"Unknown export format: {export_format}")
+                return 200, self._export(self.get_problem(schedule_id), export_format)
+            if rest == ["jobs"] and method == "POST":
+                body = body or {}
+                job = self.submit(schedule_id, body.get("kind"), body.get("params"))
+                return 202, job.to_dict()
+
+        if path[:1] == ["jobs"] and len(path) == 2:
+            if method == "GET":
+                return 200, self.get_job(path[1]).to_dict()
+            if method == "DELETE":
+                return 200, self.cancel(path[1]).to_dict()
+
+        raise ServiceError(404, f"No route for {method} /{'/'.join(path)}")
+
+    @staticmethod
+    async def _export(problem, export_format):
+        # The timetable must not be edited in place while it is being streamed
+        async with problem.edit_lock:
+            for chunk in problem.schedule.iter_schedule_json(export_format):
+                yield chunk
+
+    @staticmethod
+    async def _write_response(writer, status, payload):
+        head = f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\nContent-Type: application/json\r\nConnection: close\r\n"
+        if isinstance(payload, dict):
+            data = json.dumps(payload).encode("utf-8")
+            writer.write(f"{head}Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+        else:
+            # Streamed export
+            writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode("latin-1"))
+            async for chunk in payload:
+                writer.write(f"{len(chunk):x}\r\n".encode("latin-1") + chunk + b"\r\n")
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def changes_from_json(schedule, changes):
+    """Turn a JSON change set into the form Schedule.resolve_delta takes.
+
+    JSON object keys are strings, so entity ids are matched against the
+    schedule's ids by their string form. Slot lists become tuples and new
+    entities use the API's record format.
+    """
+    def resolve_ids(updates, index):
+        by_text = {str(entity_id): entity_id for entity_id in index}
+        return {by_text.get(str(key), key): value for key, value in updates.items()}
+
+    def slot_tuples(updates):
+        for name in ("unavailable_slots", "preferred_slots"):
+            if name in updates:
+                updates[name] = [
+                    (slot["day"], slot["start_hour"], slot["end_hour"]) if isinstance(slot, dict) else tuple(slot)
+                    for slot in updates[name]
+                ]
+        return updates
+
+    result = {}
+    if "courses" in changes:
+        result["courses"] = resolve_ids(changes["courses"], schedule.courses_by_id)
+    if "instructors" in changes:
+        result["instructors"] = {
+            key: slot_tuples(dict(updates))
+            for key, updates in resolve_ids(changes["instructors"], schedule.instructors_by_id).items()
+        }
+    if "classrooms" in changes:
+        result["classrooms"] = resolve_ids(changes["classrooms"], schedule.classrooms_by_id)
+    if "remove_courses" in changes:
+        by_text = {str(course_id): course_id for course_id in schedule.courses_by_id}
+        result["remove_courses"] = [by_text.get(str(course_id), course_id) for course_id in changes["remove_courses"]]
+
+    # New entities use the same records as build_schedule_from_data
+    new = build_schedule_from_data(changes.get("add_classrooms", []), changes.get("add_instructors", []),
+                                   changes.get("add_courses", []))
+    if new.classrooms:
+        result["add_classrooms"] = new.classrooms
+    if new.instructors:
+        result["add_instructors"] = new.instructors
+    if new.courses:
+        result["add_courses"] = new.courses
+    return result
+
+
+class ServiceThread:
+    """Run a SchedulerService on its own event loop in a background thread, e.g. for tests"""
+    def __init__(self, service=None, host="127.0.0.1", port=0):
+        self.service = service or SchedulerService()
+        self.host = host
+        self.port = port
+        self.url = None
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        started = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                host, port = self._loop.run_until_complete(self.service.start(self.host, self.port))
+                self.url = f"http://{host}:{port}"
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                return
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.service.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="scheduler-service", daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the scheduling service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2, help="solves and loads run at the same time")
+    args = parser.parse_args(argv)
+
+    async def serve():
+        service = SchedulerService(max_workers=args.workers)
+        host, port = await service.start(args.host, args.port)
+        print(f"Scheduler service listening on http://{host}:{port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await service.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
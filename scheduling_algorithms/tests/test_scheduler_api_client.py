@@ -0,0 +1,186 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+from scheduler_api import ResponseCache, SchedulerAPI
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.stub.answer(self)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+        self.server.stub.answer(self)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer:
+    """Local API stand-in: answers each path with its scripted responses in turn (the last one repeats)"""
+    def __init__(self):
+        self.routes = {}  # path -> [(status, JSON body, headers)]
+        self.requests = []  # (method, path, query, headers) of every request received
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self._server.stub = self
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+
+    def route(self, path, *responses):
+        self.routes[path] = [response if isinstance(response, tuple) else (200, response, {})
+                             for response in responses]
+
+    def requests_to(self, path, method="GET"):
+        return [request for request in self.requests if request[:2] == (method, path)]
+
+    def answer(self, handler):
+        url = urlsplit(handler.path)
+        with self._lock:
+            self.requests.append((handler.command, url.path,
+                                  {key: values[-1] for key, values in parse_qs(url.query).items()},
+                                  dict(handler.headers)))
+            responses = self.routes.get(url.path, [(404, {"error": "not found"}, {})])
+            status, body, headers = responses[0] if len(responses) == 1 else responses.pop(0)
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+def make_api(stub, cache=None, **kwargs):
+    kwargs.setdefault("max_retries", 2)
+    return SchedulerAPI(stub.url, backoff_factor=0, cache=cache, **kwargs)
+
+
+ROOMS = [{"id": 1, "name": "L201", "capacity": 40, "type": "lecture"}]
+
+
+def test_bulk_unavailability_is_fetched_in_chunks(stub):
+    slot = {"day": "Monday", "start_hour": 8, "end_hour": 10}
+    stub.route("/instructors/unavailability", {"1": [slot], "2": []}, {"3": [slot]})
+    api = make_api(stub, bulk_chunk_size=2)
+
+    assert api.fetch_unavailability_bulk([1, 2, 3]) == {1: [slot], 2: [], 3: [slot]}
+    assert [request[2]["ids"] for request in stub.requests] == ["1,2", "3"]
+
+
+@pytest.mark.parametrize("status", [400, 404, 405, 501])
+def test_rejected_bulk_endpoint_falls_back_to_per_instructor_requests(stub, status):
+    stub.route("/instructors/unavailability", (status, {"error": "no bulk"}, {}))
+    for instructor_id in (1, 2):
+        stub.route(f"/instructors/{instructor_id}/unavailability",
+                   [{"day": "Friday", "start_hour": 8 + instructor_id, "end_hour": 12}])
+    api = make_api(stub)
+
+    result = api.fetch_unavailability_bulk([1, 2])
+    assert result == {instructor_id: [{"day": "Friday", "start_hour": 8 + instructor_id, "end_hour": 12}]
+                      for instructor_id in (1, 2)}
+    assert api.bulk_unavailability_supported is False
+
+    # The decision is remembered: the bulk endpoint is not asked again
+    api.fetch_unavailability_bulk([1])
+    assert len(stub.requests_to("/instructors/unavailability")) == 1
+    assert len(stub.requests_to("/instructors/1/unavailability")) == 2
+
+
+def test_bulk_server_error_does_not_fall_back(stub):
+    stub.route("/instructors/unavailability", (503, None, {}))
+    api = make_api(stub)
+
+    assert api.fetch_unavailability_bulk([1, 2]) == {1: [], 2: []}
+    assert api.bulk_unavailability_supported is True
+    assert len(stub.requests_to("/instructors/unavailability")) == 3  # The request and its 2 retries
+    assert not stub.requests_to("/instructors/1/unavailability")
+
+
+def test_get_is_retried_but_post_is_not(stub):
+    stub.route("/classrooms", (503, None, {}), ROOMS)
+    stub.route("/schedules", (503, None, {}), {"id": 7})
+    api = make_api(stub)
+
+    assert api.fetch_classrooms() == ROOMS
+    assert len(stub.requests_to("/classrooms")) == 2
+
+    assert api.post_schedule([{"course_id": 1}]) is None
+    assert len(stub.requests_to("/schedules", "POST")) == 1
+
+
+def test_fresh_cache_entries_are_served_without_a_request(stub, tmp_path):
+    stub.route("/classrooms", ROOMS)
+    api = make_api(stub, cache=ResponseCache(str(tmp_path), ttl=3600))
+
+    assert api.fetch_classrooms() == ROOMS
+    assert api.fetch_classrooms() == ROOMS
+    assert len(stub.requests) == 1
+
+
+def test_expired_entries_are_revalidated(stub, tmp_path):
+    headers = {"ETag": '"v1"', "Last-Modified": "Mon, 05 Oct 2026 10:00:00 GMT"}
+    stub.route("/classrooms", (200, ROOMS, headers), (304, None, headers))
+    api = make_api(stub, cache=ResponseCache(str(tmp_path), ttl=0))
+
+    assert api.fetch_classrooms() == ROOMS
+    assert api.fetch_classrooms() == ROOMS
+    revalidation = stub.requests[1][3]
+    assert revalidation["If-None-Match"] == '"v1"'
+    assert revalidation["If-Modified-Since"] == headers["Last-Modified"]
+
+
+@pytest.mark.parametrize("status", [500, 503])
+def test_stale_entries_are_served_after_server_errors(stub, tmp_path, status):
+    stub.route("/classrooms", ROOMS, (status, None, {}))
+    api = make_api(stub, cache=ResponseCache(str(tmp_path), ttl=0))
+
+    assert api.fetch_classrooms() == ROOMS
+    assert api.fetch_classrooms() == ROOMS
+
+
+def test_stale_entries_are_served_when_the_server_is_gone(stub, tmp_path):
+    stub.route("/classrooms", ROOMS)
+    cache = ResponseCache(str(tmp_path), ttl=0)
+    assert make_api(stub, cache=cache).fetch_classrooms() == ROOMS
+    stub.close()
+
+    assert make_api(stub, cache=cache, max_retries=0).fetch_classrooms() == ROOMS
+
+
+def test_client_errors_are_not_covered_by_stale_entries(stub, tmp_path):
+    stub.route("/classrooms", ROOMS, (404, {"error": "gone"}, {}))
+    api = make_api(stub, cache=ResponseCache(str(tmp_path), ttl=0))
+
+    assert api.fetch_classrooms() == ROOMS
+    with pytest.raises(requests.HTTPError):
+        api._get_json("/classrooms")
+    assert api.fetch_classrooms() == []
+
+
+def test_offline_mode_never_sends_requests(stub, tmp_path):
+    stub.route("/classrooms", ROOMS)
+    assert make_api(stub, cache=ResponseCache(str(tmp_path))).fetch_classrooms() == ROOMS
+
+    api = make_api(stub, cache=ResponseCache(str(tmp_path), offline=True))
+    assert api.fetch_classrooms() == ROOMS
+    assert api.fetch_instructors() == []
+    assert len(stub.requests) == 1
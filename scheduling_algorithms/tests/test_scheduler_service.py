@@ -0,0 +1,170 @@
+import http.client
+import json
+import time
+from urllib.parse import urlsplit
+
+import pytest
+
+from scheduler_service import SchedulerService, ServiceThread
+
+PROBLEM = {
+    "classrooms": [
+        {"id": 1, "name": "L201", "capacity": 40, "type": "lecture"},
+        {"id": 2, "name": "CL101", "capacity": 25, "type": "computer_lab"}
+    ],
+    "instructors": [
+        {"id": 1, "name": "Smith", "is_part_time": False,
+         "unavailable_slots": [{"day": "Monday", "start_hour": 8, "end_hour": 12}]},
+        {"id": 2, "name": "Johnson", "is_part_time": False, "unavailable_slots": []}
+    ],
+    "courses": [
+        {"id": 1, "name": "Data Structures", "section": "A", "major": "CS", "instructor_id": 1,
+         "classroom_id": 1, "hours_per_week": 3, "student_count": 35},
+        {"id": 2, "name": "Computer Lab Basics", "section": "A", "major": "CS", "instructor_id": 2,
+         "classroom_id": 2, "hours_per_week": 4, "student_count": 20},
+        {"id": 3, "name": "Algorithms", "section": "B", "major": "CS", "instructor_id": 1,
+         "classroom_id": 1, "hours_per_week": 2, "student_count": 30}
+    ]
+}
+
+
+@pytest.fixture(scope="module")
+def service():
+    with ServiceThread(SchedulerService(max_workers=2)) as thread:
+        yield thread
+
+
+def request(service, method, path, body=None):
+    """Send one request; returns (status, headers, decoded JSON body)"""
+    url = urlsplit(service.url)
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    try:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        connection.request(method, path, body=data, headers=headers)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def wait_for_job(service, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        status, _, job = request(service, "GET", f"/jobs/{job_id}")
+        assert status == 200
+        if job["status"] not in ("queued", "running"):
+            return job
+        assert time.time() < deadline, f"Job {job_id} still {job['status']}"
+        time.sleep(0.02)
+
+
+def put_problem(service, schedule_id):
+    status, _, summary = request(service, "PUT", f"/schedules/{schedule_id}", PROBLEM)
+    assert status == 201
+    return summary
+
+
+def test_health(service):
+    status, _, payload = request(service, "GET", "/health")
+    assert status == 200
+    assert payload["status"] == "ok"
+
+
+def test_unknown_routes_and_ids_are_404(service):
+    assert request(service, "GET", "/nope")[0] == 404
+    assert request(service, "GET", "/schedules/missing")[0] == 404
+    assert request(service, "GET", "/jobs/missing")[0] == 404
+    assert request(service, "POST", "/schedules/missing/jobs", {"kind": "solve"})[0] == 404
+
+
+def test_put_and_get_schedule(service):
+    summary = put_problem(service, "put")
+    assert (summary["courses"], summary["instructors"], summary["classrooms"]) == (3, 2, 2)
+    assert summary["sessions"] == 0
+    assert summary["unscheduled_hours"] == 9
+
+    status, _, payload = request(service, "GET", "/schedules/put")
+    assert status == 200
+    assert payload == summary
+
+    assert request(service, "PATCH", "/schedules/put")[0] == 405
+    assert request(service, "PUT", "/schedules/put", ["not", "an", "object"])[0] == 400
+
+
+def test_solve_job_replaces_stored_schedule(service):
+    put_problem(service, "solve")
+    status, _, job = request(service, "POST", "/schedules/solve/jobs", {"kind": "solve"})
+    assert status == 202
+    assert job["status"] in ("queued", "running", "done")
+
+    job = wait_for_job(service, job["id"])
+    assert job["status"] == "done"
+    assert job["progress"] == 1.0
+    assert job["result"]["unscheduled_hours"] == 0
+
+    _, _, summary = request(service, "GET", "/schedules/solve")
+    assert summary["unscheduled_hours"] == 0
+    assert summary["sessions"] == job["result"]["sessions"]
+
+
+def test_failed_and_invalid_jobs(service):
+    put_problem(service, "bad")
+    assert request(service, "POST", "/schedules/bad/jobs", {"kind": "nope"})[0] == 400
+
+    _, _, job = request(service, "POST", "/schedules/bad/jobs", {"kind": "solve", "params": {"engine": "nope"}})
+    job = wait_for_job(service, job["id"])
+    assert job["status"] == "failed"
+    assert "nope" in job["error"]
+    assert request(service, "GET", "/schedules/bad")[2]["sessions"] == 0
+
+
+def test_cancelled_job_leaves_schedule_unchanged(service):
+    put_problem(service, "cancel")
+    # The second solve waits for the first one's turn on the schedule
+    _, _, first = request(service, "POST", "/schedules/cancel/jobs",
+                          {"kind": "solve", "params": {"local_search_iterations": 3000}})
+    _, _, second = request(service, "POST", "/schedules/cancel/jobs",
+                           {"kind": "solve", "params": {"engine": "backtracking"}})
+    status, _, cancelled = request(service, "DELETE", f"/jobs/{second['id']}")
+    assert status == 200
+    assert cancelled["status"] == "cancelled"
+
+    assert wait_for_job(service, second["id"])["status"] == "cancelled"
+    first = wait_for_job(service, first["id"])
+    assert first["status"] == "done"
+    assert request(service, "GET", "/schedules/cancel")[2]["sessions"] == first["result"]["sessions"]
+
+
+def test_validate_and_resolve_jobs(service):
+    put_problem(service, "resolve")
+    wait_for_job(service, request(service, "POST", "/schedules/resolve/jobs", {"kind": "solve"})[2]["id"])
+
+    _, _, job = request(service, "POST", "/schedules/resolve/jobs", {"kind": "validate"})
+    job = wait_for_job(service, job["id"])
+    assert job["status"] == "done"
+    assert job["result"]["is_valid"]
+
+    changes = {"courses": {"3": {"hours_per_week": 4}}}
+    _, _, job = request(service, "POST", "/schedules/resolve/jobs", {"kind": "resolve", "params": {"changes": changes}})
+    job = wait_for_job(service, job["id"])
+    assert job["status"] == "done"
+    assert job["result"]["unscheduled_hours"] == 0
+    assert request(service, "GET", "/schedules/resolve")[2]["unscheduled_hours"] == 0
+
+
+def test_export_is_streamed(service):
+    put_problem(service, "export")
+    wait_for_job(service, request(service, "POST", "/schedules/export/jobs", {"kind": "solve"})[2]["id"])
+
+    status, headers, payload = request(service, "GET", "/schedules/export/export?format=sessions")
+    assert status == 200
+    assert headers["Transfer-Encoding"] == "chunked"
+    assert sum(session["end_hour"] - session["start_hour"] for session in payload) == 9
+
+    status, _, payload = request(service, "GET", "/schedules/export/export")
+    assert status == 200
+    assert len(payload) == 9
+    assert {entry["course_id"] for entry in payload} == {1, 2, 3}
+
+    assert request(service, "GET", "/schedules/export/export?format=bad")[0] == 400